@@ -0,0 +1,249 @@
+#!/usr/bin/python3
+"""
+An ASGI entry point for the game, as an alternative to gunicorn + main:app.
+Run it with any ASGI server, for example:
+
+    uvicorn asgiapp:app --host 0.0.0.0 --port 8080
+
+The point is that one process can serve lots of slow clients at once.   The
+event loop does all of the network I/O (reading requests, sending
+responses), so a client on a slow connection doesn't hold a thread.
+
+The read heavy routes (/game, /choose and /drop) have async versions here.
+They do their CPU work (page data, templates) on the event loop and await
+their database calls, which run on a small, bounded thread pool.   Everything
+else, including /api/*, is the normal Flask view, also run on that pool, so
+blocking SQLite and file writes never happen on the event loop.
+
+Both versions use the same Flask app, so templates, sessions (the signed
+cookie), before/after request hooks and error handling are unchanged.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import io
+import os
+import sys
+
+from flask import request
+
+import compresslib
+import fromcavestocars
+from fromcavestocars import app as flaskapp
+
+# The threads that run database / file work (and the non-async views).
+# This bounds how much blocking work happens at once, not how many clients
+# can be connected.
+BLOCKINGTHREADS = int(os.environ.get("FCTC_ASGI_THREADS", 8))
+BLOCKING_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+        max_workers=BLOCKINGTHREADS, thread_name_prefix="fctc-blocking")
+
+
+async def run_blocking(func, *args, **kwargs):
+    """Run func on the blocking pool and wait for it without blocking the
+    event loop.   The Flask request / app context goes along with it."""
+    ctx = contextvars.copy_context()
+    call = functools.partial(ctx.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(BLOCKING_EXECUTOR, call)
+
+
+####### ASYNC VIEWS #######
+
+# These mirror the views of the same name in fromcavestocars.py.
+
+async def game():
+    current_item, exploration_path, page_data = fromcavestocars._game_page_data()
+
+    item_to_add = request.args.get('item_to_add', '', type=str)
+    new_items = await run_blocking(fromcavestocars._learn_game_items, page_data, item_to_add)
+
+    availableitems = await run_blocking(fromcavestocars.get_known_items)
+
+    # Look the user up now, so rendering (which asks for it) doesn't block
+    await run_blocking(fromcavestocars.get_current_user)
+
+    return fromcavestocars._render_game(current_item, exploration_path, page_data, new_items, availableitems)
+
+
+async def choose():
+    fromcavestocars.init_stats_if_needed()
+    current_user = await run_blocking(fromcavestocars.get_current_user)
+    # Work out the progress now (it's kept in g), so the page's personal()
+    # parts don't block
+    await run_blocking(fromcavestocars._choose_progress)
+    return fromcavestocars.render_cached_template("choose.html", possibleitems=fromcavestocars.POSSIBLEITEMSTATS.values(),
+                                                  current_user=current_user)
+
+
+async def handle_drop():
+    # This only touches in-memory state, so there is nothing to wait for.
+    return fromcavestocars.handle_drop()
+
+
+# Flask endpoint name -> async view
+ASYNC_VIEWS = {
+    'game': game,
+    'choose': choose,
+    'handle_drop': handle_drop,
+}
+
+
+####### ASGI <-> FLASK PLUMBING #######
+
+def _build_environ(scope, body):
+    """Make a WSGI environ out of an ASGI http scope."""
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'):
+        environ['REMOTE_ADDR'] = scope['client'][0]
+
+    for rawname, rawvalue in scope.get('headers', []):
+        name = rawname.decode('latin-1').upper().replace('-', '_')
+        value = rawvalue.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+            continue
+        if name == 'CONTENT_LENGTH':
+            continue
+        key = 'HTTP_' + name
+        if key in environ:
+            value = environ[key] + ',' + value
+        environ[key] = value
+
+    return environ
+
+
+def _async_view_for(environ):
+    """Returns the async view for this request, or None to use Flask's."""
+    adapter = flaskapp.url_map.bind_to_environ(environ)
+    try:
+        endpoint, _args = adapter.match()
+    except Exception:
+        # 404s, 405s, redirects, etc. are Flask's job
+        return None
+    return ASYNC_VIEWS.get(endpoint)
+
+
+async def _dispatch_async(environ, view):
+    """Like Flask's wsgi_app / full_dispatch_request, but awaits the view.
+    Returns (status, headers, body)."""
+    ctx = flaskapp.request_context(environ)
+    error = None
+    try:
+        ctx.push()
+        try:
+            try:
+                rv = flaskapp.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = flaskapp.handle_user_exception(e)
+            response = flaskapp.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = flaskapp.handle_exception(e)
+
+        # Render / collect the body while the context is still around
+        body = response.get_data()
+        return response.status_code, response.headers.to_wsgi_list(), body
+    finally:
+        # This has to happen in the same context as the push.   It only hands
+        # the database session's connection back to the pool.
+        ctx.pop(error)
+
+
+def _dispatch_wsgi(environ):
+    """Run the normal Flask app.   Returns (status, headers, body)."""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    result = flaskapp.wsgi_app(environ, start_response)
+    try:
+        body = b''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], body
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
+
+
+async def _send_response(send, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                # Same startup as gunicorn: sync data, load ITEMDB, etc.
+                await run_blocking(__import__, 'main')
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            BLOCKING_EXECUTOR.shutdown(wait=True)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI application."""
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        raise NotImplementedError(f"Unsupported ASGI scope type {scope['type']}")
+
+    body = await _read_body(receive)
+    environ = _build_environ(scope, body)
+
+    view = _async_view_for(environ)
+    if view is not None:
+        status, headers, body = await _dispatch_async(environ, view)
+    else:
+        status, headers, body = await run_blocking(_dispatch_wsgi, environ)
+
+    # The WSGI side has compressed its responses already (CompressionMiddleware
+    # sets Content-Encoding, so they're skipped here).
+    headers, body = compresslib.compress_response(environ.get('HTTP_ACCEPT_ENCODING'), status, headers, body)
+
+    await _send_response(send, status, headers, body)
@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+""" This library builds the page styles and scripts in assets/ into static
+bundles that browsers can cache forever.
+
+Each file in assets/ (e.g. game.css) is minified and written to static/dist/
+with a hash of its contents in the name (game.3f2a1b9c04.css), along with
+gzip (and, if the brotli module is installed, brotli) compressed copies.
+A manifest maps the plain name to the built one, and templates refer to
+bundles through it:
+
+    <link rel="stylesheet" href="{{ asset_url('game.css') }}">
+
+Since the name changes whenever the contents do, the web app can tell
+browsers to cache the bundles as immutable.
+
+The web app builds these at startup.   To build by hand:
+
+    python assetlib.py [--srcdir assets] [--distdir static/dist]
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PROJECTDIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULTSRCDIR = os.path.join(PROJECTDIR, "assets")
+DEFAULTDISTDIR = os.path.join(PROJECTDIR, "static", "dist")
+MANIFESTFILE = "manifest.json"
+
+# Comments and strings, which the CSS minifier must find before it touches
+# anything else.   (A comment may have a quote in it and vice versa.)
+CSSTOKENS = re.compile(r'(/\*.*?\*/)|("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.DOTALL)
+
+
+def _minify_css_code(code):
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r'\s*([{};,])\s*', r'\1', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(text):
+    """Remove comments and extra whitespace, leaving strings alone."""
+    out = []
+    code = []
+    pos = 0
+    for match in CSSTOKENS.finditer(text):
+        code.append(text[pos:match.start()])
+        if match.group(2):
+            out.append(_minify_css_code(''.join(code)))
+            out.append(match.group(2))
+            code = []
+        else:
+            # a comment is whitespace as far as CSS is concerned
+            code.append(' ')
+        pos = match.end()
+    code.append(text[pos:])
+    out.append(_minify_css_code(''.join(code)))
+    return ''.join(out).strip()
+
+
+def minify_js(text):
+    """A deliberately cautious JavaScript minifier: it drops indentation,
+    blank lines and lines that are only a // comment.   Anything cleverer
+    needs a real parser (regexes, template strings, etc.)."""
+    lines = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('//'):
+            continue
+        lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+def _write_if_missing(filename, data):
+    if os.path.exists(filename):
+        return False
+    tmpfile = filename + ".tmp"
+    with open(tmpfile, 'wb') as f:
+        f.write(data)
+    os.replace(tmpfile, filename)
+    return True
+
+
+def build_asset(srcfile, distdir):
+    """Minify, fingerprint and compress one file.   Returns the name of the
+    built file (relative to distdir)."""
+    base, ext = os.path.splitext(os.path.basename(srcfile))
+    with open(srcfile, encoding='utf-8') as f:
+        text = f.read()
+
+    minify = MINIFIERS.get(ext)
+    data = (minify(text) if minify else text).encode('utf-8')
+
+    builtname = f"{base}.{hashlib.sha256(data).hexdigest()[:10]}{ext}"
+    builtfile = os.path.join(distdir, builtname)
+
+    # The name depends on the contents, so if it's there it's up to date.
+    _write_if_missing(builtfile, data)
+    # mtime=0 so the same input always gives the same .gz
+    _write_if_missing(builtfile + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        _write_if_missing(builtfile + ".br", brotli.compress(data))
+
+    return builtname
+
+
+def build_assets(srcdir=DEFAULTSRCDIR, distdir=DEFAULTDISTDIR):
+    """Build everything in srcdir and write the manifest.   Returns the
+    manifest: {'game.css': 'game.3f2a1b9c04.css', ...}."""
+    os.makedirs(distdir, exist_ok=True)
+    manifest = {}
+    for filename in sorted(os.listdir(srcdir)):
+        srcfile = os.path.join(srcdir, filename)
+        if os.path.isfile(srcfile):
+            manifest[filename] = build_asset(srcfile, distdir)
+
+    manifestfile = os.path.join(distdir, MANIFESTFILE)
+    tmpfile = manifestfile + ".tmp"
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, manifestfile)
+    return manifest
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Minify and fingerprint the From Caves To Cars styles and scripts.",
+        usage="%(prog)s [options]"
+    )
+    parser.add_argument("--srcdir", type=str, default=DEFAULTSRCDIR, help="Where the source files are")
+    parser.add_argument("--distdir", type=str, default=DEFAULTDISTDIR, help="Where to put the bundles")
+    args = parser.parse_args()
+
+    manifest = build_assets(args.srcdir, args.distdir)
+    for name, builtname in manifest.items():
+        srcsize = os.path.getsize(os.path.join(args.srcdir, name))
+        builtsize = os.path.getsize(os.path.join(args.distdir, builtname))
+        gzsize = os.path.getsize(os.path.join(args.distdir, builtname + ".gz"))
+        print(f"{name} -> {builtname}: {srcsize} -> {builtsize} bytes ({gzsize} gzipped)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,437 @@
+// The game content (#game-content, see game_content.html) is swapped
+// in place when moving between an item and its sub-items, so these
+// scripts and styles only load once.   initGamePage() sets up whatever
+// content is showing.
+
+// Drops are sent to the server in batches: a couple of seconds after
+// the last one, when every box is full, or when leaving the page.
+let pendingDrops = [];
+let pendingBoxMap = null;
+let flushTimer = null;
+
+function flushDrops(leaving) {
+  clearTimeout(flushTimer);
+  if (pendingDrops.length === 0) {
+    return;
+  }
+  const body = JSON.stringify({ box_map: pendingBoxMap, drops: pendingDrops });
+  pendingDrops = [];
+
+  if (leaving) {
+    navigator.sendBeacon('/drop_batch', new Blob([body], { type: 'application/json' }));
+    return;
+  }
+  fetch('/drop_batch', {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: body
+  }).then(response => response.json()).then(result => {
+    // Shouldn't happen, since the page checked these already
+    for (const [boxId, status] of Object.entries(result.results || {})) {
+      if (status === 'rejected') {
+        console.log(`Drop on box ${boxId} was rejected`);
+      }
+    }
+  });
+}
+
+function queueDrop(drop) {
+  pendingBoxMap = document.getElementById('hidden-data').dataset.boxMap;
+  pendingDrops.push(drop);
+  clearTimeout(flushTimer);
+  const boxes = document.querySelectorAll('.group-container .box');
+  const allFilled = [...boxes].every(box => box.classList.contains('correct-drop'));
+  if (allFilled) {
+    flushDrops(false);
+  } else {
+    flushTimer = setTimeout(() => flushDrops(false), 2000);
+  }
+}
+
+window.addEventListener('pagehide', () => flushDrops(true));
+
+function initBoxesAndIcons() {
+  let isDragging = false;
+  let draggedName = null;
+  let draggedSrc = null;
+
+  const column2 = document.getElementById('column2');
+  const icons = document.querySelectorAll('.icon');
+  const boxes = document.querySelectorAll('.group-container .box');
+
+  const box_fills = document.getElementById('hidden-data').getAttribute('box-fills');
+
+  // Do the problem drop box
+  const problemDropBox = document.getElementById('problem-drop-box');
+
+  if (problemDropBox) {
+    problemDropBox.addEventListener('dragover', (e) => {
+      e.preventDefault();
+      problemDropBox.classList.add('drop-hover');
+    });
+
+    problemDropBox.addEventListener('dragleave', () => {
+      problemDropBox.classList.remove('drop-hover');
+    });
+
+    problemDropBox.addEventListener('drop', (e) => {
+      e.preventDefault();
+      problemDropBox.classList.remove('drop-hover');
+
+      const data = e.dataTransfer.getData('text/plain');
+      console.log('Dropped data:', data);
+      const dragged = document.querySelector(`[data-name="${data}"]`);
+      console.log('Dropped:', dragged);
+
+      if (draggedName) {
+        // Redirect to problem page with itemName
+        const currentUrl = window.location.href;
+        window.location.href = `/problem?item_name=${encodeURIComponent(draggedName)}&referrer=${encodeURIComponent(currentUrl)}`;
+      }
+      else {
+        const currentUrl = window.location.href;
+        window.location.href = `/problem?item_name=${encodeURIComponent(document.getElementById('hidden-data').dataset.itemName)}&referrer=${encodeURIComponent(currentUrl)}`;
+      }
+
+    });
+  }
+
+  // Do the boxes / container groups, etc.
+
+  for (const [boxId, iconName] of Object.entries(box_fills)) {
+    const box = document.getElementById(boxId);
+    const icon = document.querySelector(`.draggable-icon[data-name="${iconName}"]`);
+    if (box && icon) {
+      const src = icon.getAttribute('src');
+
+      // Build image element just like on correct drop
+      const img = document.createElement('img');
+      img.src = src;
+      img.classList.add('icon', 'dropped', 'green-tint');
+      img.draggable = false;
+      box.appendChild(img);
+
+      box.classList.add('correct-drop');
+
+      // Remove arrow if present
+      const arrowLink = box.querySelector('.arrow-link');
+      if (arrowLink) {
+        arrowLink.remove();
+      }
+    }
+  }
+
+  // Image icon logic
+  icons.forEach(icon => {
+    icon.addEventListener('mouseenter', () => {
+      if (!isDragging) {
+        column2.textContent = icon.dataset.description || '';
+        column2.classList.add('highlighted');
+      }
+    });
+
+    icon.addEventListener('mouseleave', () => {
+      if (!isDragging) {
+        column2.classList.remove('highlighted');
+      }
+    });
+
+    icon.addEventListener('click', () => {
+      column2.textContent = icon.dataset.description || '';
+      column2.classList.add('highlighted');
+    });
+
+    icon.addEventListener('dragstart', e => {
+      isDragging = true;
+      draggedName = icon.dataset.name;
+      draggedSrc = icon.src;
+
+      column2.textContent = icon.dataset.description || '';
+      column2.classList.add('highlighted');
+
+      e.dataTransfer.setData('name', draggedName);
+      e.dataTransfer.setData('src', draggedSrc);
+    });
+
+    icon.addEventListener('dragend', () => {
+      isDragging = false;
+      column2.classList.remove('highlighted');
+    });
+  });
+
+  // Box logic
+  boxes.forEach(box => {
+    const acceptedName = box.dataset.accepts;
+    const boxDescription = box.dataset.description;
+
+    box.addEventListener('mouseenter', () => {
+      column2.textContent = boxDescription || '';
+      column2.classList.add('highlighted');
+    });
+
+    box.addEventListener('mouseleave', () => {
+      column2.classList.remove('highlighted');
+    });
+
+    box.addEventListener('click', () => {
+      column2.textContent = boxDescription || '';
+      column2.classList.add('highlighted');
+    });
+
+    box.addEventListener('dragover', e => e.preventDefault());
+
+    box.addEventListener('dragenter', e => {
+      e.preventDefault();
+      if (draggedName === acceptedName) {
+        box.classList.add('highlight-valid');
+      } else {
+        box.classList.add('highlight-invalid', 'show-x');
+      }
+    });
+
+    box.addEventListener('dragleave', () => {
+      box.classList.remove('highlight-valid', 'highlight-invalid', 'show-x');
+    });
+
+    box.addEventListener('drop', async e => {
+      e.preventDefault();
+      box.classList.remove('highlight-valid', 'highlight-invalid', 'show-x');
+
+      const name = draggedName;
+      const src = draggedSrc;
+      const boxId = box.id;
+
+      // The page knows what each box accepts, so check here and send
+      // the drop to the server later, with any others (see queueDrop).
+      const arrowLink = box.querySelector('.arrow-link');
+
+      let hasarrow = false;
+      if (arrowLink) {
+          hasarrow = true;
+      }
+
+      if ((name === acceptedName) &&
+        (( hasarrow === false && box.children.length === 0)||(
+          hasarrow && box.children.length === 1))) {
+        const img = document.createElement('img');
+        img.src = src;
+        img.classList.add('icon', 'dropped','green-tint');
+        img.draggable = false;
+        box.appendChild(img);
+        box.classList.add('correct-drop');
+        // Remove arrow if present
+        if (arrowLink) {
+          arrowLink.remove();
+        }
+        queueDrop({ box_id: boxId, name: name, image_url: src });
+      } else {
+        box.classList.add('shake');
+        setTimeout(() => box.classList.remove('shake'), 500);
+      }
+    });
+  });
+
+  const groupLabels = document.querySelectorAll('.group-label');
+  const column1 = document.getElementById('column1'); // or use a specific class
+
+  groupLabels.forEach(label => {
+    const desc = label.dataset.description;
+
+    label.addEventListener('mouseenter', () => {
+      column1.textContent = desc;
+      column1.classList.add('highlighted');
+    });
+
+    label.addEventListener('mouseleave', () => {
+      column1.classList.remove('highlighted');
+      // keep the text
+    });
+
+    label.addEventListener('click', () => {
+      column1.textContent = desc;
+      column1.classList.add('highlighted');
+    });
+  });
+}
+
+function initGroupLabels() {
+  document.querySelectorAll('.group-label').forEach(label => {
+    label.addEventListener('click', () => {
+      const group = label.closest('.group');
+      const boxes = group.querySelectorAll('.box');
+
+      const allCorrect = boxes.length === 0 || [...boxes].every(box =>
+        box.classList.contains('correct-drop') && box.children.length > 0
+      );
+
+      if (allCorrect) {
+        label.classList.add('completed');
+        group.classList.add('completed');
+      }
+    });
+  });
+}
+
+function checkAllGroupsCompleted() {
+  const groupLabels = document.querySelectorAll('.group-label');
+  return Array.from(groupLabels).every(label => label.classList.contains('completed'));
+}
+
+function showCompletionOverlay() {
+  const overlay = document.getElementById('completion-overlay');
+  overlay.classList.remove('hidden');
+  overlay.classList.add('show');
+}
+
+function initCompletionOverlay() {
+  document.querySelectorAll('.group-label').forEach(label => {
+    label.addEventListener('click', () => {
+      if (checkAllGroupsCompleted()) {
+        showCompletionOverlay();
+      }
+    });
+  });
+}
+
+function initColumnReveal() {
+  const skip = document.getElementById('hidden-data').dataset.skipMakeText === 'true';
+  const cols = Array.from(document.querySelectorAll('#overlay-columns .column'));
+
+  function typeColumn(el, text, delay=10) {
+    return new Promise(resolve => {
+      let i = 0;
+      const timer = setInterval(() => {
+        el.textContent += text.charAt(i++);
+        if (i >= text.length) {
+          clearInterval(timer);
+          resolve();
+        }
+      }, delay);
+    });
+  }
+
+  let _columnsRevealed = false;
+
+  async function revealColumns() {
+    if (_columnsRevealed) return;
+    _columnsRevealed = true;
+
+    if (skip) {
+      // show immediately
+      cols.forEach(c => c.textContent = c.dataset.text);
+      return;
+    }
+
+    // 1) Pre-measure and lock in heights
+    cols.forEach(c => {
+      // Temporarily fill with full text
+      c.textContent = c.dataset.text;
+      // Measure the height required
+      const h = c.scrollHeight;
+      // Clear back out
+      c.textContent = '';
+      // Enforce the measured height so it won’t resize
+      c.style.minHeight = h + 'px';
+    });
+
+    // 2) Animate each in sequence
+    for (const col of cols) {
+      await typeColumn(col, col.dataset.text);
+    }
+  }
+
+  // When overlay is shown, kick off the animation
+  const observer = new MutationObserver((list) => {
+    for (const m of list) {
+      if (m.attributeName === 'class') {
+        const ov = m.target;
+        if (ov.classList.contains('show')) {
+          revealColumns();
+          observer.disconnect();
+        }
+      }
+    }
+  });
+
+  const overlay = document.getElementById('completion-overlay');
+  observer.observe(overlay, { attributes: true });
+}
+
+function initIntroOverlay() {
+  const intro = document.getElementById('intro-overlay');
+  if (!intro) return;
+
+  document.getElementById('intro-continue').addEventListener('click', () => {
+    intro.style.display = 'none';
+    // now user can interact with the page as normal, and the completion-overlay
+    // remains hidden until it’s time to show it.
+  });
+}
+
+// Moving between items: fetch just the new content and swap it in,
+// keeping the browser history in step.
+function fragmentUrl(url) {
+  const fragment = new URL(url, window.location.href);
+  fragment.searchParams.set('fragment', '1');
+  return fragment;
+}
+
+async function showGamePage(url, push) {
+  flushDrops(false);
+  let html;
+  try {
+    const response = await fetch(fragmentUrl(url), { credentials: 'same-origin' });
+    if (!response.ok) {
+      throw new Error(`HTTP ${response.status}`);
+    }
+    html = await response.text();
+  } catch (err) {
+    // Fall back to loading the whole page
+    window.location.href = url;
+    return;
+  }
+
+  document.getElementById('game-content').innerHTML = html;
+  if (push) {
+    history.pushState({ gameUrl: url }, '', url);
+  }
+  window.scrollTo(0, 0);
+  initGamePage();
+}
+
+window.addEventListener('popstate', e => {
+  if (e.state && e.state.gameUrl) {
+    showGamePage(e.state.gameUrl, false);
+  }
+});
+
+function initGameLinks() {
+  document.querySelectorAll('#game-content a').forEach(link => {
+    const url = new URL(link.href, window.location.href);
+    if (url.origin !== window.location.origin || url.pathname !== '/game') {
+      return;
+    }
+    link.addEventListener('click', e => {
+      // let ctrl-click etc. open a new tab as usual
+      if (e.button !== 0 || e.ctrlKey || e.metaKey || e.shiftKey) {
+        return;
+      }
+      e.preventDefault();
+      showGamePage(link.href, true);
+    });
+  });
+}
+
+function initGamePage() {
+  initBoxesAndIcons();
+  initGroupLabels();
+  initCompletionOverlay();
+  initColumnReveal();
+  initIntroOverlay();
+  initGameLinks();
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  history.replaceState({ gameUrl: window.location.href }, '', window.location.href);
+  initGamePage();
+});
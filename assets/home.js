@@ -0,0 +1,51 @@
+// Show title after short delay
+window.addEventListener('load', () => {
+  setTimeout(() => {
+    document.getElementById('gameTitle').classList.add('visible');
+  }, 800);
+});
+
+// Modal control
+function openModal() {
+  document.getElementById('modalBackdrop').style.display = 'flex';
+}
+function closeModal() {
+  document.getElementById('modalBackdrop').style.display = 'none';
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+  const form = document.getElementById('suggestion-form');
+  const toast = document.getElementById('toast');
+
+  form.addEventListener('submit', async (e) => {
+    e.preventDefault();
+    const data = new FormData(form);
+
+    try {
+      const resp = await fetch('/suggestion', {
+        method: 'POST',
+        body: data
+      });
+      if (!resp.ok) throw new Error('Network response was not OK');
+
+      // Close modal:
+      closeModal();
+
+      // Show toast:
+      toast.classList.remove('hidden');
+      setTimeout(() => toast.classList.add('show'), 10);
+
+      // Hide after 3 seconds:
+      setTimeout(() => {
+        toast.classList.remove('show');
+        setTimeout(() => toast.classList.add('hidden'), 500);
+      }, 2000);
+
+      // Clear textarea:
+      form.querySelector('textarea').value = '';
+    } catch (err) {
+      alert('Failed to send suggestion.  Please try again.');
+      console.error(err);
+    }
+  });
+});
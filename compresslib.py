@@ -0,0 +1,237 @@
+""" This library compresses web responses with gzip (or brotli, if the brotli
+module is installed and the browser takes it).
+
+CompressionMiddleware wraps a WSGI app:
+
+    app.wsgi_app = CompressionMiddleware(app.wsgi_app)
+
+It only compresses text (HTML, CSS, JavaScript, JSON, SVG), and leaves alone
+responses that are already compressed (like the precompressed bundles from
+assetlib.py), images, and anything smaller than minsize, where compression
+costs more than it saves.
+
+The body is compressed as the app produces it, so a large streamed page
+starts going out before it's finished.   If the app doesn't say how big the
+response is, up to minsize bytes are held back to find out whether it's big
+enough to bother.
+"""
+
+import threading
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Worth compressing.   Everything else (images, fonts, zips) is either
+# already compressed or not something we send.
+COMPRESSIBLETYPES = {
+    'application/javascript',
+    'application/json',
+    'application/xml',
+    'image/svg+xml',
+}
+
+DEFAULTMINSIZE = 1024
+
+
+def parse_accept_encoding(header):
+    """The encodings the browser takes, as {name: q}."""
+    accepted = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    return accepted
+
+
+def choose_encoding(header):
+    """'br', 'gzip' or None.   br is preferred when we can do it, since it's
+    smaller for text."""
+    accepted = parse_accept_encoding(header)
+    anyq = accepted.get('*', 0.0)
+    if brotli is not None and accepted.get('br', anyq) > 0:
+        return 'br'
+    if accepted.get('gzip', anyq) > 0:
+        return 'gzip'
+    return None
+
+
+def is_compressible(content_type):
+    mimetype = (content_type or '').split(';', 1)[0].strip().lower()
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLETYPES
+
+
+class Compressor:
+    """Compresses a stream of chunks.   compress() returns whatever output is
+    ready (maybe b''), finish() returns the rest."""
+
+    def __init__(self, encoding, level=6):
+        if encoding == 'br':
+            self._brotli = brotli.Compressor(quality=min(level, 11))
+            self._zlib = None
+        else:
+            # wbits 31 = a gzip header and trailer
+            self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self._brotli = None
+
+    def compress(self, data):
+        if self._zlib is not None:
+            return self._zlib.compress(data)
+        return self._brotli.process(data)
+
+    def finish(self):
+        if self._zlib is not None:
+            return self._zlib.flush()
+        return self._brotli.finish()
+
+
+def _get_header(headers, name):
+    name = name.lower()
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _add_vary(headers):
+    vary = _get_header(headers, 'Vary')
+    if vary is None:
+        headers.append(('Vary', 'Accept-Encoding'))
+    elif 'accept-encoding' not in vary.lower():
+        headers[:] = [(k, v) for k, v in headers if k.lower() != 'vary']
+        headers.append(('Vary', vary + ', Accept-Encoding'))
+
+
+def compressed_headers(headers, encoding):
+    """The headers for the compressed version of a response."""
+    headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+    headers.append(('Content-Encoding', encoding))
+    _add_vary(headers)
+    # It's a different set of bytes now, so the ETag can only be weak.
+    etag = _get_header(headers, 'ETag')
+    if etag is not None and not etag.startswith('W/'):
+        headers = [(k, v) for k, v in headers if k.lower() != 'etag']
+        headers.append(('ETag', 'W/' + etag))
+    return headers
+
+
+def should_compress(status, headers, minsize):
+    """Is this response worth compressing?   (If it has no Content-Length
+    we can't tell yet, so it might be.)"""
+    length = _get_header(headers, 'Content-Length')
+    return (status == 200
+            and _get_header(headers, 'Content-Encoding') is None
+            and is_compressible(_get_header(headers, 'Content-Type'))
+            and (length is None or int(length) >= minsize))
+
+
+def compress_response(acceptencoding, status, headers, body, minsize=DEFAULTMINSIZE, level=6):
+    """For servers that have the whole body at once (asgiapp.py).   Returns
+    (headers, body), compressed if it's worth it."""
+    encoding = choose_encoding(acceptencoding)
+    if encoding is None or len(body) < minsize or not should_compress(status, headers, minsize):
+        return headers, body
+    compressor = Compressor(encoding, level)
+    return compressed_headers(headers, encoding), compressor.compress(body) + compressor.finish()
+
+
+def _chain(held, rest):
+    yield b''.join(held)
+    yield from rest
+
+
+class CompressionMiddleware:
+
+    def __init__(self, app, minsize=DEFAULTMINSIZE, level=6):
+        self.app = app
+        self.minsize = minsize
+        self.level = level
+        self._lock = threading.Lock()
+        self._stats = {'compressed': 0, 'skipped': 0, 'bytesin': 0, 'bytesout': 0}
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    def __call__(self, environ, start_response):
+        encoding = choose_encoding(environ.get('HTTP_ACCEPT_ENCODING'))
+        if encoding is None or environ.get('REQUEST_METHOD') == 'HEAD':
+            return self.app(environ, start_response)
+
+        started = {}
+
+        def capture(status, headers, exc_info=None):
+            started['status'] = status
+            started['headers'] = headers
+            started['exc_info'] = exc_info
+            # Nothing we run uses write(), so I don't support it.
+            return None
+
+        appiter = self.app(environ, capture)
+
+        if not started:
+            # The app is going to call start_response while we iterate.
+            # That's legal, but rare enough that I don't compress it.
+            return appiter
+
+        status, headers = started['status'], started['headers']
+        if not should_compress(int(status.split(' ', 1)[0]), headers, self.minsize):
+            self._count(skipped=1)
+            start_response(status, headers, started['exc_info'])
+            return appiter
+
+        return self._compress(appiter, status, headers, started['exc_info'],
+                              encoding, start_response)
+
+    def _compress(self, appiter, status, headers, exc_info, encoding, start_response):
+        """A generator that holds back the first minsize bytes (in case it's
+        too small after all), then compresses the rest as it comes."""
+        try:
+            held = []
+            heldsize = 0
+            chunks = iter(appiter)
+            for chunk in chunks:
+                held.append(chunk)
+                heldsize += len(chunk)
+                if heldsize >= self.minsize:
+                    break
+            else:
+                # The whole thing was small
+                self._count(skipped=1)
+                start_response(status, headers, exc_info)
+                if held:
+                    yield b''.join(held)
+                return
+
+            start_response(status, compressed_headers(headers, encoding), exc_info)
+            compressor = Compressor(encoding, self.level)
+            bytesin = bytesout = 0
+            for chunk in _chain(held, chunks):
+                bytesin += len(chunk)
+                out = compressor.compress(chunk)
+                if out:
+                    bytesout += len(out)
+                    yield out
+            out = compressor.finish()
+            bytesout += len(out)
+            yield out
+            self._count(compressed=1, bytesin=bytesin, bytesout=bytesout)
+        finally:
+            if hasattr(appiter, 'close'):
+                appiter.close()
@@ -0,0 +1,177 @@
+""" This library keeps a copy of a directory tree up to date, using a manifest
+of content hashes so that only files which are missing or have changed are
+copied.   It is used to install exampledatafiles/ into the project root at
+startup (see main.py).
+
+The manifest records, for each file in the source tree, its sha256 and the
+size / mtime it had when that hash was taken.   A file is only re-hashed when
+its size or mtime changes, so an unchanged tree costs one stat per file.
+
+Files are only copied when the *source* changes.   If the copy in the
+destination was modified locally (e.g. problems.log was appended to), it is
+left alone until the source changes again.   A file that is in the
+destination but not the manifest (an install from before manifests) is
+kept if it's newer than the source, and replaced otherwise.   Files under a copy_once prefix
+(databases, etc.) are never overwritten once they exist.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import time
+
+DEFAULTMANIFESTFILE = ".data_manifest.json"
+
+HASHCHUNKSIZE = 1024 * 1024
+
+
+def file_digest(filename):
+    """Return the sha256 hex digest of a file's contents."""
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASHCHUNKSIZE), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _stat_key(filename):
+    st = os.stat(filename)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _load_manifest(manifestfile):
+    if not os.path.exists(manifestfile):
+        return {'files': {}}
+    try:
+        with open(manifestfile) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Warning: ignoring unreadable manifest {manifestfile}: {e}")
+        return {'files': {}}
+    if 'files' not in manifest:
+        manifest['files'] = {}
+    return manifest
+
+
+def _write_manifest(manifestfile, manifest):
+    # write then rename so a crash never leaves a half written manifest
+    tmpfile = manifestfile + ".tmp"
+    with open(tmpfile, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmpfile, manifestfile)
+
+
+def _install_file(src, dst, link):
+    """Put src at dst, by hard link if asked (and possible), else by copying.
+    Returns 'linked' or 'copied'."""
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmpdst = dst + ".synctmp"
+    if os.path.lexists(tmpdst):
+        os.remove(tmpdst)
+
+    if link:
+        try:
+            os.link(src, tmpdst)
+            os.replace(tmpdst, dst)
+            return 'linked'
+        except OSError:
+            # e.g. different filesystems.   Fall back to a copy.
+            pass
+
+    shutil.copy2(src, tmpdst)
+    os.replace(tmpdst, dst)
+    return 'copied'
+
+
+def _has_prefix(relpath, prefixes):
+    return any(relpath == p.rstrip('/') or relpath.startswith(p) for p in prefixes)
+
+
+def sync_tree(src_root, dst_root, manifestfile=None, link_prefixes=(),
+        skip_prefixes=(), copy_once_prefixes=()):
+    """Make dst_root contain everything in src_root, copying only what is
+    missing or changed.   Paths are relative to src_root and use '/'.
+
+    link_prefixes: files under these are hard linked instead of copied.
+        Only use this for files nobody writes to (e.g. images).
+    skip_prefixes: files under these are not installed at all.
+    copy_once_prefixes: files under these are only installed if missing.
+
+    Returns a dict with counts of what happened and the time it took."""
+
+    start = time.monotonic()
+
+    if manifestfile is None:
+        manifestfile = os.path.join(dst_root, DEFAULTMANIFESTFILE)
+
+    manifest = _load_manifest(manifestfile)
+    oldentries = manifest['files']
+    newentries = {}
+
+    stats = {'copied': 0, 'linked': 0, 'unchanged': 0, 'kept': 0,
+             'skipped': 0, 'hashed': 0}
+
+    for root, dirs, files in os.walk(src_root):
+        # deterministic order makes the output easier to read / diff
+        dirs.sort()
+        for filename in sorted(files):
+            src = os.path.join(root, filename)
+            relpath = os.path.relpath(src, src_root).replace(os.sep, '/')
+
+            if _has_prefix(relpath, skip_prefixes):
+                stats['skipped'] += 1
+                continue
+
+            dst = os.path.join(dst_root, relpath)
+            entry = oldentries.get(relpath)
+            srcstat = _stat_key(src)
+
+            # only hash when the file looks different from last time
+            if entry and entry.get('stat') == srcstat:
+                digest = entry['sha256']
+            else:
+                digest = file_digest(src)
+                stats['hashed'] += 1
+
+            newentries[relpath] = {'sha256': digest, 'stat': srcstat}
+
+            if os.path.exists(dst):
+                if entry and entry['sha256'] == digest:
+                    # the source hasn't changed since we installed it
+                    stats['unchanged'] += 1
+                    continue
+
+                if _has_prefix(relpath, copy_once_prefixes):
+                    stats['kept'] += 1
+                    continue
+
+                if entry is None:
+                    # I've never recorded this one (e.g. it was copied before
+                    # manifests existed, by the old .data_copied install).
+                    # If it differs and was changed after the source it
+                    # holds local changes, so keep it.   Otherwise it's just
+                    # an old copy, and gets replaced like any other.
+                    stats['hashed'] += 1
+                    if file_digest(dst) == digest:
+                        stats['unchanged'] += 1
+                        continue
+                    if os.stat(dst).st_mtime_ns > srcstat[1]:
+                        stats['kept'] += 1
+                        continue
+
+            link = _has_prefix(relpath, link_prefixes)
+            stats[_install_file(src, dst, link)] += 1
+
+    manifest['files'] = newentries
+    _write_manifest(manifestfile, manifest)
+
+    stats['seconds'] = time.monotonic() - start
+    return stats
+
+
+def format_stats(stats):
+    return (f"{stats['copied']} copied, {stats['linked']} linked, "
+            f"{stats['unchanged']} unchanged, {stats['kept']} kept local, "
+            f"{stats['skipped']} skipped ({stats['hashed']} hashed) "
+            f"in {stats['seconds']:.2f}s")
@@ -39,21 +39,45 @@ class Describer:
         get an image of the item.  The item is passed in as a string.
         """
 
-        querystring = f"""Please provide a description of how the following item would appear in nature to a primitive human.   Do not describe potential uses for this.  Use the present tense and do not use the name in the description.  Your description should be about {DESCRIPTIONLENGTH} words.   The item is {item}"""
-
         # Get the description from OpenAI
         if self.oaiq:
-            desc = self.oaiq.do_query(querystring)
-            if 'sorry' in desc.lower():
-                desc = f"Unfortunately, the model refused to describe: {item}"
-                #raise ValueError(f"describe_item could not get a description of {item}.")
+            self._set_item_description(item, self.oaiq.do_query(self._item_query(item)))
+
+
+    async def describe_item_async(self, item, limiter=None):
+        """ describe_item, but it can run alongside other queries (see 
+        OpenAIQuery.do_query_async)."""
+
+        if self.oaiq:
+            self._set_item_description(item, await self.oaiq.do_query_async(self._item_query(item), limiter=limiter))
 
-            self.itemdb.items[item].description = desc
+
+    def _item_query(self, item):
+        return f"""Please provide a description of how the following item would appear in nature to a primitive human.   Do not describe potential uses for this.  Use the present tense and do not use the name in the description.  Your description should be about {DESCRIPTIONLENGTH} words.   The item is {item}"""
+
+
+    def _set_item_description(self, item, desc):
+        if 'sorry' in desc.lower():
+            desc = f"Unfortunately, the model refused to describe: {item}"
+            #raise ValueError(f"describe_item could not get a description of {item}.")
+
+        self.itemdb.items[item].description = desc
 
 
     def describe_step(self, item, stepinfo):
         """ Describes a step involved in making an item."""
 
+        # Get the description from OpenAI
+        if self.oaiq:
+            self._set_step_description(stepinfo, self.oaiq.do_query(self._step_query(item, stepinfo)))
+
+
+    async def describe_step_async(self, item, stepinfo, limiter=None):
+        if self.oaiq:
+            self._set_step_description(stepinfo, await self.oaiq.do_query_async(self._step_query(item, stepinfo), limiter=limiter))
+
+
+    def _step_query(self, item, stepinfo):
         # this doesn't need the itemdb.   It manipulates stepinfo directly
 
         # Now I will get the description of the step
@@ -64,14 +88,14 @@ class Describer:
             querystring += f"  The raw materials used are {join_with_quotes_and_commas(stepinfo['raw_materials'])}.  "
         textlength = DESCRIPTIONLENGTH + (len(stepinfo['tools'])+len(stepinfo['raw_materials']))*DESCRIPTIONPERITEMLENGTH
         querystring += f"""Use the present tense and do not use the word {item} in the description.  Your description should be about {textlength} words."""
+        return querystring
 
-        # Get the description from OpenAI
-        if self.oaiq:
-            desc = self.oaiq.do_query(querystring)
-            if 'sorry' in desc.lower():
-                desc = f"Unfortunately, the model refused to describe step {stepinfo}"
-                #raise ValueError(f"describe_step could not get a description of {item} step {stepinfo}.")
 
-            # Just stick this right into the stepinfo dictionary we were given
-            stepinfo['description'] = desc
+    def _set_step_description(self, stepinfo, desc):
+        if 'sorry' in desc.lower():
+            desc = f"Unfortunately, the model refused to describe step {stepinfo}"
+            #raise ValueError(f"describe_step could not get a description of {item} step {stepinfo}.")
+
+        # Just stick this right into the stepinfo dictionary we were given
+        stepinfo['description'] = desc
 
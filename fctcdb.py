@@ -4,6 +4,7 @@ these is an object with a set of properties.  The database itself is an object
 that contains theste and also has methods to query properties, save / load, 
 etc.'''
 
+import hashlib
 import json
 
 
@@ -107,6 +108,9 @@ class ItemDB:
         # I'm going to assume that callers will access this dictionary directly
         self.items = {}
         self.dbfile = dbfile
+        # A hash of the file as last loaded / saved.   Anything cached from
+        # the database can use this to tell when it has changed.
+        self.version = None
         if dbfile:
             if exists(dbfile): # from os.path
                 self.load()
@@ -128,19 +132,26 @@ class ItemDB:
         '''This saves the database to a file.  The file is a json file.  The 
         filename is the same as the database name.  The file is saved in the 
         current directory.'''
+        data = json.dumps(self.items, indent=4, cls=CustomEncoder)
         with open(self.dbfile, 'w') as f:
-            json.dump(self.items, f, indent=4, cls=CustomEncoder)
+            f.write(data)
+        self._set_version(data.encode('utf-8'))
 
     def load(self):
         '''This loads the database from a file.  The file is a json file.  The 
         filename is the same as the database name.  The file is saved in the 
         current directory.'''
-        with open(self.dbfile, 'r') as f:
-            loadeddata = json.load(f)
-            # I need to do this because this is how I can convert the dicts
-            # (which JSON understands) back into objects (which the code 
-            # expects)
-            self.items = recursive_deserialize(loadeddata)
+        with open(self.dbfile, 'rb') as f:
+            data = f.read()
+        loadeddata = json.loads(data)
+        # I need to do this because this is how I can convert the dicts
+        # (which JSON understands) back into objects (which the code 
+        # expects)
+        self.items = recursive_deserialize(loadeddata)
+        self._set_version(data)
+
+    def _set_version(self, data):
+        self.version = hashlib.sha256(data).hexdigest()[:16]
 
     def _prevent_infinite_recursion_helper(self, itemname, seen):
         if itemname not in seen:
@@ -33,14 +33,81 @@ prioritize 1 and 2 first.
 """
 
 import os
+import gc
+import json
+import hashlib
 import subprocess
 
 # This is read only for this program because we're just reading things in.
 # I will need to store user state (possibly), but it goes elsewhere.
+#
+# Request threads share these, so they're never changed in place.   ITEMDB is
+# loaded before the workers start and not changed after that.
+# POSSIBLEITEMSTATS is built (once, under ITEMDBLOCK) in full before it's set,
+# so a request that reads it never sees half of it.
+#
+# The image corrections from /problem don't change ITEMDB at all.   They go in
+# OVERLAY (see overlaylib.py), which every worker reads, and are folded into
+# itemdb.json on deploy.
 import fctcdb
+import startuplib
+import sharedstatelib
+import overlaylib
+import threading
 ITEMDB = None
+READINESS = None         # readinesslib.ReadinessIndex over ITEMDB
 POSSIBLEITEMSTATS = {}   # What the user could possibly make.   Only picks ones
                          # that are user requested.   Contains stats
+ITEMDBLOCK = threading.Lock()   # held while building POSSIBLEITEMSTATS
+OVERLAY = overlaylib.ImageOverlay(os.environ.get('FCTC_IMAGE_OVERLAY', 'image_overlay.jsonl'))
+
+def item_images(item_name):
+    """An item's images, with the one people picked on /problem first."""
+    names = getattr(IMAGEREADS, 'names', None)
+    if names is not None:
+        names.add(item_name)
+    return OVERLAY.apply(item_name, getattr(ITEMDB.items[item_name], 'image', []))
+
+def catalog_version():
+    """Changes whenever ITEMDB does.   Anything cached from it has this in
+    its key."""
+    return ITEMDB.version
+
+# Anything cached that shows item images also remembers which items' images
+# it read and their corrections (see ImageReads), and is only rebuilt when
+# one of those changes, not whenever anyone picks any image on /problem.
+IMAGEREADS = threading.local()
+
+class ImageReads:
+    """Collects the items whose images are read in the body of a with
+    statement.   After it, names is a sorted tuple of them and links their
+    corrections as they were at the start (to check with images_unchanged).
+    They also count as read by any ImageReads outside this one."""
+
+    def __enter__(self):
+        OVERLAY.refresh()
+        self._preferences = OVERLAY.preferences()
+        self._outer = getattr(IMAGEREADS, 'names', None)
+        self._read = IMAGEREADS.names = set()
+        return self
+
+    def __exit__(self, exctype, exc, tb):
+        IMAGEREADS.names = self._outer
+        if self._outer is not None:
+            self._outer.update(self._read)
+        self.names = tuple(sorted(self._read))
+        self.links = OVERLAY.links(self.names, self._preferences)
+        return False
+
+def images_unchanged(names, links):
+    """Whether the corrections for names are still links (from ImageReads).
+    If they are, they're counted as read."""
+    if OVERLAY.links(names) != links:
+        return False
+    outer = getattr(IMAGEREADS, 'names', None)
+    if outer is not None:
+        outer.update(names)
+    return True
 
 def init_stats_if_needed():
 
@@ -48,26 +115,37 @@ def init_stats_if_needed():
         return item.user_requested
 
     global POSSIBLEITEMSTATS
-    POSSIBLEITEMSTATS = {}
-    possibleitems = ITEMDB.filter_items(_get_user_requested)
-    for item in possibleitems:
-        iteminfo = ITEMDB.get_item_count(item)
+    # This only depends on the items and their steps, which don't change, so
+    # I only need to build it once.   prepare_shared_state() builds it before
+    # forking.
+    if POSSIBLEITEMSTATS:
+        return
+    with ITEMDBLOCK:
+        if POSSIBLEITEMSTATS:
+            # another thread beat us to it
+            return
+        itemdb = ITEMDB
+        stats = {}
+        possibleitems = itemdb.filter_items(_get_user_requested)
+        for item in possibleitems:
+            iteminfo = itemdb.get_item_count(item)
 
-        # get a count of these...
-        uniqueitems = iteminfo['uniquetools']+iteminfo['uniqueraw_materials']
-        totalitems = iteminfo['totaltools']+iteminfo['totalraw_materials']
+            # get a count of these...
+            uniqueitems = iteminfo['uniquetools']+iteminfo['uniqueraw_materials']
+            totalitems = iteminfo['totaltools']+iteminfo['totalraw_materials']
 
-        thisitem = {'label': item, 'url': url_for('game', item_name=item, exploration_path=item, item_to_add=''), 'uniqueitems': uniqueitems, 'totalitems': totalitems}
-        POSSIBLEITEMSTATS[item] = thisitem
+            thisitem = {'label': item, 'url': url_for('game', item_name=item, exploration_path=item, item_to_add=''), 'uniqueitems': uniqueitems, 'totalitems': totalitems}
+            stats[item] = thisitem
+        # Only now is it complete, so only now can others see it
+        POSSIBLEITEMSTATS = stats
 
 
 
 
-# This is keyed by the session ID, and contains the user state.
-# thw structure is:
-# {'state': the state for the boxes.   This is a dict keyed session info, which
-# is then a dict of the boxes
-userstatedict = {}
+# The boxes each user / guest has filled in, on each item they've started.
+# This is keyed by the user id or guest id.   Request threads share it, so
+# it's a locked store (see sharedstatelib.py) rather than a plain dict.
+USERSTATE = sharedstatelib.UserStateStore()
 
 
 from random import choice # to pick a random item
@@ -75,12 +153,26 @@ from random import choice # to pick a random item
 
 ####### COMMON FLASK SETUP #######
 
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, g
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, login_user, current_user, logout_user, login_required, UserMixin
-from flask_dance.contrib.google import make_google_blueprint, google
 import secrets
+import passwordhashlib
+import ratelimitlib
+import problemreportlib
+import knownitemslib
+import readinesslib
+import assetlib
+import progresswriterlib
+import compresslib
+import mimetypes
+import time
+import collections
+from contextlib import contextmanager
+from sqlalchemy import text, select, insert, delete, update, case, cast, literal, or_, String
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.exc import IntegrityError
 
 app = Flask(__name__)
 
@@ -92,16 +184,48 @@ app.secret_key = os.getenv("SECRET_KEY", secrets.token_hex(32))
 ####### USER AUTHENTICATION #######
 
 # --- Database setup ---
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///fctc.db'
+# FCTC_DATABASE_URI is for the tests, which use a throwaway database
+app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("FCTC_DATABASE_URI", 'sqlite:///fctc.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-USERDB = SQLAlchemy(app)
+# Objects stay loaded after a commit.   A request commits, then carries on
+# rendering with the same user / rows, and they'd all be reloaded otherwise.
+USERDB = SQLAlchemy(app, session_options={'expire_on_commit': False})
+
+# --- Progress writes ---
+# Writes of what users know go through one writer thread per process (see
+# progresswriterlib.py), which commits whatever arrives within a couple of
+# milliseconds together.   Reads go through USERDB as usual.   WAL mode lets
+# them carry on while the writer writes.
+with app.app_context():
+    progresswriterlib.enable_wal(USERDB.engine)
+    PROGRESSWRITER = progresswriterlib.WriteQueue(
+        progresswriterlib.create_writer_engine(USERDB.engine.url),
+        coalesce=float(os.getenv("FCTC_WRITE_COALESCE_MS", 2)) / 1000)
+
+# --- Password hashing ---
+# Hashing is slow on purpose, so it runs on its own small pool of threads
+# rather than in whichever request thread asked for it.   If that pool is
+# backed up, register / login get a quick 503 instead of piling up.
+PASSWORDHASHER = passwordhashlib.HashPool(
+        workers=int(os.getenv("FCTC_HASH_WORKERS", 2)),
+        maxqueue=int(os.getenv("FCTC_HASH_QUEUE", 16)))
+
+@app.errorhandler(passwordhashlib.HashPoolBusy)
+def password_hashing_busy(e):
+    return "The server is busy right now.   Please try again in a moment.", 503, {'Retry-After': '1'}
 
 # --- Login manager ---
 login_manager = LoginManager(app)
 login_manager.login_view = 'register'
 
 
+# What finalize_login has moved from guests to users, for /metrics.
+LOGINMIGRATIONSTATS = {'migrations': 0, 'rows_moved': 0, 'duplicates_deleted': 0}
+LOGINMIGRATIONLOCK = threading.Lock()
+
 def finalize_login(user):
+    """Log the user in and move anything they did as a guest over to them.
+    Returns how many item rows moved and how many were duplicates."""
 
     # First log them in
     login_user(user)
@@ -111,58 +235,158 @@ def finalize_login(user):
     # if we weren't a guest user, return.   Otherwise migrate data over
     guest_id = session.get('guest_id')
     if not guest_id:
-        return
+        return {'rows_moved': 0, 'duplicates_deleted': 0}
 
     session.pop('guest_id', None)
 
-    # 2) Get the set of item names the user already has
-    existing_names = { item.name for item in user.known_items.all() }
-
-    # 3) Query all items belonging to the guest
-    guest_items = Item.query.filter_by(guest_id=guest_id).all()
-
-    for gi in guest_items:
-        if gi.name in existing_names:
-            # 4a) Duplicate — just delete the guest record
-            USERDB.session.delete(gi)
-        else:
-            # 4b) New to the user — migrate it
-            gi.user_id = user.id
-            gi.guest_id = None
-
-    # 5) Commit all deletes/updates in one transaction
-    USERDB.session.commit()
-
-    if guest_id in userstatedict:
-        # copy the user's state over (what boxes are filled)...
-        userstatedict[user.id] = userstatedict.pop(guest_id)
+    # 2) Get the bitsets of what the user and the guest already know.
+    # (This has to happen before the rows move, in case either one still
+    # needs to be built from its rows.)
+    userowner = f"user:{user.id}"
+    guestowner = f"guest:{guest_id}"
+    userbits = _get_owner_bits(userowner)
+    guestbits = _get_owner_bits(guestowner)
+
+    def migrate(connection):
+        # 3) Move the guest's known item rows over in two statements, rather
+        # than loading them and changing them one at a time.
+        # 3a) Duplicates (the user knows them already) are just deleted...
+        useritems = select(KnownItem.item_id).where(KnownItem.owner == userowner)
+        duplicates = connection.execute(
+            delete(KnownItem).where(KnownItem.owner == guestowner, KnownItem.item_id.in_(useritems))).rowcount
+        # 3b) ...and the rest now belong to the user.
+        moved = connection.execute(
+            update(KnownItem).where(KnownItem.owner == guestowner).values(owner=userowner)).rowcount
+
+        # 4) ...and the bitsets are just or'ed together
+        connection.execute(delete(KnownItemBits).where(KnownItemBits.owner == guestowner))
+        return moved, duplicates, _merge_owner_bits(connection, userowner, userbits | guestbits)
+
+    # 5) All of that is one transaction, on the writer thread
+    moved, duplicates, bits = PROGRESSWRITER.write(migrate)
+    g.known_bit_rows = {}
+    g.known_bits = (userowner, bits)
+
+    # merge the guest's state (what boxes are filled) into the user's.
+    # Where both have started an item, the guest's fills win since they are
+    # the most recent.
+    USERSTATE.move(guest_id, user.id)
+
+    with LOGINMIGRATIONLOCK:
+        LOGINMIGRATIONSTATS['migrations'] += 1
+        LOGINMIGRATIONSTATS['rows_moved'] += moved
+        LOGINMIGRATIONSTATS['duplicates_deleted'] += duplicates
+    return {'rows_moved': moved, 'duplicates_deleted': duplicates}
 
 
 
 # --- OAuth (Google example) ---
-google_bp = make_google_blueprint(
-    client_id="GOOGLE_CLIENT_ID",
-    client_secret="GOOGLE_CLIENT_SECRET",
-    scope=["profile", "email"],
-    redirect_url="/oauth_callback"
-)
-app.register_blueprint(google_bp, url_prefix="/login")
+# Importing flask_dance is a noticeable part of startup and the Google login 
+# isn't used unless it is configured, so this is only set up when it is.
+# (Flask won't register a blueprint after the first request, so this can't 
+# wait any longer than create_app().)
+OAUTH_ENABLED = False
+
+def init_oauth():
+    global OAUTH_ENABLED
+    if OAUTH_ENABLED:
+        return
+    from flask_dance.contrib.google import make_google_blueprint
+    google_bp = make_google_blueprint(
+        client_id=os.getenv("GOOGLE_OAUTH_CLIENT_ID"),
+        client_secret=os.getenv("GOOGLE_OAUTH_CLIENT_SECRET"),
+        scope=["profile", "email"],
+        redirect_url="/oauth_callback"
+    )
+    app.register_blueprint(google_bp, url_prefix="/login")
+    OAUTH_ENABLED = True
 
 
 # wipes all guest items.  
 # TODO: If I was running a production service, I'd track the age of these
 # and clean them up every day or so
 def _clean_guest_items():
-    Item.query.filter(Item.guest_id.isnot(None),
-                      Item.user_id.is_(None)).delete()
+    KnownItem.query.filter(KnownItem.owner.like('guest:%')).delete(synchronize_session=False)
+    KnownItemBits.query.filter(KnownItemBits.owner.like('guest:%')).delete(synchronize_session=False)
 
-# --- Known Item model ---
+# --- The old known item table ---
+# One row per user / guest and item name.   Replaced by KnownItem, this is
+# only still here so migrate_item_rows() can move old databases over.
 class Item(USERDB.Model):
     id      = USERDB.Column(USERDB.Integer, primary_key=True)
     name    = USERDB.Column(USERDB.String(120), nullable=False)
     user_id = USERDB.Column(USERDB.Integer, USERDB.ForeignKey('user.id'), nullable=True)
     guest_id = USERDB.Column(USERDB.String(36), nullable=True, index=True)
 
+# --- Item catalog ---
+# Gives every item name a small id that never changes (rows are only ever
+# added), so known items can be kept as a bitset.   See knownitemslib.py.
+class ItemCatalog(USERDB.Model):
+    id   = USERDB.Column(USERDB.Integer, primary_key=True)
+    name = USERDB.Column(USERDB.String(120), unique=True, nullable=False)
+
+# --- Known items ---
+# One row per owner and item they know.   owner is "user:<id>" or
+# "guest:<guest_id>", so the primary key's index covers looking up both.
+class KnownItem(USERDB.Model):
+    owner   = USERDB.Column(USERDB.String(64), primary_key=True)
+    item_id = USERDB.Column(USERDB.Integer, USERDB.ForeignKey('item_catalog.id'), primary_key=True)
+
+# --- Known items, as a bitset of ItemCatalog ids ---
+# The KnownItem rows are still written, this is a compact copy of them that
+# is cheap to load and test.
+class KnownItemBits(USERDB.Model):
+    owner = USERDB.Column(USERDB.String(64), primary_key=True)
+    bits  = USERDB.Column(USERDB.LargeBinary, nullable=False)
+
+ITEMIDS = knownitemslib.ItemIds()
+
+def _ensure_item_ids(names):
+    """Make sure every name in names has an id in ITEMIDS, adding catalog
+    rows for the ones that don't."""
+    if all(name in ITEMIDS for name in names):
+        return
+
+    # Another worker may have added some since we last looked
+    for row in ItemCatalog.query.all():
+        if row.name not in ITEMIDS:
+            ITEMIDS.add(row.name, row.id)
+
+    missing = sorted(set(name for name in names if name not in ITEMIDS))
+    if not missing:
+        return
+
+    USERDB.session.add_all([ItemCatalog(name=name) for name in missing])
+    try:
+        USERDB.session.commit()
+    except IntegrityError:
+        # Another worker added (some of) them first.   Theirs are just as good.
+        USERDB.session.rollback()
+    for row in ItemCatalog.query.filter(ItemCatalog.name.in_(missing)):
+        ITEMIDS.add(row.name, row.id)
+
+def migrate_item_rows():
+    """Move an old database's Item rows (item names) to KnownItem (item
+    ids), in one transaction.   Does nothing once they're all moved.
+    Returns how many rows there were."""
+    names = USERDB.session.scalars(select(Item.name).distinct()).all()
+    if not names:
+        return 0
+    _ensure_item_ids(names)
+
+    owner = case((Item.user_id.isnot(None), literal('user:') + cast(Item.user_id, String)),
+                 else_=literal('guest:') + Item.guest_id)
+    rows = (select(owner, ItemCatalog.id)
+            .join(ItemCatalog, ItemCatalog.name == Item.name)
+            .where(or_(Item.user_id.isnot(None), Item.guest_id.isnot(None))))
+    # (the same item can be there more than once, and another worker may be
+    # doing this at the same time)
+    USERDB.session.execute(
+        insert(KnownItem).prefix_with('OR IGNORE').from_select(['owner', 'item_id'], rows))
+    count = USERDB.session.execute(delete(Item).execution_options(synchronize_session=False)).rowcount
+    USERDB.session.commit()
+    return count
+
 # --- User model ---
 class User(UserMixin, USERDB.Model):
     id = USERDB.Column(USERDB.Integer, primary_key=True)
@@ -174,19 +398,30 @@ class User(UserMixin, USERDB.Model):
     oauth_provider = USERDB.Column(USERDB.String(50), nullable=True)
     oauth_id = USERDB.Column(USERDB.String(200), nullable=True)
 
-    # one‐to‐many relationship: user.items will be a list of Item objects
-    known_items = USERDB.relationship('Item', backref='user', lazy='dynamic')
+    @property
+    def known_items(self):
+        """A query for this user's KnownItem rows."""
+        return KnownItem.query.filter_by(owner=f"user:{self.id}")
 
     def set_password(self, pwd):
-        self.password_hash = generate_password_hash(pwd,method='pbkdf2:sha256', salt_length=16)
+        self.password_hash = PASSWORDHASHER.hash(pwd)
 
     def check_password(self, pwd):
-        return check_password_hash(self.password_hash, pwd)
+        return PASSWORDHASHER.check(self.password_hash, pwd)
+
+
+# Flask-Login's current_user, get_current_user() and the views all want the
+# logged in user.   It's looked up once per request and remembered in g.
+def _get_user(user_id):
+    users = g.setdefault('users', {})
+    if user_id not in users:
+        users[user_id] = USERDB.session.get(User, user_id)
+    return users[user_id]
 
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return _get_user(int(user_id))
 
 
 # --- Providing a uniform replacement for current_user ---
@@ -211,15 +446,24 @@ class UserProxy:
             return self._user.known_items
         else:
             # filter guest items by guest_id
-            return Item.query.filter_by(guest_id=self._guest_id)
+            return KnownItem.query.filter_by(owner=f"guest:{self._guest_id}")
 
 def get_current_user():
-    """Return a UserProxy always, wrapping either a real user or a guest."""
+    """Return a UserProxy always, wrapping either a real user or a guest.
+    This is remembered for the rest of the request (every template render
+    asks for it)."""
+    key = (session.get('user_id'), session.get('guest_id'))
+    cached = g.get('current_user_proxy')
+    if cached is not None and cached[0] == key:
+        return cached[1]
+
     user = None
     if session.get('user_id'):
-        user = User.query.get(session['user_id'])
+        user = _get_user(session['user_id'])
     guest_id = session.get('guest_id')
-    return UserProxy(user=user, guest_id=guest_id)
+    proxy = UserProxy(user=user, guest_id=guest_id)
+    g.current_user_proxy = (key, proxy)
+    return proxy
 
 @app.context_processor
 def inject_user():
@@ -254,6 +498,10 @@ def register():
 # --- OAuth callback ---
 @app.route("/oauth_callback")
 def oauth_callback():
+    if not OAUTH_ENABLED:
+        return redirect(url_for('register'))
+
+    from flask_dance.contrib.google import google
     resp = google.get("/oauth2/v2/userinfo")
     if not resp.ok:
         flash("Failed to fetch user info from Google.", "error")
@@ -323,7 +571,12 @@ def ensure_guest_id():
 # I'm going to create a webserver and have users interact with this using
 # their webbrowser.
 
-from flask import Flask, session, redirect, url_for, request, jsonify, render_template
+from flask import Flask, session, redirect, url_for, request, jsonify, render_template, send_from_directory, make_response
+from werkzeug.security import safe_join
+from itsdangerous import URLSafeSerializer, BadSignature
+from markupsafe import Markup
+from urllib.parse import quote, unquote
+import re
 
 
 from functools import wraps
@@ -349,7 +602,75 @@ def _get_user_id():
         return session['guest_id']
 
 
+# --- Rate limiting ---
+# The routes that write something are rate limited per user / guest and IP
+# address (see ratelimitlib.py), so one client (or a drag loop gone wrong in
+# the game page) can't tie up the workers or fill up the logs.   Everyone at
+# an address also shares a bigger bucket, since a guest that doesn't send its
+# cookie back gets a new guest_id (and so a new bucket) every time.
+# endpoint -> (requests per second, burst).   FCTC_RATE_LIMITS can override
+# these with JSON, e.g. {"suggestion": [0.1, 3]}.   Only POSTs count.
+RATELIMITS = {
+    'handle_drop': (10, 40),
+    'handle_drop_batch': (5, 20),
+    'suggestion': (0.2, 5),
+    'problem': (0.5, 10),
+    'register': (0.1, 5),
+}
+RATELIMITS.update({endpoint: tuple(limit) for endpoint, limit in json.loads(os.getenv("FCTC_RATE_LIMITS", "{}")).items()})
+
+# By default each worker keeps its own buckets.   FCTC_RATE_LIMIT_DB names a
+# SQLite file for all the workers on a machine to share them.
+if os.getenv("FCTC_RATE_LIMIT_DB"):
+    RATELIMITER = ratelimitlib.RateLimiter(ratelimitlib.SQLiteStore(os.getenv("FCTC_RATE_LIMIT_DB")), RATELIMITS)
+else:
+    RATELIMITER = ratelimitlib.RateLimiter(ratelimitlib.MemoryStore(), RATELIMITS)
+
+@app.before_request
+def rate_limit():
+    if request.method == 'GET' or request.endpoint not in RATELIMITER.limits:
+        return
+    address = client_address()
+    allowed, retryafter = RATELIMITER.check(request.endpoint, f"{_known_items_owner()}@{address}",
+                                            shared=f"ip:{address}")
+    if not allowed:
+        raise ratelimitlib.RateLimited(retryafter)
+
+# How many proxies in front of us add the address they got the request from
+# to X-Forwarded-For.   On Cloud Run that's its front end, so every request
+# comes from its address and the client's is the last one in the header.
+# Set FCTC_PROXY_HOPS=0 when nothing is in front (or the header could be
+# made up).
+PROXYHOPS = int(os.getenv("FCTC_PROXY_HOPS", 1))
+
+def client_address():
+    """The client's IP address, as the first proxy in front of us saw it
+    (like werkzeug's ProxyFix works it out, but this also works for the ASGI
+    views, which don't go through app.wsgi_app)."""
+    if PROXYHOPS:
+        forwarded = [address.strip() for address in request.headers.get('X-Forwarded-For', '').split(',')]
+        forwarded = [address for address in forwarded if address]
+        if len(forwarded) >= PROXYHOPS:
+            return forwarded[-PROXYHOPS]
+    return request.remote_addr
+
+@app.errorhandler(ratelimitlib.RateLimited)
+def rate_limited(e):
+    return "Too many requests.   Please slow down.", 429, {'Retry-After': str(max(1, int(e.retryafter + 0.999)))}
+
+
+GIT_VERSION = None
+
 def _get_git_version():
+    """Get the current git commit hash.   This is worked out on first use and
+    then remembered, since it can't change while we're running."""
+    global GIT_VERSION
+    if GIT_VERSION is None:
+        GIT_VERSION = _find_git_version()
+    return GIT_VERSION
+
+
+def _find_git_version():
     """Get the current git commit hash.
     
     This function tries multiple methods to get the git version:
@@ -407,16 +728,14 @@ def _get_git_version():
 def home():
 #
     uid = _get_user_id()
-    if uid not in userstatedict:
-        # Initialize user state
-        userstatedict[uid]={}
-        userstatedict[uid]['state'] = {}
+    # Initialize user state
+    USERSTATE.ensure(uid)
 
     # Get the git version
     git_version = _get_git_version()
 
     # Generate the home page with links
-    return render_template("home.html", 
+    return render_cached_template("home.html", 
                           current_user=current_user, 
                           backurl=url_for("home"),
                           git_version=git_version)
@@ -425,7 +744,7 @@ def home():
 @app.route("/credits")
 def credits():
     # Render the credits page with placeholder text
-    return render_template("credits.html", current_user=current_user)
+    return render_cached_template("credits.html", current_user=current_user)
 
 
 @app.route("/suggestion", methods=["POST"])
@@ -434,9 +753,7 @@ def suggestion():
     if not user_input:
         return jsonify(success=False, error="Empty suggestion"), 400
 
-    global SUGGESTIONLOG
     SUGGESTIONLOG.write(user_input + "\n")
-    SUGGESTIONLOG.flush()
 
     return jsonify(success=True)
 
@@ -536,7 +853,7 @@ def _step_to_box_groups(steps,exploration_path=None):
     return box_groups
         
 def _get_item(item,shape):
-    return {'name':item,'url':ITEMDB.items[item].image[0]['link'],'shape':shape,'description':ITEMDB.items[item].description} 
+    return {'name':item,'url':item_images(item)[0]['link'],'shape':shape,'description':ITEMDB.items[item].description} 
 
 def _get_base_items(box_groups):
     """
@@ -551,10 +868,38 @@ def _get_base_items(box_groups):
                     base_items.append(thisitem)
     return base_items
 
+# (item, exploration path, catalog version) -> (page data, items whose images
+# it shows, their corrections).   The page data only depends on these, so
+# there's no need to build it on every request.   A new image picked on
+# /problem for one of its items is picked up (see ImageReads).
+PAGEDATACACHE = collections.OrderedDict()
+PAGEDATACACHESIZE = 4096
+PAGEDATALOCK = threading.Lock()
+
 def _get_page_data(current_item,exploration_path=None):
     """
-    Get the page data for the current item number.
+    Get the page data for the current item number.   Callers must not
+    change what this returns, since it is shared.
     """
+    key = (current_item, exploration_path, catalog_version())
+    with PAGEDATALOCK:
+        entry = PAGEDATACACHE.get(key)
+        if entry is not None:
+            PAGEDATACACHE.move_to_end(key)
+    if entry is not None and images_unchanged(entry[1], entry[2]):
+        return entry[0]
+
+    with ImageReads() as reads:
+        page_data = _build_page_data(current_item, exploration_path=exploration_path)
+
+    with PAGEDATALOCK:
+        PAGEDATACACHE[key] = (page_data, reads.names, reads.links)
+        while len(PAGEDATACACHE) > PAGEDATACACHESIZE:
+            PAGEDATACACHE.popitem(last=False)
+    return page_data
+
+
+def _build_page_data(current_item,exploration_path=None):
 
     header_title = ITEMDB.items[current_item].name
     box_groups = _step_to_box_groups(ITEMDB.items[current_item].steps,exploration_path=exploration_path)
@@ -565,9 +910,10 @@ def _get_page_data(current_item,exploration_path=None):
             boxes.append(box)
 
     # get the images, if they exist.
-    if hasattr(ITEMDB.items[current_item],'image') and len(ITEMDB.items[current_item].image) > 0:
-        header_image_url = ITEMDB.items[current_item].image[0]['thumbnailLink']
-        completion_image_url = ITEMDB.items[current_item].image[0]['link']
+    images = item_images(current_item)
+    if len(images) > 0:
+        header_image_url = images[0]['thumbnailLink']
+        completion_image_url = images[0]['link']
     else:
         header_image_url = "/static/images/default.png"
         completion_image_url = "/static/images/default.png"
@@ -612,102 +958,213 @@ def choose():
     init_stats_if_needed()
 
     # Generate the home page with links
-    return render_template("choose.html", possibleitems=POSSIBLEITEMSTATS.values(), current_user=current_user)
+    return render_cached_template("choose.html", possibleitems=POSSIBLEITEMSTATS.values(), current_user=current_user)
+
+
+def _choose_progress():
+    """How many of the items needed for each choice the user already knows.
+    Worked out once per request."""
+    if 'choose_progress' in g:
+        return g.choose_progress
+    progress = {}
+    if ITEMDB is not None:
+        known = get_known_bits()
+        for label in POSSIBLEITEMSTATS:
+            if label in ITEMDB.items:
+                progress[label] = ITEMIDS.subtree_progress(ITEMDB, known, label)[0]
+    g.choose_progress = progress
+    return progress
+
+
+def _known_items_owner():
+    """The owner key for the current user / guest in KnownItemBits."""
+    if session.get('user_id'):
+        return f"user:{session['user_id']}"
+    if session.get('guest_id'):
+        return f"guest:{session['guest_id']}"
+    return None
+
+
+def _get_owner_row(owner):
+    """The owner's KnownItemBits row (or None).   Remembered for the rest of
+    the request, so saving it later doesn't have to load it again."""
+    rows = g.setdefault('known_bit_rows', {})
+    if owner not in rows:
+        rows[owner] = USERDB.session.get(KnownItemBits, owner)
+    return rows[owner]
+
+
+def _get_owner_bits(owner):
+    """Load an owner's known item bitset.   If they don't have one yet (they
+    learned things before bitsets existed), build it from their KnownItem rows."""
+    row = _get_owner_row(owner)
+    if row is not None:
+        return knownitemslib.from_blob(row.bits)
+
+    bits = 0
+    for itemid in USERDB.session.scalars(select(KnownItem.item_id).where(KnownItem.owner == owner)):
+        bits |= 1 << itemid
+    if not bits:
+        return 0
+
+    return PROGRESSWRITER.write(lambda connection: _merge_owner_bits(connection, owner, bits))
+
+
+def _merge_owner_bits(connection, owner, bits):
+    """Or bits into an owner's stored bitset.   Runs on the writer thread
+    (PROGRESSWRITER), so it sees anything another request / process added
+    since this one read it.   Returns the merged bitset."""
+    old = connection.execute(select(KnownItemBits.bits).where(KnownItemBits.owner == owner)).scalar()
+    bits |= knownitemslib.from_blob(old)
+    blob = knownitemslib.to_blob(bits)
+    connection.execute(sqlite_insert(KnownItemBits).values(owner=owner, bits=blob)
+                       .on_conflict_do_update(index_elements=['owner'], set_={'bits': blob}))
+    return bits
+
+
+def get_known_bits():
+    """The current user's known items as a bitset (see knownitemslib.py).
+    This is remembered for the rest of the request."""
+    owner = _known_items_owner()
+    if owner is None:
+        print(f"Error: No user or guest ID found in get_known_bits.")
+        return 0
+
+    cached = g.get('known_bits')
+    if cached is not None and cached[0] == owner:
+        return cached[1]
+
+    bits = _get_owner_bits(owner)
+    g.known_bits = (owner, bits)
+    return bits
 
 
 def get_known_items():
-    # 1) If they’re logged in…
-    user_id = session.get('user_id')
-    if user_id:
-        user = User.query.get(user_id)
-        if user:
-            # returns a list via the dynamic relationship
-            retitemnames = []
-            for item in user.known_items:
-                retitemnames.append(item.name)
-            return retitemnames
-
-    # 2) Otherwise, treat them as guest
-    guest_id = session.get('guest_id')
-    if guest_id:
-        retitemnames = []
-        for item in Item.query.filter_by(guest_id=guest_id).all():
-            retitemnames.append(item.name)
-        return retitemnames
-
-    print(f"Error: No user or guest ID found in get_known_items.")
-    # 3) Fallback: nobody to track
-    return []
+    """The names of the items the current user knows, as a set.   Also
+    remembered for the rest of the request (until they learn more)."""
+    bits = get_known_bits()
+    cached = g.get('known_names')
+    if cached is None or cached[0] != bits:
+        cached = (bits, ITEMIDS.to_names(bits))
+        g.known_names = cached
+    return cached[1]
+
+
+def _add_known_items_to_current_user(items):
+    """Add the items the user doesn't already know, in one commit.   Returns
+    the items that were added."""
+    owner = _known_items_owner()
+    bits = get_known_bits()
+    _ensure_item_ids([item for item in items if item not in ITEMIDS])
+
+    added = []
+    for item in items:
+        if ITEMIDS.knows(bits, item) or item in added:
+            continue
+        bits |= ITEMIDS.bit(item)
+        added.append(item)
+
+    if added:
+        rows = [{'owner': owner, 'item_id': ITEMIDS.ids[item]} for item in added]
+
+        def save(connection):
+            # Another request (another tab) may have just added some of these
+            connection.execute(sqlite_insert(KnownItem).values(rows).on_conflict_do_nothing())
+            return _merge_owner_bits(connection, owner, bits)
+
+        bits = PROGRESSWRITER.write(save)
+        g.known_bits = (owner, bits)
+        if READINESS is not None:
+            READINESS.learned(owner, bits, ITEMIDS)
+    return added
+
+
+def get_next_items(limit=10):
+    """The items the current user is closest to being able to make, best
+    first (see readinesslib.py)."""
+    if READINESS is None:
+        return []
+    nextitems = READINESS.ranked(_known_items_owner(), get_known_bits(), ITEMIDS, limit=limit)
+    for item in nextitems:
+        item['url'] = url_for('game', item_name=item['name'], exploration_path=item['path'], item_to_add='')
+    return nextitems
+
+
+# Most that /api/next_items will return, so one call can't ask for everything
+MAXNEXTITEMS = 50
+
+@app.route('/api/next_items')
+def api_next_items():
+    limit = max(1, min(request.args.get('limit', 10, type=int), MAXNEXTITEMS))
+    return jsonify(items=get_next_items(limit=limit))
 
 def _add_known_item_to_current_user(item):
     # This is a helper function to add a known item to the user.
-    if item not in get_known_items():
-        # automatically converts current_user to the correct foreign key
-        if current_user.is_authenticated:
-            new_item = Item(name=item, user_id=current_user.id)
-        else:
-            new_item = Item(name=item, guest_id=session['guest_id'])
-        USERDB.session.add(new_item)
-        USERDB.session.commit()
-        return True
-    return False
+    return _add_known_items_to_current_user([item]) != []
 
 def _get_image_boxes(availableitems,box_groups):
     """
     Get the image boxes for the current item number.
     """
-    unseenitems = availableitems[:]
+    unseenitems = set(availableitems)
     imageboxes = []
     for bg in box_groups:
         for box in bg['boxes']:
             if box['accepts'] in unseenitems:
-                unseenitems.remove(box['accepts'])
+                unseenitems.discard(box['accepts'])
                 imageboxes.append(_get_item(box['accepts'],box['shape']))
 
     return imageboxes
 
 
-@app.route('/game')
-@login_required
-def game():
+# /game is split into the part that uses the database (_learn_game_items and
+# get_known_items) and the parts that don't, so that asgiapp.py can run the
+# database part off of its event loop.
 
+def _game_page_data():
+    """Work out which item / path this /game request is for and build its
+    page data.   Returns (current_item, exploration_path, page_data)."""
     init_stats_if_needed()
     current_item = request.args.get('item_name', choice(list(POSSIBLEITEMSTATS.keys())), type=str)
 
-
     uid = _get_user_id()
-    if current_item not in userstatedict[uid]['state']:
-        # If the item is not in the user's state, add it
-        userstatedict[uid]['state'][current_item] = {}
+    # If the item is not in the user's state, add it
+    USERSTATE.start_item(uid, current_item)
 
     exploration_path = request.args.get('exploration_path', current_item, type=str)
     page_data = _get_page_data(current_item,exploration_path=exploration_path)
+    return current_item, exploration_path, page_data
 
-    box_groups = page_data['box_groups']
-    boxes = page_data['boxes']
-    header_image_url = page_data['header_image_url']
-    header_title = page_data['header_title']
-    completion_image_url = page_data['completion_image_url']
-    page_description = page_data['page_description']
 
-    base_items = page_data['base_items']
+def _learn_game_items(page_data, item_to_add):
+    """The user now knows the base items on this page and the item they just
+    finished (item_to_add), if any.   Returns the base items that are new."""
 
     # TODO: Make this a splash page that comes up first...
 
+    known = get_known_bits()
+
     new_items = []
     # If I didn't know this, add it.
-    for item in base_items:
-        if _add_known_item_to_current_user(item['name']):
+    for item in page_data['base_items']:
+        if not ITEMIDS.knows(known, item['name']) and item['name'] not in new_items:
             new_items.append(item['name'])
 
     # If we just finished something, add it...
-    item_to_add = request.args.get('item_to_add', '', type=str)
+    to_add = new_items[:]
     if item_to_add != '':
-        if item_to_add in get_known_items():
+        if ITEMIDS.knows(known, item_to_add):
             # This is an error, because we already know this item.
             print(f"Error: {item_to_add} already known.")
-        else:
-            _add_known_item_to_current_user(item_to_add)
+        elif item_to_add not in to_add:
+            to_add.append(item_to_add)
+
+    _add_known_items_to_current_user(to_add)
+    return new_items
+
+
+def _render_game(current_item, exploration_path, page_data, new_items, availableitems):
+    box_groups = page_data['box_groups']
 
     # Exploration path is a string of tags separated by slashes
     header_tags = _get_header_tags(exploration_path)
@@ -719,29 +1176,46 @@ def game():
     else:
         completion_url=url_for('win', item_name=current_item)
 
-    availableitems = get_known_items()
-
     imageboxes = _get_image_boxes(availableitems,box_groups)
-    
+
+    uid = _get_user_id()
+
+    # The page asks for just the changing part when moving between items
+    # (see game_content.html).
+    template = 'game_content.html' if request.args.get('fragment') == '1' else 'game.html'
 
     return render_template(
-        'game.html',
-        header_image_url=header_image_url,
-        header_title=header_title,
+        template,
+        header_image_url=page_data['header_image_url'],
+        header_title=page_data['header_title'],
         header_tags=header_tags,
         box_groups=box_groups,
-        completion_image_url=completion_image_url,
-        page_description=page_description,
+        completion_image_url=page_data['completion_image_url'],
+        page_description=page_data['page_description'],
         item_name=current_item,
         new_items=new_items,
         exploration_path=exploration_path,
-        boxes=boxes, 
+        boxes=page_data['boxes'], 
         settings=session.get("settings", DEFAULT_SETTINGS.copy()),
-        box_fills=userstatedict[uid]['state'][current_item],
+        box_fills=USERSTATE.fills(uid, current_item),
+        box_map=sign_box_map(current_item, page_data['boxes']),
         images=imageboxes,
         completion_url=completion_url,
     )
 
+
+@app.route('/game')
+@login_required
+def game():
+    current_item, exploration_path, page_data = _game_page_data()
+
+    item_to_add = request.args.get('item_to_add', '', type=str)
+    new_items = _learn_game_items(page_data, item_to_add)
+
+    availableitems = get_known_items()
+
+    return _render_game(current_item, exploration_path, page_data, new_items, availableitems)
+
 @login_required
 @app.route('/drop', methods=['POST'])
 def handle_drop():
@@ -761,15 +1235,11 @@ def handle_drop():
     page_data = _get_page_data(current_item,exploration_path=exploration_path)
 
     # This shouldn't happen, because the game page should initialize this.
-    if current_item not in userstatedict[uid]['state']:
+    if not USERSTATE.has_item(uid, current_item):
         print(f"Error: {current_item} not in user state.")
-        # If the item is not in the user's state, add it
-        userstatedict[uid]['state'][current_item] = {}
-
-    mystate = userstatedict[uid]['state'][current_item]
 
     # Prevent re-filling an already-filled box
-    if box_id in mystate:
+    if box_id in USERSTATE.fills(uid, current_item):
         print(f"Error: {box_id} already filled.")
         return jsonify({'status': 'already-filled'})
 
@@ -780,13 +1250,289 @@ def handle_drop():
         if str(box['id']) == box_id:
             # This is the box we are looking for
             if box['accepts'] == image_name:
-                mystate[box_id] = image_url
+                # (another request may have filled it since we looked)
+                if not USERSTATE.add_fills(uid, current_item, {box_id: image_url}):
+                    return jsonify({'status': 'already-filled'})
                 return jsonify({'status': 'locked'})
     else:
         return jsonify({'status': 'rejected'})
 
 
 
+# The game page carries a signed map of box id -> the item that box accepts.
+# The page checks drops against its own copy right away and sends them in 
+# batches to /drop_batch, which only has to check the signature instead of
+# rebuilding the page data.
+BOXMAPSERIALIZER = URLSafeSerializer(app.secret_key, salt="fctc-box-map")
+
+def sign_box_map(item_name, boxes):
+    boxmap = {str(box['id']): box['accepts'] for box in boxes}
+    return BOXMAPSERIALIZER.dumps({'item': item_name, 'boxes': boxmap})
+
+
+@login_required
+@app.route('/drop_batch', methods=['POST'])
+def handle_drop_batch():
+    """Apply a batch of drops: {'box_map': <signed map from the page>,
+    'drops': [{'box_id': ..., 'name': ..., 'image_url': ...}, ...]}.
+    Returns the status of each box, like /drop does for one."""
+
+    data = request.get_json(force=True, silent=True) or {}
+    # It comes from the browser, so it may not be what the page would send
+    if not isinstance(data, dict) or not isinstance(data.get('box_map', ''), str) \
+            or not isinstance(data.get('drops', []), list) \
+            or not all(isinstance(drop, dict) for drop in data.get('drops', [])):
+        return jsonify({'status': 'bad-request'}), 400
+    try:
+        signed = BOXMAPSERIALIZER.loads(data.get('box_map', ''))
+    except BadSignature:
+        return jsonify({'status': 'bad-signature'}), 400
+
+    current_item = signed['item']
+    boxmap = signed['boxes']
+
+    uid = _get_user_id()
+    mystate = USERSTATE.fills(uid, current_item)
+
+    fills = {}
+    results = {}
+    for drop in data.get('drops', []):
+        box_id = str(drop.get('box_id'))
+        name = drop.get('name')
+        if box_id in mystate or box_id in fills:
+            results[box_id] = 'already-filled'
+        elif box_id in boxmap and isinstance(name, str) and boxmap[box_id] == name:
+            fills[box_id] = drop.get('image_url')
+            results[box_id] = 'locked'
+        else:
+            results[box_id] = 'rejected'
+
+    # all of the fills go in at once.   Any that another request filled since
+    # we looked don't count.
+    if fills:
+        added = USERSTATE.add_fills(uid, current_item, fills)
+        for box_id in fills:
+            if box_id not in added:
+                results[box_id] = 'already-filled'
+
+    return jsonify({'status': 'ok', 'results': results})
+
+
+####### PAGE CACHE #######
+
+# /home, /choose and /credits come out the same for everyone until the item
+# database changes, so I keep the rendered HTML in memory.   It's keyed on the
+# page, the ITEMDB version and the little that changes it per user (who is
+# logged in and their settings).
+#
+# The parts of those pages that are about what this user knows can't be
+# cached.   Templates put them in with personal('name', arg): when a page is
+# rendered for the cache that leaves a marker, which is replaced with the
+# fragment from PERSONALFRAGMENTS each time the page is served.
+
+PAGECACHE = collections.OrderedDict()
+PAGECACHESIZE = 1024
+PAGECACHELOCK = threading.Lock()
+PAGECACHESTATS = {'hits': 0, 'misses': 0}
+PAGECACHEENABLED = os.environ.get('FCTC_PAGE_CACHE', '1') != '0'
+
+PERSONALMARKER = re.compile(r'<!--personal:(\w+):([^ >]*)-->')
+
+
+def _progress_fragment(label):
+    progress = _choose_progress()
+    if label not in progress:
+        return ''
+    return f'<span class="stat">you know: {progress[label]}</span>'
+
+
+def _next_items_fragment(arg):
+    return render_template("next_items.html", next_items=get_next_items(limit=5))
+
+
+PERSONALFRAGMENTS = {
+    'progress': _progress_fragment,
+    'next_items': _next_items_fragment,
+}
+
+
+def personal(name, arg=''):
+    """A part of a page that depends on what the current user knows."""
+    if g.get('rendering_for_cache'):
+        return Markup(f'<!--personal:{name}:{quote(arg, safe="")}-->')
+    return Markup(PERSONALFRAGMENTS[name](arg))
+
+app.jinja_env.globals['personal'] = personal
+
+
+def _page_cache_key(template_name):
+    user = current_user.username if current_user.is_authenticated else None
+    settings = tuple(sorted(session.get("settings", DEFAULT_SETTINGS).items()))
+    version = catalog_version() if ITEMDB is not None else None
+    return (template_name, request.full_path, version, user, settings)
+
+
+def _fill_personal(body, etag):
+    """Put this user's fragments into a cached page.   The ETag has to
+    change with them."""
+    if '<!--personal:' not in body:
+        return body, etag
+    fragments = []
+
+    def fill(match):
+        fragments.append(PERSONALFRAGMENTS[match.group(1)](unquote(match.group(2))))
+        return fragments[-1]
+
+    body = PERSONALMARKER.sub(fill, body)
+    etag = hashlib.sha256('\0'.join([etag] + fragments).encode('utf-8')).hexdigest()[:16]
+    return body, etag
+
+
+def render_cached_template(template_name, **context):
+    """render_template for pages that are the same for everyone (apart from
+    their personal() parts).   Returns a response with an ETag, or a 304 if
+    the browser already has it."""
+    if not PAGECACHEENABLED:
+        return render_template(template_name, **context)
+
+    key = _page_cache_key(template_name)
+    with PAGECACHELOCK:
+        entry = PAGECACHE.get(key)
+        if entry is not None:
+            PAGECACHE.move_to_end(key)
+    if entry is not None and not images_unchanged(entry[2], entry[3]):
+        entry = None
+    with PAGECACHELOCK:
+        PAGECACHESTATS['hits' if entry is not None else 'misses'] += 1
+
+    if entry is None:
+        g.rendering_for_cache = True
+        try:
+            with ImageReads() as reads:
+                body = render_template(template_name, **context)
+        finally:
+            g.rendering_for_cache = False
+        entry = (body, hashlib.sha256(body.encode('utf-8')).hexdigest()[:16], reads.names, reads.links)
+        with PAGECACHELOCK:
+            PAGECACHE[key] = entry
+            while len(PAGECACHE) > PAGECACHESIZE:
+                PAGECACHE.popitem(last=False)
+
+    body, etag = _fill_personal(*entry[:2])
+    response = make_response(body)
+    response.set_etag(etag)
+    # It depends on the session cookie, so only the browser may keep it,
+    # and it has to check with us first.
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response.make_conditional(request)
+
+
+def page_cache_stats():
+    with PAGECACHELOCK:
+        return dict(PAGECACHESTATS, entries=len(PAGECACHE))
+
+
+####### ITEM BUNDLES #######
+
+# A bundle is everything needed to play a user requested item and all of its
+# sub-items (steps, boxes, descriptions and images) as one JSON document, so
+# the client can move around the tree without loading a page per item.   It
+# doesn't depend on who is asking, so it can be cached by browsers / proxies.
+
+# item name -> (catalog version, etag, JSON body, items whose images it has,
+# their corrections), least recently used first.   The gunicorn threads all
+# use it, so it's only touched with BUNDLECACHELOCK held.
+BUNDLECACHE = collections.OrderedDict()
+BUNDLECACHESIZE = 256
+BUNDLECACHELOCK = threading.Lock()
+
+def _item_images(itemname):
+    """Returns (image url, thumbnail url) for an item."""
+    images = item_images(itemname)
+    if len(images) > 0:
+        return images[0]['link'], images[0]['thumbnailLink']
+    return "/static/images/default.png", "/static/images/default.png"
+
+
+def _bundle_item(itemname):
+    item = ITEMDB.items[itemname]
+    image, thumbnail = _item_images(itemname)
+    thisitem = {
+        'description': getattr(item, 'description', ''),
+        'image': image,
+        'thumbnail': thumbnail,
+    }
+    if getattr(item, 'steps', None):
+        # Same boxes, in the same order (so the same box ids), as
+        # _step_to_box_groups makes for the game page.
+        thisitem['steps'] = []
+        for step in item.steps:
+            boxes = [[subitem, 'oval'] for subitem in step['raw_materials']]
+            boxes += [[subitem, 'square'] for subitem in step['tools']]
+            thisitem['steps'].append({'label': step['step'], 'description': step['description'], 'boxes': boxes})
+    return thisitem
+
+
+def build_bundle(itemname):
+    """The bundle for itemname as a dict."""
+    names = sorted(knownitemslib.subtree_names(ITEMDB, itemname) | {itemname})
+    return {
+        'version': catalog_version(),
+        'root': itemname,
+        'items': {name: _bundle_item(name) for name in names},
+    }
+
+
+def _get_bundle(itemname):
+    """Returns (etag, JSON body) for itemname, building it if ITEMDB (or the
+    image picked on /problem for one of its items) has changed since it was
+    built."""
+    version = catalog_version()
+    with BUNDLECACHELOCK:
+        cached = BUNDLECACHE.get(itemname)
+        if cached is not None:
+            BUNDLECACHE.move_to_end(itemname)
+    if cached is None or cached[0] != version or not images_unchanged(cached[3], cached[4]):
+        # Built without the lock held.   Two threads may both build it, but
+        # they build the same thing.
+        with ImageReads() as reads:
+            body = json.dumps(build_bundle(itemname), separators=(',', ':'), sort_keys=True)
+        etag = hashlib.sha256(body.encode('utf-8')).hexdigest()[:16]
+        cached = (version, etag, body, reads.names, reads.links)
+        with BUNDLECACHELOCK:
+            BUNDLECACHE[itemname] = cached
+            while len(BUNDLECACHE) > BUNDLECACHESIZE:
+                BUNDLECACHE.popitem(last=False)
+    return cached[1], cached[2]
+
+
+# How long browsers may use a bundle before checking its ETag again
+BUNDLEMAXAGE = 3600
+
+@app.route('/api/bundle/<path:item_name>')
+def api_bundle(item_name):
+    init_stats_if_needed()
+    if item_name not in POSSIBLEITEMSTATS or item_name not in ITEMDB.items:
+        return jsonify(error=f"No such item: {item_name}"), 404
+
+    etag, body = _get_bundle(item_name)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = BUNDLEMAXAGE
+    return response.make_conditional(request)
+
+
+def prefer_item_image(item_name, selected_image_no):
+    """Make one of an item's images (numbered as /problem listed them) the
+    one shown.   This only appends a line to the overlay, so it's quick no
+    matter how big ITEMDB is, and every worker picks it up."""
+    goodimage = item_images(item_name)[selected_image_no]
+    OVERLAY.prefer(item_name, goodimage['link'])
+
+
 @app.route('/problem', methods=['GET', 'POST'])
 def problem():
 
@@ -801,19 +1547,19 @@ def problem():
 
         # make this image the preferred one!
         if selected_image != '' and selected_image != '0':
-            selected_image_no = int(selected_image)
-            goodimage = ITEMDB.items[item_name].image.pop(selected_image_no)
-            ITEMDB.items[item_name].image.insert(0,goodimage)
-            ITEMDB.save()
+            prefer_item_image(item_name, int(selected_image))
 
+        categories = []
         if selected_image and selected_image != '0':
-            do_log(f"IMAGE_INACCURATE: {item_name}")
+            categories.append('IMAGE_INACCURATE')
         if desc_accurate == 'no':
-            do_log(f"DESC_INACCURATE: {item_name}")
+            categories.append('DESC_INACCURATE')
         if correct_item == 'no':
-            do_log(f"ITEM_INACCURATE: {item_name}")
+            categories.append('ITEM_INACCURATE')
         if good_image == 'no':
-            do_log(f"ALL_IMAGES_INACCURATE: {item_name}")
+            categories.append('ALL_IMAGES_INACCURATE')
+        for event in PROBLEMREPORTS.record(item_name, categories, owner=_known_items_owner()):
+            do_log(json.dumps(event))
 
         # Redirect to your desired URL
         return redirect(referrer)
@@ -826,7 +1572,7 @@ def problem():
     description = ITEMDB.items[item_name].description
 
     imagelist = []
-    for count,image in enumerate(ITEMDB.items[item_name].image):
+    for count,image in enumerate(item_images(item_name)):
         imagelist.append({'id': f"{count}", 'url': image['link']})
 
     return render_template("problem.html",
@@ -839,20 +1585,375 @@ def problem():
 
 
 
+####### ASSETS #######
+
+# The styles and scripts for the pages are built from assets/ into
+# fingerprinted, minified bundles in static/dist/ (see assetlib.py).
+# Templates use asset_url('game.css') to get the URL of the current one.
+
+# plain name -> built name, e.g. 'game.css' -> 'game.3f2a1b9c04.css'
+ASSETMANIFEST = {}
+
+def build_assets():
+    global ASSETMANIFEST
+    ASSETMANIFEST = assetlib.build_assets()
+
+
+def asset_url(name):
+    if not ASSETMANIFEST:
+        # Not built yet (e.g. create_app() wasn't called)
+        build_assets()
+    return url_for('asset', filename=ASSETMANIFEST[name])
+
+app.jinja_env.globals['asset_url'] = asset_url
+
+
+# A built bundle never changes (a new version gets a new name), so browsers
+# may keep it for a year without checking.
+ASSETMAXAGE = 365 * 24 * 60 * 60
+
+# The precompressed copies assetlib makes, best first
+ASSETENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+@app.route('/assets/<path:filename>')
+def asset(filename):
+    response = None
+    for encoding, suffix in ASSETENCODINGS:
+        if request.accept_encodings[encoding] and os.path.isfile(os.path.join(assetlib.DEFAULTDISTDIR, filename + suffix)):
+            response = send_from_directory(assetlib.DEFAULTDISTDIR, filename + suffix,
+                    mimetype=mimetypes.guess_type(filename)[0])
+            response.headers['Content-Encoding'] = encoding
+            break
+    if response is None:
+        response = send_from_directory(assetlib.DEFAULTDISTDIR, filename)
+
+    response.vary.add('Accept-Encoding')
+    # send_from_directory says no-cache by default
+    response.cache_control.no_cache = None
+    response.cache_control.public = True
+    response.cache_control.max_age = ASSETMAXAGE
+    response.cache_control.immutable = True
+    return response
+
+
+# Extra places to look for files under /static/.   main.py uses this to serve
+# the item images straight out of exampledatafiles/ instead of copying them.
+STATIC_FALLBACK_DIRS = []
+
+def add_static_fallback(directory):
+    """Serve /static/<filename> from directory when it isn't in static/."""
+    if directory in STATIC_FALLBACK_DIRS:
+        return
+
+    if not STATIC_FALLBACK_DIRS:
+        static_view = app.view_functions['static']
+
+        def static_with_fallback(filename):
+            if not os.path.isfile(os.path.join(app.static_folder, filename)):
+                for fallbackdir in STATIC_FALLBACK_DIRS:
+                    fallbackfile = safe_join(fallbackdir, filename)
+                    if fallbackfile and os.path.isfile(fallbackfile):
+                        return send_from_directory(fallbackdir, filename)
+            # the normal view (which also does the 404)
+            return static_view(filename=filename)
+
+        app.view_functions['static'] = static_with_fallback
+
+    STATIC_FALLBACK_DIRS.append(directory)
+
+
+####### COMPRESSION #######
+
+# Pages (and JSON) are gzipped / brotlied on the way out if the browser takes
+# it.   Images and the precompressed bundles are left alone.
+# FCTC_COMPRESS_MIN_SIZE is the smallest response worth compressing.
+COMPRESSION = compresslib.CompressionMiddleware(
+    app.wsgi_app, minsize=int(os.environ.get('FCTC_COMPRESS_MIN_SIZE', compresslib.DEFAULTMINSIZE)))
+app.wsgi_app = COMPRESSION
+
+
+####### METRICS #######
+
+# Each part of the server that keeps counters registers a function here that
+# returns them as a dict.   /metrics returns all of them as JSON.
+METRICSPROVIDERS = {}
+
+def register_metrics(name, func):
+    METRICSPROVIDERS[name] = func
+
+register_metrics('password_hashing', PASSWORDHASHER.stats)
+register_metrics('page_cache', page_cache_stats)
+register_metrics('compression', COMPRESSION.stats)
+register_metrics('login_migration', lambda: dict(LOGINMIGRATIONSTATS))
+register_metrics('progress_writes', PROGRESSWRITER.stats)
+register_metrics('rate_limits', RATELIMITER.stats)
+register_metrics('image_overlay', lambda: {'corrections': len(OVERLAY.preferences()), 'version': OVERLAY.version})
+
+@app.route('/metrics')
+def metrics():
+    return jsonify({name: func() for name, func in METRICSPROVIDERS.items()})
+
+
 def run_webserver(hostname="localhost", port=59722):
     # Start the Flask web server
     app.run(host=hostname, port=port)
 
 
+####### TEMPLATE WARMUP / READINESS #######
+
+# Compiled templates are also kept on disk, so a new process (or a restarted
+# one) can load them instead of compiling them again.
+TEMPLATECACHEDIR = os.getenv("FCTC_TEMPLATE_CACHE_DIR", os.path.join(app.instance_path, "jinja_cache"))
+
+# /readyz reports on each of these.   The instance is ready when all of them
+# are.   Each has 'ready', 'seconds' and maybe some details.
+READINESS_COMPONENTS = ('item_graph', 'stats', 'page_data', 'templates', 'database')
+READINESS_STATE = {}
+
+@contextmanager
+def readiness_component(name):
+    """Time the body of the with statement as warming up this component, and
+    mark it ready if it finishes."""
+    READINESS_STATE[name] = {'ready': False}
+    start = time.perf_counter()
+    yield READINESS_STATE[name]
+    READINESS_STATE[name]['seconds'] = time.perf_counter() - start
+    READINESS_STATE[name]['ready'] = True
+
+
+def is_ready():
+    return all(READINESS_STATE.get(name, {}).get('ready') for name in READINESS_COMPONENTS)
+
+
+def init_template_cache():
+    if app.jinja_env.bytecode_cache is None:
+        os.makedirs(TEMPLATECACHEDIR, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(TEMPLATECACHEDIR)
+
+
+def warmup_templates():
+    """Compile every template, then render /choose and a /game page so that
+    everything they use (filters, url building, etc.) has run once."""
+    with readiness_component('templates') as component:
+        init_template_cache()
+
+        templates = app.jinja_env.list_templates()
+        for name in templates:
+            app.jinja_env.get_template(name)
+
+        rendered = []
+        with app.test_request_context('/'):
+            # A made up guest, so nothing is looked up or saved for a real user
+            session['guest_id'] = 'warmup'
+            # and nothing for them to have made progress on
+            g.choose_progress = {}
+            render_template("choose.html", possibleitems=POSSIBLEITEMSTATS.values(), current_user=get_current_user())
+            rendered.append('choose.html')
+
+            if POSSIBLEITEMSTATS:
+                item = sorted(POSSIBLEITEMSTATS)[0]
+                USERSTATE.set_item('warmup', item, {})
+                try:
+                    page_data = _get_page_data(item, exploration_path=item)
+                    _render_game(item, item, page_data, [], set())
+                    rendered.append('game.html')
+                finally:
+                    USERSTATE.discard('warmup')
+
+        component['templates'] = len(templates)
+        component['rendered'] = rendered
+
+
+def warmup_page_data():
+    """Build the page data for every item the game can reach, by the path
+    the readiness index found to it (which is how most players get there)."""
+    with readiness_component('page_data') as component, app.test_request_context('/'):
+        paths = READINESS.paths if READINESS is not None else {}
+        for item, path in paths.items():
+            if getattr(ITEMDB.items[item], 'steps', None):
+                _get_page_data(item, exploration_path=path)
+        component['pages'] = len(PAGEDATACACHE)
+
+
+def warmup_database():
+    """Open a database connection now, rather than on the first request."""
+    with readiness_component('database'), app.app_context():
+        USERDB.session.execute(text("SELECT 1"))
+        USERDB.session.remove()
+
+
+@app.route('/healthz')
+def healthz():
+    """Liveness: the process is up and answering requests."""
+    return jsonify(status='ok')
+
+
+@app.route('/readyz')
+def readyz():
+    """Readiness: the item graph, stats, page data, templates and database
+    connection are all warm.   Includes how long each one took."""
+    ready = is_ready()
+    return jsonify(ready=ready, components=READINESS_STATE), 200 if ready else 503
+
+
 ####### LOGGING #######
 
 
 
+LOGFILE = None
+SUGGESTIONLOG = None
+
+# init_worker() reopens these after a fork, so remember what they were
+LOGFILENAME = "problems.log"
+SUGGESTIONLOGFILENAME = "suggestions.log"
+
 def do_log(logmessage):
     print(logmessage)
     LOGFILE.write(logmessage + "\n")
 
 
+# Problem reports from /problem are counted per item and kind of problem
+# (see problemreportlib.py).   Each worker adds its counts to a SQLite file
+# every FCTC_PROBLEM_FLUSH_SECONDS, so the worst items can be listed at once
+# rather than by grepping problems.log.
+PROBLEMREPORTS = problemreportlib.ProblemReports(
+    problemreportlib.ProblemCounts(os.getenv("FCTC_PROBLEM_DB", os.path.join(app.instance_path, "problem_counts.db"))),
+    flushinterval=float(os.getenv("FCTC_PROBLEM_FLUSH_SECONDS", 5)))
+register_metrics('problem_reports', PROBLEMREPORTS.stats)
+
+# The admin pages need "Authorization: Bearer <FCTC_ADMIN_TOKEN>".   Without
+# a token set, there are no admin pages.
+ADMINTOKEN = os.getenv("FCTC_ADMIN_TOKEN")
+
+def admin_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if not ADMINTOKEN:
+            return "Not found", 404
+        given = request.headers.get('Authorization', '')
+        if not secrets.compare_digest(given.encode('utf-8'), f"Bearer {ADMINTOKEN}".encode('utf-8')):
+            return "Forbidden", 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+@app.route('/admin/problems')
+@admin_required
+def admin_problems():
+    """The items with the most problem reports, e.g. ?n=20&category=DESC_INACCURATE"""
+    n = request.args.get('n', 20, type=int)
+    category = request.args.get('category') or None
+    if category is not None and category not in problemreportlib.CATEGORIES:
+        return jsonify(error=f"Unknown category: {category}"), 400
+    return jsonify(items=PROBLEMREPORTS.top(n, category))
+
+
+####### STARTUP #######
+
+# Startup is split in two so that gunicorn can preload the app.   The 
+# expensive, read only state (ITEMDB and the things derived from it) is built
+# once in the master process by prepare_shared_state().   Workers are then 
+# forked and share those memory pages copy-on-write.   Anything that must not
+# be shared across a fork (open files, database connections) is set up by 
+# init_worker(), which runs in each worker (see gunicorn.conf.py).
+
+def prepare_shared_state(itemdbfile="itemdb.json"):
+    """Load ITEMDB and build the tables derived from it.   Runs once, before
+    any workers are forked."""
+
+    # This "database" is read only for this program.
+    global ITEMDB
+    global READINESS
+    with readiness_component('item_graph') as component:
+        with startuplib.phase("load_itemdb"):
+            ITEMDB = fctcdb.ItemDB(itemdbfile)
+        with startuplib.phase("prevent_infinite_recursion"):
+            ITEMDB.prevent_infinite_recursion()
+        with startuplib.phase("readiness_index"):
+            READINESS = readinesslib.ReadinessIndex(ITEMDB)
+        component['items'] = len(ITEMDB.items)
+
+    with startuplib.phase("build_assets"):
+        build_assets()
+
+    # url_for needs a request context, even though nothing here depends on 
+    # the request itself.
+    global POSSIBLEITEMSTATS
+    POSSIBLEITEMSTATS = {}
+    with startuplib.phase("init_stats"), readiness_component('stats') as component, app.test_request_context():
+        init_stats_if_needed()
+        component['items'] = len(POSSIBLEITEMSTATS)
+
+    # Build the page data and compile the templates now rather than on each
+    # worker's first requests.   (Forked workers inherit both.)
+    with startuplib.phase("warmup_page_data"):
+        warmup_page_data()
+    with startuplib.phase("warmup_templates"):
+        warmup_templates()
+
+    # Move everything allocated so far into the permanent generation.   
+    # Otherwise the garbage collector in each worker writes to the object
+    # headers of the item graph, which un-shares the copy-on-write pages.
+    with startuplib.phase("gc_freeze"):
+        gc.collect()
+        gc.freeze()
+
+
+def init_worker(logfile=None, suggestionlog=None):
+    """Per-process setup: log files and database connections.   This is safe
+    to call again after a fork."""
+
+    global LOGFILENAME
+    global SUGGESTIONLOGFILENAME
+    if logfile:
+        LOGFILENAME = logfile
+    if suggestionlog:
+        SUGGESTIONLOGFILENAME = suggestionlog
+
+    # Log files are written by a thread each (so request threads don't share
+    # a file object).   If we inherited writers from the master, theirs is
+    # done with.
+    global LOGFILE
+    global SUGGESTIONLOG
+    for oldwriter in (LOGFILE, SUGGESTIONLOG):
+        if oldwriter is not None:
+            oldwriter.close()
+    with startuplib.phase("open_logs"):
+        LOGFILE = sharedstatelib.QueuedWriter(LOGFILENAME)
+        SUGGESTIONLOG = sharedstatelib.QueuedWriter(SUGGESTIONLOGFILENAME)
+
+    # Initialize user database.   Pooled connections must not be shared with
+    # the master, so drop them (without closing the master's copies).
+    with startuplib.phase("create_all"), app.app_context():
+        USERDB.engine.dispose(close=False)
+        PROGRESSWRITER.engine.dispose(close=False)
+        USERDB.create_all()
+
+    # Give every item an id for the known item bitsets.   This only adds rows
+    # the first time a new item shows up in ITEMDB.
+    with startuplib.phase("item_catalog"), app.app_context():
+        if ITEMDB is not None:
+            _ensure_item_ids(ITEMDB.items)
+
+    # Databases from before KnownItem keep known items by name in Item
+    with startuplib.phase("migrate_item_rows"), app.app_context():
+        migrate_item_rows()
+
+    with startuplib.phase("warmup_database"):
+        warmup_database()
+
+
+def create_app(logfile=None, suggestionlog=None):
+    """Application factory.   Prepares the shared state and initializes this
+    process as a worker.   When gunicorn preloads the app, this runs in the
+    master and each forked worker calls init_worker() again."""
+    prepare_shared_state()
+    if os.getenv("GOOGLE_OAUTH_CLIENT_ID"):
+        with startuplib.phase("init_oauth"):
+            init_oauth()
+    init_worker(logfile=logfile, suggestionlog=suggestionlog)
+    return app
+
+
 ####### MAIN / ARGUMENT PARSING #######
 
 
@@ -861,11 +1962,6 @@ import argparse
 def main(clouddeploy=False):
     VERSION = "1.0.0"
 
-    # This "database" is read only for this program.
-    global ITEMDB
-    ITEMDB = fctcdb.ItemDB("itemdb.json")
-    ITEMDB.prevent_infinite_recursion()
-
     if clouddeploy:
         # Use defaults without argument parsing
         logfile = "problems.log"
@@ -893,16 +1989,7 @@ def main(clouddeploy=False):
         ip = args.ip
         port = args.port
 
-    # Open log files
-    global LOGFILE
-    LOGFILE = open(logfile, "a+")
-
-    global SUGGESTIONLOG
-    SUGGESTIONLOG = open(suggestionlog, "a+")
-
-    # Initialize user database
-    with app.app_context():
-        USERDB.create_all()
+    create_app(logfile=logfile, suggestionlog=suggestionlog)
 
     # Run the web server, if I'm not in the cloud.   Otherwise gunicorn runs as
     # my web server.
@@ -0,0 +1,17 @@
+# gunicorn.conf.py
+# gunicorn reads this automatically from the working directory.
+
+# Import main:app once in the master, so the item database and the tables 
+# derived from it are built once and shared (copy-on-write) by every worker.
+preload_app = True
+
+# The shared state is thread safe (see sharedstatelib.py), so each worker can
+# serve several requests at once.   FCTC_THREADS=1 goes back to one at a time.
+import os
+threads = int(os.environ.get("FCTC_THREADS", 4))
+
+
+def post_fork(server, worker):
+    # Log files and database connections must not be shared across a fork.
+    import fromcavestocars
+    fromcavestocars.init_worker()
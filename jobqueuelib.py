@@ -0,0 +1,192 @@
+""" This library is the populator's work queue: one job per item to work out
+how to make, kept in a SQLite file so a populator that crashes (or is killed,
+or Ctrl-C'd) picks up where it left off next time.
+
+A job goes through these states:
+
+    pending  -> running  -> waiting  -> done
+                   |
+                   +-> pending (it failed; tried again up to maxattempts)
+                   +-> failed  (it failed too many times; retry_failed()
+                                puts it back to pending)
+
+A running job has been handed to a worker by claim().   When the worker has
+worked out the item's steps it calls finish() with the new items the steps
+need.   Those become jobs of their own, and the item waits (in "waiting")
+until they're all done, since an item isn't complete until everything under
+it is.   Then it's done, and so may be the items waiting on it.
+
+Jobs that were running when a populator died are just pending again
+(requeue_running()), so nothing needs to be rebuilt.
+
+    queue = JobQueue("populator.queue.db")
+    queue.add("car", userrequested=True)
+    for job in queue.claim(limit=10):
+        ...
+        queue.finish(job.item, [("wheel", "3500 BCE")])
+"""
+
+import collections
+import sqlite3
+import time
+
+STATES = ('pending', 'running', 'waiting', 'done', 'failed')
+
+Job = collections.namedtuple('Job', ['item', 'state', 'depth', 'agerestriction', 'userrequested', 'attempts', 'lasterror'])
+
+
+class JobQueue:
+
+    def __init__(self, filename, maxattempts=3, timeout=30.0):
+        self.filename = filename
+        self.maxattempts = maxattempts
+        self.connection = sqlite3.connect(filename, timeout=timeout, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS job ("
+                                "item TEXT PRIMARY KEY, "
+                                "state TEXT NOT NULL DEFAULT 'pending', "
+                                "depth INTEGER NOT NULL DEFAULT 0, "
+                                "agerestriction TEXT, "
+                                "userrequested INTEGER, "
+                                "attempts INTEGER NOT NULL DEFAULT 0, "
+                                "lasterror TEXT, "
+                                "updated REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS job_state ON job (state, depth, item)")
+        # item can't be done until dependson is
+        self.connection.execute("CREATE TABLE IF NOT EXISTS dependency ("
+                                "item TEXT NOT NULL, dependson TEXT NOT NULL, "
+                                "PRIMARY KEY (item, dependson))")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS dependency_dependson ON dependency (dependson)")
+
+    def _transaction(self):
+        return _Transaction(self.connection)
+
+    def add(self, item, agerestriction=None, userrequested=None, again=False):
+        """Queue item (a top level one, like something a user asked for).
+        If it's already queued this does nothing, unless again is set, which
+        starts it over (e.g. to rebuild it)."""
+        with self._transaction() as connection:
+            if again:
+                connection.execute("INSERT INTO job (item, agerestriction, userrequested, updated) VALUES (?, ?, ?, ?) "
+                                   "ON CONFLICT (item) DO UPDATE SET state = 'pending', depth = 0, attempts = 0, "
+                                   "lasterror = NULL, agerestriction = excluded.agerestriction, "
+                                   "userrequested = excluded.userrequested, updated = excluded.updated",
+                                   (item, agerestriction, userrequested, time.time()))
+                connection.execute("DELETE FROM dependency WHERE item = ?", (item,))
+            else:
+                connection.execute("INSERT OR IGNORE INTO job (item, agerestriction, userrequested, updated) VALUES (?, ?, ?, ?)",
+                                   (item, agerestriction, userrequested, time.time()))
+
+    def claim(self, limit=None):
+        """Take the next pending jobs to work on: the ones nearest the top of
+        the tree first, in order of item name (so the same jobs come out in
+        the same order every time)."""
+        with self._transaction() as connection:
+            row = connection.execute("SELECT MIN(depth) FROM job WHERE state = 'pending'").fetchone()
+            if row[0] is None:
+                return []
+            rows = connection.execute(f"SELECT {', '.join(Job._fields)} FROM job "
+                                      "WHERE state = 'pending' AND depth = ? ORDER BY item LIMIT ?",
+                                      (row[0], -1 if limit is None else limit)).fetchall()
+            connection.executemany("UPDATE job SET state = 'running', updated = ? WHERE item = ?",
+                                   [(time.time(), r[0]) for r in rows])
+        return [Job(*r)._replace(state='running') for r in rows]
+
+    def finish(self, item, children):
+        """item's steps are worked out, and need children ([(item, age
+        restriction)]) made.   Returns the items that are done because of
+        this (item itself, if it needs nothing new, and maybe the ones
+        waiting on it)."""
+        now = time.time()
+        with self._transaction() as connection:
+            depth = connection.execute("SELECT depth FROM job WHERE item = ?", (item,)).fetchone()[0]
+            for child, agerestriction in children:
+                connection.execute("INSERT OR IGNORE INTO job (item, depth, agerestriction, userrequested, updated) "
+                                   "VALUES (?, ?, ?, 0, ?)", (child, depth + 1, agerestriction, now))
+                connection.execute("INSERT OR IGNORE INTO dependency (item, dependson) VALUES (?, ?)", (item, child))
+            connection.execute("UPDATE job SET state = 'waiting', lasterror = NULL, updated = ? WHERE item = ?", (now, item))
+            return self._settle(connection, [item], now)
+
+    def _settle(self, connection, items, now):
+        """Mark waiting jobs in items done if everything they depend on is,
+        and so on up the tree."""
+        done = []
+        while items:
+            item = items.pop()
+            waiting = connection.execute("SELECT 1 FROM job WHERE item = ? AND state = 'waiting'", (item,)).fetchone()
+            if not waiting:
+                continue
+            unfinished = connection.execute("SELECT 1 FROM dependency JOIN job ON job.item = dependency.dependson "
+                                            "WHERE dependency.item = ? AND job.state != 'done' LIMIT 1", (item,)).fetchone()
+            if unfinished:
+                continue
+            connection.execute("UPDATE job SET state = 'done', updated = ? WHERE item = ?", (now, item))
+            done.append(item)
+            items += [r[0] for r in connection.execute("SELECT item FROM dependency WHERE dependson = ?", (item,))]
+        return done
+
+    def fail(self, item, error, retry=True):
+        """Working on item went wrong.   It's tried again later (up to
+        maxattempts times in all) unless retry is False.   Returns its new
+        state."""
+        with self._transaction() as connection:
+            attempts = connection.execute("SELECT attempts FROM job WHERE item = ?", (item,)).fetchone()[0] + 1
+            state = 'pending' if retry and attempts < self.maxattempts else 'failed'
+            connection.execute("UPDATE job SET state = ?, attempts = ?, lasterror = ?, updated = ? WHERE item = ?",
+                               (state, attempts, str(error), time.time(), item))
+        return state
+
+    def requeue(self, items, error):
+        """Put these running jobs back to pending without counting an attempt,
+        for when what went wrong wasn't down to them."""
+        with self._transaction() as connection:
+            connection.executemany("UPDATE job SET state = 'pending', lasterror = ?, updated = ? WHERE item = ? AND state = 'running'",
+                                   [(str(error), time.time(), item) for item in items])
+
+    def requeue_running(self):
+        """Jobs that were running when the last populator stopped go back to
+        pending.   (It didn't get to finish them, but that isn't their fault,
+        so it doesn't count as an attempt.)   Returns how many."""
+        with self._transaction() as connection:
+            return connection.execute("UPDATE job SET state = 'pending', updated = ? WHERE state = 'running'",
+                                      (time.time(),)).rowcount
+
+    def retry_failed(self):
+        """Give failed jobs another maxattempts tries.   Returns how many."""
+        with self._transaction() as connection:
+            return connection.execute("UPDATE job SET state = 'pending', attempts = 0, updated = ? WHERE state = 'failed'",
+                                      (time.time(),)).rowcount
+
+    def items(self, *states):
+        """The items with jobs in these states."""
+        return [r[0] for r in self.connection.execute(
+            f"SELECT item FROM job WHERE state IN ({','.join('?' * len(states))}) ORDER BY item", states)]
+
+    def get(self, item):
+        row = self.connection.execute(f"SELECT {', '.join(Job._fields)} FROM job WHERE item = ?", (item,)).fetchone()
+        return Job(*row) if row else None
+
+    def counts(self):
+        """{state: number of jobs}"""
+        counts = dict.fromkeys(STATES, 0)
+        counts.update(self.connection.execute("SELECT state, COUNT(*) FROM job GROUP BY state"))
+        return counts
+
+    def close(self):
+        self.connection.close()
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (or ROLLBACK if something goes wrong), so a
+    change to the queue happens completely or not at all."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+        return self.connection
+
+    def __exit__(self, exctype, exc, tb):
+        self.connection.execute("COMMIT" if exctype is None else "ROLLBACK")
+        return False
@@ -0,0 +1,101 @@
+""" This library keeps track of which items a user knows as a bitset.
+
+Every item gets a small integer id which never changes (the web app keeps
+them in its ItemCatalog table, so they survive itemdb.json being rebuilt).
+A user's known items are then one Python int with bit <id> set for each item
+they know.   That makes the common questions cheap:
+
+    do they know X?               bits >> id & 1
+    merge a guest into a user:    userbits | guestbits
+    how much of X's tree?         (bits & subtree_mask(X)).bit_count()
+
+and a set of known items can be stored as a short blob (to_blob / from_blob).
+"""
+
+
+def to_blob(bits):
+    """Store a bitset as little endian bytes."""
+    return bits.to_bytes((bits.bit_length() + 7) // 8, 'little')
+
+
+def from_blob(blob):
+    if not blob:
+        return 0
+    return int.from_bytes(blob, 'little')
+
+
+def subtree_names(itemdb, itemname):
+    """Every item (tools and raw materials, all the way down) that is needed
+    to make itemname.   Doesn't include itemname itself."""
+    seen = set()
+    tovisit = [itemname]
+    while tovisit:
+        item = tovisit.pop()
+        for step in getattr(itemdb.items[item], 'steps', None) or []:
+            for subitem in step['tools'] + step['raw_materials']:
+                if subitem not in seen and subitem in itemdb.items:
+                    seen.add(subitem)
+                    tovisit.append(subitem)
+    seen.discard(itemname)
+    return seen
+
+
+class ItemIds:
+    '''Maps item names to their ids and back.   Ids are assigned by whoever
+    owns the catalog (see add()); this just remembers them.'''
+
+    def __init__(self):
+        self.ids = {}
+        self.names = {}
+        self._subtreemasks = {}
+
+    def add(self, name, itemid):
+        self.ids[name] = itemid
+        self.names[itemid] = name
+        # a new id could belong in any of these
+        self._subtreemasks = {}
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.ids)
+
+    def bit(self, name):
+        return 1 << self.ids[name]
+
+    def knows(self, bits, name):
+        """Is name in the bitset?   Names without an id aren't known."""
+        itemid = self.ids.get(name)
+        return itemid is not None and (bits >> itemid) & 1 == 1
+
+    def mask(self, names):
+        """The bitset with these names in it (names without an id are
+        skipped)."""
+        bits = 0
+        for name in names:
+            if name in self.ids:
+                bits |= 1 << self.ids[name]
+        return bits
+
+    def to_names(self, bits):
+        """The set of names in a bitset."""
+        names = set()
+        while bits:
+            low = bits & -bits
+            names.add(self.names[low.bit_length() - 1])
+            bits ^= low
+        return names
+
+    def subtree_mask(self, itemdb, itemname):
+        """The bitset of everything needed to make itemname.   The item
+        database doesn't change while we're running, so these are kept."""
+        if itemname not in self._subtreemasks:
+            self._subtreemasks[itemname] = self.mask(subtree_names(itemdb, itemname))
+        return self._subtreemasks[itemname]
+
+    def subtree_progress(self, itemdb, bits, itemname):
+        """Returns (how many of the items needed for itemname are known,
+        how many there are)."""
+        mask = self.subtree_mask(itemdb, itemname)
+        return (bits & mask).bit_count(), mask.bit_count()
@@ -2,69 +2,75 @@
 # Entry point for the Flask application for buildpack deployment on Google Cloud
 
 import os
-import shutil
 
-# Path to the marker file indicating example data has been copied
-COPIED_MARKER = os.path.join(os.path.dirname(__file__), '.data_copied')
+# This comes first, so the phases below are timed from (nearly) the start
+import startuplib
 
-# Ensure fromcavestocars.main() logic always runs, regardless of entrypoint
-from fromcavestocars import main as run_app_main
+import datasynclib
 
-# Copy example data files to their target locations at startup
-def copy_example_data():
+with startuplib.phase("import fromcavestocars"):
+    import fromcavestocars
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+EXAMPLEDATA_ROOT = os.path.join(PROJECT_ROOT, 'exampledatafiles')
+
+# The item images are most of exampledatafiles/ (~130MB).   By default they
+# are served straight out of exampledatafiles/static/ instead of being copied.
+SERVE_IMAGES_FROM_SOURCE = os.environ.get("FCTC_SERVE_IMAGES_FROM_SOURCE", "1") != "0"
+
+# Sync example data files to their target locations at startup
+def sync_example_data():
     """
-    Recursively copy everything under exampledatafiles/ into the project root,
-    preserving directory structure. Skips if already copied.
+    Bring the project root up to date with exampledatafiles/, preserving
+    directory structure.   Only files that are missing or have changed 
+    upstream are copied (images are hard linked).   The user database is 
+    only copied if it is missing.
     """
-    # If marker exists, skip copying
-    if os.path.exists(COPIED_MARKER):
-        print("Example data already copied; skipping.")
+    if not os.path.exists(EXAMPLEDATA_ROOT):
         return
 
-    src_root = os.path.join(os.path.dirname(__file__), 'exampledatafiles')
-    dst_root = os.path.dirname(__file__)
-
-    if os.path.exists(src_root):
-        for root, dirs, files in os.walk(src_root):
-            rel_path = os.path.relpath(root, src_root)
-            target_dir = os.path.join(dst_root, rel_path)
-            os.makedirs(target_dir, exist_ok=True)
-            print(f"Copying files from {root} to {target_dir}")
-            for filename in files:
-                src_file = os.path.join(root, filename)
-                dst_file = os.path.join(target_dir, filename)
-                shutil.copy2(src_file, dst_file)
-
-        # Create marker file to indicate completion
-        try:
-            with open(COPIED_MARKER, 'w') as f:
-                f.write('copied')
-        except Exception as e:
-            print(f"Warning: could not write copy marker: {e}")
-
-# Pre-startup tasks: data copy and app-specific main logic
-
-def pre_startup():
-    # Copy files if not done
+    skip = ()
+    if SERVE_IMAGES_FROM_SOURCE:
+        skip = ('static/',)
+
+    stats = datasynclib.sync_tree(EXAMPLEDATA_ROOT, PROJECT_ROOT,
+            link_prefixes=('static/',),
+            skip_prefixes=skip,
+            copy_once_prefixes=('instance/',))
+    print(f"Synced example data: {datasynclib.format_stats(stats)}")
+
+    if SERVE_IMAGES_FROM_SOURCE:
+        fromcavestocars.add_static_fallback(os.path.join(EXAMPLEDATA_ROOT, 'static'))
+
+# Application factory: data copy and app-specific setup
+
+def create_app():
+    """
+    Sync the example data and build the Flask app.   When gunicorn
+    preloads the app (see gunicorn.conf.py) this only runs in the master 
+    process.   Each worker then runs fromcavestocars.init_worker() after it is 
+    forked.
+    """
+    # Copy files that are missing or out of date
     try:
-        copy_example_data()
+        with startuplib.phase("sync_example_data"):
+            sync_example_data()
     except Exception as e:
-        print(f"Warning: failed to copy example data files: {e}")
+        print(f"Warning: failed to sync example data files: {e}")
 
-    # Always run the application module's main() logic
     try:
-        run_app_main(clouddeploy=True)
+        fromcavestocars.create_app()
     except Exception as e:
-        print(f"Error in fromcavestocars.main(): {e}")
+        print(f"Error in fromcavestocars.create_app(): {e}")
 
-# Execute pre-startup before loading the Flask app
-pre_startup()
+    print(startuplib.report())
 
-# Import the Flask app instance from your application module
-from fromcavestocars import app
+    return fromcavestocars.app
+
+# gunicorn (and the buildpack's default entrypoint) looks for main:app
+app = create_app()
 
 if __name__ == "__main__":
     # When running locally, enable debug mode and listen on all interfaces
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port, debug=True)
-
@@ -11,6 +11,10 @@ import openai
 # for (de-)serializing data so that I don't redo all queries, all the time.
 import json
 
+# for doing many queries at once (see do_query_async and QueryLimiter)
+import asyncio
+import time
+
 
 DEFAULTCACHEFILE = "openai.cache.json"
 
@@ -58,6 +62,10 @@ class OpenAIQuery:
 
         self.model = model
 
+        # The async client is tied to the event loop it was made in
+        self._asyncclient = None
+        self._asyncclientloop = None
+
 
     def empty_cache(self):
         """ Empty out the cache.   Does not write the cache to disk or enable/
@@ -139,14 +147,7 @@ class OpenAIQuery:
             ]
         )
 
-        if len(completion.choices) != 1:
-            # I think this should happen because the examples seem to imply it will.
-            print(transmittedquery,"Did not get exactly 1 choice, as expected:",completion.choices)
-
-        if completion.choices[0].finish_reason != "stop":
-            print(transmittedquery,"Finished because of '"+completion.choices[0].finish_reason+"'.")
-
-        result = completion.choices[0].message.content
+        result = _get_completion_result(transmittedquery, completion)
 
         if self.updatecache:
             self.cache['raw'][querystring] = result
@@ -156,6 +157,47 @@ class OpenAIQuery:
         return result
 
 
+    async def do_query_async(self, querystring, optionalprefix = '', limiter = None):
+        """ The same as do_query, but many of these can be waiting on OpenAI
+        at once (with asyncio.gather, etc.).   If a limiter (a QueryLimiter)
+        is given, it decides how many run at once and how fast.
+
+        This updates the cache, but doesn't write it to disk, since writing
+        the whole cache after each query would hold up all the others.   The
+        caller should call write_cache_to_disk() now and then."""
+
+        if self.checkcache and querystring in self.cache['raw']:
+            return self.cache['raw'][querystring]
+
+        loop = asyncio.get_running_loop()
+        if self._asyncclientloop is not loop:
+            self._asyncclient = openai.AsyncOpenAI()
+            self._asyncclientloop = loop
+
+        transmittedquery = optionalprefix + querystring
+
+        estimate = estimate_tokens(transmittedquery)
+        if limiter:
+            await limiter.acquire(estimate)
+        completion = None
+        try:
+            completion = await self._asyncclient.chat.completions.create(
+                model=self.model,
+                messages=[{ "role": "user", "content": transmittedquery }]
+            )
+        finally:
+            if limiter:
+                used = completion.usage.total_tokens if completion is not None and completion.usage else estimate
+                limiter.release(estimate, used)
+
+        result = _get_completion_result(transmittedquery, completion)
+
+        if self.updatecache:
+            self.cache['raw'][querystring] = result
+
+        return result
+
+
 
     def do_query_with_list_arguments(self, querystring, listofitems, optionalprefix =''):
         """ Used to do an OpenAI query which ends with a list.   For example,
@@ -175,6 +217,44 @@ class OpenAIQuery:
 
         I wrote this by hand."""
 
+        retdict, batches = self._plan_list_query(querystring, listofitems)
+
+        for itemstoquery in batches:
+            # I'm assuming I can separate things by a comma and a space and 
+            # this is fine.   I will double quote them so that this is less 
+            # ambiguous
+            result = self.do_query(querystring+" "+join_with_quotes_and_commas(itemstoquery), optionalprefix)
+
+            self._store_list_result(querystring, itemstoquery, result, retdict)
+
+            # flush if needed...
+            if self.updatecache and self.autoflushcache:
+                self.write_cache_to_disk()
+
+        return retdict
+
+
+    async def do_query_with_list_arguments_async(self, querystring, listofitems, optionalprefix ='', limiter = None):
+        """ The same as do_query_with_list_arguments, but the batches are
+        queried at once (see do_query_async).   The result doesn't depend on
+        which batch comes back first."""
+
+        retdict, batches = self._plan_list_query(querystring, listofitems)
+
+        results = await asyncio.gather(*[
+            self.do_query_async(querystring+" "+join_with_quotes_and_commas(itemstoquery), optionalprefix, limiter)
+            for itemstoquery in batches])
+
+        for itemstoquery, result in zip(batches, results):
+            self._store_list_result(querystring, itemstoquery, result, retdict)
+
+        return retdict
+
+
+    def _plan_list_query(self, querystring, listofitems):
+        """ Works out what a list query needs to ask.   Returns the answers
+        we already know (as a dict) and the batches of items to ask about."""
+
         retdict = {}
 
         itemstoquery = listofitems[:]
@@ -190,44 +270,30 @@ class OpenAIQuery:
                 itemstoquery.remove(item)
                 retdict[item] = self.cache['list'][item][querystring]
 
-        # exit if there is nothing to do...
-        if not itemstoquery:
-            return retdict
+        global MAX_ITEMS_PER_QUERY
+        batches = [itemstoquery[start:start+MAX_ITEMS_PER_QUERY]
+                   for start in range(0, len(itemstoquery), MAX_ITEMS_PER_QUERY)]
 
-        totalitemstoquery = itemstoquery
+        return retdict, batches
 
-        while totalitemstoquery:
 
-            global MAX_ITEMS_PER_QUERY
-            # figure out this query and get the next set
-            itemstoquery = totalitemstoquery[:MAX_ITEMS_PER_QUERY]
-            # remove the items we're about to use...
-            totalitemstoquery = totalitemstoquery[MAX_ITEMS_PER_QUERY:]
+    def _store_list_result(self, querystring, itemstoquery, result, retdict):
+        """ Parse the answer to one batch of a list query into retdict (and
+        the cache)."""
 
-            # otherwise query!   I'm assuming I can separate things by a comma
-            # and a space and this is fine.   I will double quote them so that 
-            # this is less ambiguous
-            result = self.do_query(querystring+" "+join_with_quotes_and_commas(itemstoquery), optionalprefix)
-
-            for item in itemstoquery:
-                # this is really where the magic (and the pain) is at.   This
-                # likely will need to be rethought several times...
-                thisresult = _do_result_parsing_for_list(item, result)
-
-                # update the cache, if desired...
-                if self.updatecache:
-                    if item not in self.cache['list']:
-                        self.cache['list'][item] = {}
-
-                    self.cache['list'][item][querystring] = thisresult
-                    
-                retdict[item] = thisresult
+        for item in itemstoquery:
+            # this is really where the magic (and the pain) is at.   This
+            # likely will need to be rethought several times...
+            thisresult = _do_result_parsing_for_list(item, result)
 
-            # flush if needed...
-            if self.updatecache and self.autoflushcache:
-                self.write_cache_to_disk()
+            # update the cache, if desired...
+            if self.updatecache:
+                if item not in self.cache['list']:
+                    self.cache['list'][item] = {}
 
-        return retdict
+                self.cache['list'][item][querystring] = thisresult
+                
+            retdict[item] = thisresult
 
 
     def do_query_which_returns_unambiguous_ordered_list(self, querystring, optionalprefix =''):
@@ -356,6 +422,82 @@ class OpenAIQuery:
 
 
 
+def _get_completion_result(transmittedquery, completion):
+    """ The text of a completion (complaining if it looks odd)."""
+
+    if len(completion.choices) != 1:
+        # I think this should happen because the examples seem to imply it will.
+        print(transmittedquery,"Did not get exactly 1 choice, as expected:",completion.choices)
+
+    if completion.choices[0].finish_reason != "stop":
+        print(transmittedquery,"Finished because of '"+completion.choices[0].finish_reason+"'.")
+
+    return completion.choices[0].message.content
+
+
+# A rough guess at how many tokens a query will use: about 4 characters a
+# token for the question, plus room for the answer (and the reasoning the
+# model does before it).   It's corrected with the real count afterwards.
+RESPONSETOKENESTIMATE = 1000
+
+def estimate_tokens(querystring):
+    return len(querystring) // 4 + RESPONSETOKENESTIMATE
+
+
+class QueryLimiter:
+    """ Limits the async queries: at most concurrency at once, and (if 
+    tokensperminute is set) no more than that many tokens a minute, as a 
+    token bucket that holds a minute's worth.   A query takes its estimated
+    tokens before it starts and settles up with the real count when done."""
+
+    def __init__(self, concurrency=8, tokensperminute=None, clock=time.monotonic):
+        self.concurrency = concurrency
+        self.tokensperminute = tokensperminute
+        self.clock = clock
+        self._semaphore = None
+        self._semaphoreloop = None
+        self._tokens = tokensperminute
+        self._updated = clock()
+        self.queries = 0
+        self.tokensused = 0
+        self.waitseconds = 0.0
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.tokensperminute, self._tokens + (now - self._updated) * self.tokensperminute / 60)
+        self._updated = now
+
+    async def acquire(self, estimate):
+        loop = asyncio.get_running_loop()
+        if self._semaphoreloop is not loop:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+            self._semaphoreloop = loop
+        started = self.clock()
+        await self._semaphore.acquire()
+        if self.tokensperminute:
+            # A query bigger than the whole bucket waits for a full one
+            needed = min(estimate, self.tokensperminute)
+            try:
+                self._refill()
+                while self._tokens < needed:
+                    await asyncio.sleep((needed - self._tokens) * 60 / self.tokensperminute)
+                    self._refill()
+            except BaseException:
+                # e.g. cancelled while waiting: it never got to run, so
+                # nobody will release() its slot
+                self._semaphore.release()
+                raise
+            self._tokens -= estimate
+        self.waitseconds += self.clock() - started
+
+    def release(self, estimate, used):
+        if self.tokensperminute:
+            self._tokens += estimate - used
+        self.queries += 1
+        self.tokensused += used
+        self._semaphore.release()
+
+
 def _do_result_parsing_for_list(target, result):
     """ Looks for a target in the result output.   Can be used to parse
     or re-parse a result for this purpose.
@@ -0,0 +1,166 @@
+""" This library keeps the image corrections people make on /problem in a
+small overlay file, instead of rewriting itemdb.json.
+
+Saving all of itemdb.json on every correction was slow (and slower as the
+database grew), and only the worker that handled the request saw the change.
+Now a correction is one line appended to the overlay:
+
+    {"item": "wood", "image": "https://.../wood2.jpg", "time": 1700000000.0}
+
+Every worker reads the lines it hasn't seen yet (at most every couple of
+seconds, and straight away after its own), so they all agree on the picture
+to show.   When an item has several lines, the last one wins.   ItemDB isn't
+changed: apply() puts the preferred image first in the list when it's read.
+
+Now and then (I do it on deploy, before the workers start) the overlay is
+folded into itemdb.json and emptied:
+
+    python overlaylib.py --itemdb itemdb.json --overlay image_overlay.jsonl
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+
+
+class ImageOverlay:
+
+    def __init__(self, filename, refreshinterval=2.0):
+        self.filename = filename
+        self.refreshinterval = refreshinterval
+        self._lock = threading.Lock()
+        self._preferred = {}         # item name -> preferred image link
+        self._offset = 0             # how much of the file has been read
+        self._generation = 0         # bumped when the file is folded / replaced
+        self._lastrefresh = None
+
+    def _reset(self):
+        self._preferred = {}
+        self._offset = 0
+        self._generation += 1
+
+    def refresh(self, force=False):
+        """Read any lines other workers (or we) added since last time."""
+        with self._lock:
+            now = time.monotonic()
+            if not force and self._lastrefresh is not None and now - self._lastrefresh < self.refreshinterval:
+                return
+            self._lastrefresh = now
+            try:
+                size = os.path.getsize(self.filename)
+            except FileNotFoundError:
+                size = 0
+            if size < self._offset:
+                # It was folded into the database and started again
+                self._reset()
+            if size == self._offset:
+                return
+            with open(self.filename, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read(size - self._offset)
+            # A line that's still being written is left for next time
+            end = data.rfind(b'\n') + 1
+            for line in data[:end].splitlines():
+                try:
+                    entry = json.loads(line)
+                    self._preferred[entry['item']] = entry['image']
+                except (ValueError, KeyError, TypeError):
+                    continue
+            self._offset += end
+
+    @property
+    def version(self):
+        """Changes whenever the corrections do, so it can go in cache keys."""
+        self.refresh()
+        with self._lock:
+            return f"{self._generation}.{self._offset}"
+
+    def links(self, names, preferences=None):
+        """The preferred links for these items (None for ones without a
+        correction), from preferences (a dict from preferences()) if given.
+        Something cached from these items' images is stale if this changes."""
+        if preferences is None:
+            self.refresh()
+            with self._lock:
+                return tuple(self._preferred.get(name) for name in names)
+        return tuple(preferences.get(name) for name in names)
+
+    def preferences(self):
+        """{item name: preferred image link}"""
+        with self._lock:
+            return dict(self._preferred)
+
+    def apply(self, item_name, images):
+        """images (an item's image list) with the preferred one first.   The
+        list passed in isn't changed."""
+        with self._lock:
+            link = self._preferred.get(item_name)
+        if link is None or not images or images[0]['link'] == link:
+            return images
+        for count, image in enumerate(images):
+            if image['link'] == link:
+                return [image] + images[:count] + images[count + 1:]
+        # That image isn't one of the item's any more
+        return images
+
+    def prefer(self, item_name, link):
+        """Record that link is the right picture for item_name."""
+        line = json.dumps({'item': item_name, 'image': link, 'time': time.time()}) + '\n'
+        # One write to a file opened for appending, so lines from different
+        # workers don't get mixed up.
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line.encode('utf-8'))
+        finally:
+            os.close(fd)
+        self.refresh(force=True)
+
+    def fold(self, itemdb):
+        """Put the preferred images first in itemdb's items.   Returns how
+        many items changed."""
+        self.refresh(force=True)
+        changed = 0
+        for item_name in self.preferences():
+            item = itemdb.items.get(item_name)
+            images = getattr(item, 'image', None)
+            if not images:
+                continue
+            newimages = self.apply(item_name, images)
+            if newimages is not images:
+                item.image = newimages
+                changed += 1
+        return changed
+
+
+def fold_overlay(itemdbfile, overlayfile):
+    """Fold overlayfile into itemdbfile and remove it.   Returns how many
+    items changed."""
+    import fctcdb
+
+    if not os.path.exists(overlayfile):
+        return 0
+    # Move it aside first, so corrections made while we're folding go into a
+    # new overlay rather than being lost.
+    folding = overlayfile + '.folding'
+    os.replace(overlayfile, folding)
+    itemdb = fctcdb.ItemDB(itemdbfile)
+    changed = ImageOverlay(folding).fold(itemdb)
+    if changed:
+        itemdb.save()
+    os.remove(folding)
+    return changed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold the /problem image corrections into the item database")
+    parser.add_argument("--itemdb", default="itemdb.json", help="Item database to update")
+    parser.add_argument("--overlay", default="image_overlay.jsonl", help="Overlay of image corrections")
+    args = parser.parse_args()
+    changed = fold_overlay(args.itemdb, args.overlay)
+    print(f"{changed} items changed")
+
+
+if __name__ == '__main__':
+    main()
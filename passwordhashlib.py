@@ -0,0 +1,101 @@
+""" This library runs password hashing on a small, bounded pool of threads.
+
+Hashing a password (pbkdf2) is deliberately slow.   If every request thread
+did it inline, a burst of registrations / logins would tie up all of them
+and cheap requests (/game, /drop) would queue up behind.   Instead, at most
+`workers` hashes run at once, at most `maxqueue` more can wait, and anything
+beyond that is refused straight away with HashPoolBusy, which the web app
+turns into a 503.
+
+The hashes are normal werkzeug hashes, so existing ones still check.
+"""
+
+import concurrent.futures
+import os
+import threading
+import time
+
+from werkzeug.security import generate_password_hash, check_password_hash
+
+HASHMETHOD = 'pbkdf2:sha256'
+SALTLENGTH = 16
+
+
+class HashPoolBusy(Exception):
+    """Raised when too many hashes are already running / waiting."""
+
+
+class HashPool:
+
+    def __init__(self, workers=2, maxqueue=16):
+        self.workers = workers
+        self.maxqueue = maxqueue
+
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+        self.pending = 0            # running + waiting right now
+        self.maxpending = 0         # the most there have ever been
+        self.completed = 0
+        self.rejected = 0
+        self.waitseconds = 0.0      # time spent queued, summed
+        self.hashseconds = 0.0      # time spent hashing, summed
+
+    def _get_executor(self):
+        # The threads are started on first use, and again in a forked child
+        # (gunicorn preloads the app, and threads don't survive a fork).
+        if self._executor is None or self._pid != os.getpid():
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="fctc-hash")
+            self._pid = os.getpid()
+        return self._executor
+
+    def _timed(self, queuedat, func, *args):
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            finished = time.perf_counter()
+            with self._lock:
+                self.waitseconds += started - queuedat
+                self.hashseconds += finished - started
+
+    def run(self, func, *args):
+        """Run func(*args) on the pool and wait for the result.   Raises
+        HashPoolBusy if the pool and its queue are full."""
+        with self._lock:
+            if self.pending >= self.workers + self.maxqueue:
+                self.rejected += 1
+                raise HashPoolBusy(f"{self.pending} password hashes already in progress")
+            self.pending += 1
+            self.maxpending = max(self.maxpending, self.pending)
+            executor = self._get_executor()
+
+        try:
+            future = executor.submit(self._timed, time.perf_counter(), func, *args)
+            return future.result()
+        finally:
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+
+    def hash(self, password):
+        return self.run(generate_password_hash, password, HASHMETHOD, SALTLENGTH)
+
+    def check(self, pwhash, password):
+        return self.run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'maxqueue': self.maxqueue,
+                'pending': self.pending,
+                'queued': max(0, self.pending - self.workers),
+                'maxpending': self.maxpending,
+                'completed': self.completed,
+                'rejected': self.rejected,
+                'avgwaitseconds': self.waitseconds / self.completed if self.completed else 0.0,
+                'avghashseconds': self.hashseconds / self.completed if self.completed else 0.0,
+            }
@@ -2,7 +2,8 @@
 """
 The main thing this library does is when given an item, figure out the 
 raw materials and tools / equipment needed to make it.   
-This works recursively.
+This works down the tree of things needed to make it, a level at a time, 
+from a job queue kept on disk (see run_job_queue).
 
 This is effectively an intermediary between the OpenAI API (which is quite
 general).  This library contains a bunch of the From Caves To Cars specific 
@@ -99,18 +100,27 @@ import describelib
 
 DESCRIBER = None
 
+import problemreportlib
+# which items people on the web site said are wrong (see --problems)
+
 def _describe_item_helper(item):
-    if DESCRIBER is None:
+    if not _needs_description(item):
         return
+
+    # get this item
+    DESCRIBER.describe_item(item)
+
+
+def _needs_description(item):
+    if DESCRIBER is None:
+        return False
     if item not in ITEMDB.items:
         # I don't know this
-        return
+        return False
     if hasattr(ITEMDB.items[item],'description') and ITEMDB.items[item].description != "":
         # I already know this
-        return
-
-    # get this item
-    DESCRIBER.describe_item(item)
+        return False
+    return True
 
 
 def _get_pretty_item_list(itemlist):
@@ -143,7 +153,17 @@ def _get_simple_list(query):
     In the future, I'll do something more advanced and support these types of
     items."""
 
-    rawresult = OAIQ.do_query(query)
+    return _parse_simple_list(OAIQ.do_query(query))
+
+
+async def _get_simple_list_async(query, limiter=None):
+    """ _get_simple_list, but it can run alongside other queries."""
+
+    return _parse_simple_list(await OAIQ.do_query_async(query, limiter=limiter))
+
+
+def _parse_simple_list(rawresult):
+    """ Turns the answer to a list query into a list (see _get_simple_list)"""
 
     sanitizedlistresult = openaiquerylib.sanitize_list_output(rawresult)
 
@@ -213,10 +233,19 @@ def is_younger(year1: str, year2: str) -> bool:
 def get_item_age(item):
     """ This returns an estimated age for an item"""
 
-    querystring = '''Roughly what year was the first human made "'''+item+'''" created?   Only list a year and do not list a range.  Use the year according to the Gregorian calendar and append AD or BCE.  For example: 
+    return OAIQ.do_query(item_age_query(item))
+
+
+async def get_item_age_async(item, limiter=None):
+    return await OAIQ.do_query_async(item_age_query(item), limiter=limiter)
+
+
+# These build the queries (so the same query can be done right away or
+# alongside others, see populate_wave)
+
+def item_age_query(item):
+    return '''Roughly what year was the first human made "'''+item+'''" created?   Only list a year and do not list a range.  Use the year according to the Gregorian calendar and append AD or BCE.  For example: 
 4000 BCE'''
-    result = OAIQ.do_query(querystring)
-    return result
 
 
 def age_statement(agerestriction=None):
@@ -227,6 +256,18 @@ def age_statement(agerestriction=None):
 
 def get_steps_needed_to_make_item(item,agerestriction=None):
     """ gets the steps only needed to make an item."""
+    return _get_simple_list(steps_query(item,agerestriction))
+
+
+def get_tools_needed_for_step(step,item,agerestriction=None):
+    return _get_simple_list(tools_query(step,item,agerestriction))
+
+
+def get_raw_materials_needed_for_step(step,tool,item, agerestriction=None):
+    return _get_simple_list(raw_materials_query(step,tool,item,agerestriction))
+
+
+def steps_query(item,agerestriction=None):
 #    querystring = '''What are the steps needed for a human to directly make or acquire '''+item+'''?   give a complete list.   Do not list any raw materials, tools/equipment, energy sources, knowledge/skills, or time requirements.   The output should list the step number (in order) and then the step name, with each step on a new line.  If a step is optional add "- optional" to that line.   For example, if asked to give the steps to make a sandwich, you might reply: "1. Gather Ingredients
 #2. Prepare Work Area
 #3. Slice Bread
@@ -239,10 +280,10 @@ def get_steps_needed_to_make_item(item,agerestriction=None):
 
     querystring = f'''What are the steps needed for a human to directly make or acquire a primitive "{item}" - meaning the item absolutely cannot be made without this step?   give a complete list.   Do not list any raw materials, tools/equipment, energy sources, knowledge/skills, or time requirements.   Do not list any optional steps.   Use the bare minimum steps necessary.   Avoid adjectives unless necessary.   State the name of a step simply, without using any parenthesis or dashes.   Use the simplest set of steps possible, as this item could have been made using the most primitive tools possible. {age_statement(agerestriction)} The output should list the step number (in order) and then the step name, with each step on a new line.''' 
 
-    return _get_simple_list(querystring)
+    return querystring
 
 
-def get_tools_needed_for_step(step,item,agerestriction=None):
+def tools_query(step,item,agerestriction=None):
 #    querystring = '''For step '''+step+''' needed to make '''+item+''', what are the tools/equipment needed?   Give a complete list.   Do not list any raw materials, energy sources, knowledge/skills, or time requirements.   The output should list each tool on a separate line.  If a step is optional add "- optional" to that line. For example, if asked to give the tools/equipment to slice bread as part of making a sandwich, you might reply: "1. Bread Knife
 #2. Cutting Board
 #3. Bread Slicing Guide - optional
@@ -251,13 +292,13 @@ def get_tools_needed_for_step(step,item,agerestriction=None):
 #    querystring = '''For step '''+step+''' needed to make '''+item+''', what are the tools/equipment needed?   Give a complete list.   Do not list any raw materials, energy sources, knowledge/skills, or time requirements.   Do not list any optional tools.  Use the bare minimum tools, if any.  If a step can be done wihout tools, do not list any tools.   Avoid adjectives unless needed.   State the name of each tool simply, without using any parenthesis or dashes.  Make sure each tool is a primitive version made from primitive components.  '''+age_statement(agerestriction)+''' The output should list each tool on a separate line. For example, if asked to give the tools/equipment to slice bread as part of making a sandwich, you might reply: "1. Bread Knife
 #2. Cutting Board'''
 
-    return _get_simple_list(querystring)
+    return querystring
 
 
-def get_raw_materials_needed_for_step(step,tool,item, agerestriction=None):
+def raw_materials_query(step,tool,item, agerestriction=None):
     querystring = '''When using tool "'''+tool+'''" with step "'''+step+'''" needed to make "'''+item+'''", what raw materials are needed?   Give a complete list.   Do not list any tools/equipment, energy sources, knowledge/skills, or time requirements.   Do not list any optional raw materials. Use the bare minimum raw materials, if any.  Avoid adjectives unless needed.  State the name of each raw material simply, without using any parenthesis or dashes.  Each raw material should be the simplest item one could use to make this, as would have been used the first time this raw material was used. '''+age_statement(agerestriction)+''' The output should list each raw material on a separate line.  Do not list raw materials used in other steps.  For example, if asked "when using tool Knife with step Slice Bread needed to make a sandwich", you might reply: "Bread"'''
 
-    return _get_simple_list(querystring)
+    return querystring
 
 
 def _true_false_omitted_helper(itemlist,result):
@@ -288,6 +329,16 @@ def _true_false_omitted_helper(itemlist,result):
 
     return truelist,falselist,omittedlist
 
+# (question, the instructions that go before it) for the list queries
+NATURALQUERY = ('''Which of the following are natural items?''','''Please list one item per line and respond with True or False for each item.   If the item is not a natural item, please list it. For example:
+"car port" False
+"wood" True''')
+
+PARTOFLARGERQUERY = ('''Which of the following are parts of a larger item?''','''Please list one item per line and respond with True or False for each item.   If the item is not a part of a larger item, please list it. For example:
+"car door" True
+"branch" True
+"wood" False''')
+
 def are_items_natural(itemlist):
     """ This function returns the non-natural items from a list of items.
     A non-natural item is something that is made by humans.   For example,
@@ -296,9 +347,7 @@ def are_items_natural(itemlist):
     and the second list is the items that are not natural.  The final list 
     is the items that were omitted."""
 
-    result = OAIQ.do_query_with_list_arguments('''Which of the following are natural items?''',itemlist,'''Please list one item per line and respond with True or False for each item.   If the item is not a natural item, please list it. For example:
-"car port" False
-"wood" True''')
+    result = OAIQ.do_query_with_list_arguments(NATURALQUERY[0],itemlist,NATURALQUERY[1])
 
     return _true_false_omitted_helper(itemlist,result)
 
@@ -310,14 +359,22 @@ def are_items_part_of_a_larger_item(itemlist):
     first list is the items that are derived and the second list is the items 
     that are not derived.  The final list is the items that were omitted"""
 
-    result = OAIQ.do_query_with_list_arguments('''Which of the following are parts of a larger item?''',itemlist,'''Please list one item per line and respond with True or False for each item.   If the item is not a part of a larger item, please list it. For example:
-"car door" True
-"branch" True
-"wood" False''')
+    result = OAIQ.do_query_with_list_arguments(PARTOFLARGERQUERY[0],itemlist,PARTOFLARGERQUERY[1])
 
     return _true_false_omitted_helper(itemlist,result)
 
 
+async def classify_items_async(itemlist, limiter=None):
+    """ are_items_part_of_a_larger_item and are_items_natural, asked at
+    the same time. """
+
+    larger, natural = await asyncio.gather(
+        OAIQ.do_query_with_list_arguments_async(PARTOFLARGERQUERY[0],itemlist,PARTOFLARGERQUERY[1],limiter=limiter),
+        OAIQ.do_query_with_list_arguments_async(NATURALQUERY[0],itemlist,NATURALQUERY[1],limiter=limiter))
+
+    return _true_false_omitted_helper(itemlist,larger), _true_false_omitted_helper(itemlist,natural)
+
+
 # TODO: refactor tool information into a separate module / class
 import json
 
@@ -423,7 +480,9 @@ def standardize_polyonymous_tooldict(tools):
 
 
     for tool in tools:
-        it = iter(KNOWNTOOLS)
+        # (sorted, so the same tools are asked about in the same batches 
+        # every time)
+        it = iter(sorted(KNOWNTOOLS))
         while True:
             batch = list(itertools.islice(it, MAXKNOWNTOOLSPERSTEP))
 
@@ -461,6 +520,15 @@ def _create_items_helper(itemlist):
     to unknown.   This is used to create items that are not in the database.
     """
 
+    list_to_make = _add_new_items(itemlist)
+
+    return _classify_new_items(list_to_make, are_items_part_of_a_larger_item(list_to_make), are_items_natural(list_to_make))
+
+
+def _add_new_items(itemlist):
+    """ Adds the items that need to be worked on to the database (replacing
+    any that were half done) and returns them."""
+
     # let's track which items we need to work on.   Items in the database don't
     # need to be worked on.
     list_to_make = []
@@ -475,8 +543,15 @@ def _create_items_helper(itemlist):
             ITEMDB.items[item].status = "Need to process"
             list_to_make.append(item)
 
-    
-    tlist, flist, olist = are_items_part_of_a_larger_item(list_to_make)
+    return list_to_make
+
+
+def _classify_new_items(list_to_make, larger, natural, describe=True):
+    """ Records what are_items_part_of_a_larger_item (larger) and 
+    are_items_natural (natural) said about the new items.   Base items are
+    done after this.   Returns the items that still need to be made."""
+
+    tlist, flist, olist = larger
 
     for item in list_to_make:
         if item in tlist:
@@ -489,7 +564,7 @@ def _create_items_helper(itemlist):
         else:
             raise ValueError(f"Item {item} isn't part of a larger item or not.")
     
-    tlist, flist, olist = are_items_natural(list_to_make)
+    tlist, flist, olist = natural
     for item in list_to_make:
         if item in tlist:
             ITEMDB.items[item].is_natural = True
@@ -511,7 +586,8 @@ def _create_items_helper(itemlist):
             ITEMDB.items[item].user_requested = False
             write_verbose_output(Fore.YELLOW+f"    {item} is a base item."+Fore.RESET,loglevel=1)
             # I may need to describe this...
-            _describe_item_helper(item)
+            if describe:
+                _describe_item_helper(item)
         else:
             ITEMDB.items[item].status = "Need to process"
             retlist.append(item)
@@ -522,22 +598,57 @@ def _create_items_helper(itemlist):
 
 
 def query_how_to_make_item(querystring,userrequested):
-    """ This figures out how to make an item.   It will use a recursive helper
-    function to figure this out for items beneath it.
+    """ This figures out how to make an item, and the items beneath it.
     Set userrequested to None if you don't want to alter an existing element
     (if it exists).  Otherwise, you'll overwrite the userrequested field"""
 
+    query_how_to_make_items([querystring],userrequested)
+
+
+def query_how_to_make_items(querystrings,userrequested):
+    """ query_how_to_make_item for several items.   They're added to the job
+    queue (see get_job_queue) and worked on, with everything under them, by
+    run_job_queue."""
+
+    queue = get_job_queue()
+    roots = []
+    for querystring in querystrings:
+        job = queue.get(querystring)
+        if job is not None and job.state in UNFINISHEDJOBSTATES:
+            # A populator that stopped part way through was on this.   It'll
+            # pick up where it was.
+            write_verbose_output(Fore.CYAN+f"{querystring} is already queued."+Fore.RESET,loglevel=1)
+            continue
+        needed, estimated_age = _prepare_item_query(querystring,userrequested)
+        if needed:
+            roots.append((querystring,estimated_age))
+
+    # The items have to be in itemdb.json before the queue says to make them
+    ITEMDB.save()
+    for querystring, estimated_age in roots:
+        queue.add(querystring, agerestriction=estimated_age, userrequested=userrequested, again=True)
+
+    run_job_queue()
+
+
+def _prepare_item_query(querystring,userrequested):
+    """ Gets a requested item ready to be worked on.   Returns whether it 
+    needs to be and its estimated age."""
+
+    needed = False
     try:
         if querystring in ITEMDB.items and ITEMDB.items[querystring].status == "Complete":
             write_verbose_output(Fore.GREEN+f"Already know about {querystring}.  Skipping."+Fore.RESET,loglevel=1)
             # if I already know about this item, just return
-            return 
+            return needed, None
 
         if _create_items_helper([querystring]) == []:
             assert(querystring in ITEMDB.items and ITEMDB.items[querystring].status == "Complete")
             # if I don't need to do anything, just return
             write_verbose_output(Fore.YELLOW+f"{querystring} occurs in nature and doesn't need to be processed.  Skipping."+Fore.RESET,loglevel=1)
-            return
+            return needed, None
+
+        needed = True
 
     finally:
         # indicate that this item was user requested as is indicated.  
@@ -550,16 +661,16 @@ def query_how_to_make_item(querystring,userrequested):
 
     ITEMDB.items[querystring].status = "Need to process"
 
-    _how_to_make_item_recursively_helper(querystring,agerestriction=estimated_age)
+    return needed, estimated_age
 
 
 
-def _how_to_make_item_recursively_helper(querystring, agerestriction=None):
-    """
-    In this function, we will get the steps needed to make an item.   For
-    each step, we will get the raw materials and tools needed.   Then we will
-    recursively call this function on the raw materials and tools.
-    """
+# The parts of working out how to make an item.   populate_wave (below) does
+# each one for a whole level of the tree at once.
+
+def _start_item(querystring, agerestriction):
+    """ Marks an item as in progress.   Returns False if it shouldn't be 
+    worked on."""
 
     if agerestriction:
         write_verbose_output(Fore.GREEN+f"Processing {querystring} ({agerestriction})"+Fore.RESET,loglevel=1)
@@ -579,32 +690,62 @@ def _how_to_make_item_recursively_helper(querystring, agerestriction=None):
         # describe everything in a rich manner (if needed)
         _describe_item_helper(querystring)
 
-        return
+        return False
+
+    # I'm processing it.   Prevent recursing into this again.
+    ITEMDB.items[querystring].status = "In Progress"
+    return True
+
+
+def _remove_useless_responses(items):
+    # drop junk responses like None and (no response)
+    return [item for item in items if not is_useless_response(item)]
+
+
+def _get_raw_steps(querystring, agerestriction):
+    """ The steps to make an item, as [(step, tools, raw materials)].   The 
+    tools are as the LLM named them (see _set_steps)."""
+
+    rawsteps = []
+    for step in get_steps_needed_to_make_item(querystring,agerestriction):
+        tools = _remove_useless_responses(get_tools_needed_for_step(step,querystring,agerestriction))
+
+        # TODO: Fix this later for situations with tools that involve OR
+        # For now, assume you need all tools.   This handles things like mortar
+        # and pestle or something like hammer and chisel.
+        raw_materials = _remove_useless_responses(get_raw_materials_needed_for_step(step," and ".join(tools),querystring,agerestriction))
+
+        rawsteps.append((step, tools, raw_materials))
+
+    return rawsteps
+
+
+async def _get_raw_steps_async(querystring, agerestriction, limiter):
+    """ _get_raw_steps, with the queries for each step made at once."""
+
+    steps = await _get_simple_list_async(steps_query(querystring,agerestriction), limiter)
+    return await asyncio.gather(*[_get_raw_step_async(step, querystring, agerestriction, limiter) for step in steps])
+
 
-    if ITEMDB.items[querystring].status == "Need to process":
-        # I'm processing it.   Prevent recursing into this again.
-        ITEMDB.items[querystring].status = "In Progress"
+async def _get_raw_step_async(step, querystring, agerestriction, limiter):
+    tools = _remove_useless_responses(await _get_simple_list_async(tools_query(step,querystring,agerestriction), limiter))
+    raw_materials = _remove_useless_responses(await _get_simple_list_async(raw_materials_query(step," and ".join(tools),querystring,agerestriction), limiter))
+    return step, tools, raw_materials
 
-    # Get the steps needed to make the item
-    steps = get_steps_needed_to_make_item(querystring,agerestriction)
+
+def _set_steps(querystring, rawsteps):
+    """ Puts the steps from _get_raw_steps in the item, with each tool under
+    its standard name.   Returns the tools and raw materials (which may need
+    to be made)."""
 
     stepdata = []
 
     # These are the things I'll need to work on after.
     itemstoprocess = set([])
 
-    # For each step, get the raw materials and tools needed
-    for step in steps:
+    for step, tools, raw_materials in rawsteps:
         write_verbose_output(Fore.RESET+f"  Step: "+Fore.RESET+f"{step}",loglevel=1)
 
-        # Get the tools and raw materials needed for the step
-        tools = get_tools_needed_for_step(step,querystring,agerestriction)
-
-        for tool in tools:
-            # drop junk responses like None and (no response)
-            if is_useless_response(tool):
-                tools.remove(tool)
-
         write_verbose_output(Fore.RESET+f"    Unfiltered Tools: "+Fore.RESET+f"{_get_pretty_item_list(tools)}",loglevel=1)
 
 
@@ -636,16 +777,6 @@ def _how_to_make_item_recursively_helper(querystring, agerestriction=None):
 
         itemstoprocess.update(revisedtools)
 
-        # TODO: Fix this later for situations with tools that involve OR
-        # For now, assume you need all tools.   This handles things like mortar
-        # and pestle or something like hammer and chisel.
-        raw_materials = get_raw_materials_needed_for_step(step," and ".join(tools),querystring,agerestriction)
-
-        for material in raw_materials:
-            # drop junk responses like None and (no response)
-            if is_useless_response(material):
-                raw_materials.remove(material)
-
         itemstoprocess.update(raw_materials)
         write_verbose_output(Fore.RESET+f"    Raw materials: "+Fore.RESET+f"{_get_pretty_item_list(raw_materials)}",loglevel=1)
 
@@ -654,17 +785,17 @@ def _how_to_make_item_recursively_helper(querystring, agerestriction=None):
     # add my step data to the item
     ITEMDB.items[querystring].steps = stepdata
 
-    for step in stepdata:
-        if DESCRIBER and 'description' not in step or step['description'] == "":
-            DESCRIBER.describe_step(querystring,step)
+    return itemstoprocess
+
+
+def _step_needs_description(step):
+    return DESCRIBER is not None and step.get('description', "") == ""
 
-    # describe everything in a rich manner (if needed)
-    for item in itemstoprocess:
-        _describe_item_helper(querystring)
 
-    # Okay, let's create the basic database entries we need for the new tools 
-    # and materials
-    items_to_make = _create_items_helper(itemstoprocess)
+def _start_children(querystring, items_to_make, agerestriction, ages=None):
+    """ Gets the new items needed for querystring ready to be made.   Returns
+    [(item, age restriction)].   ages has their ages, if they've already been
+    asked for."""
 
     if items_to_make == []:
         # if I don't need to do anything, just return
@@ -672,37 +803,210 @@ def _how_to_make_item_recursively_helper(querystring, agerestriction=None):
     else:
         write_verbose_output(f"  Items to make: {_get_pretty_item_list(items_to_make)}"+Fore.RESET,loglevel=1)
 
+    children = []
     for item in items_to_make:
         ITEMDB.items[item].user_requested = False
-        # recursively call this function on the tools and raw materials
 
         agetouse = agerestriction
         # I can either make this item in the most primitive way or
         # use the tools available at the time of the main query item
         global PRIMITIVE_AGE_FOR_ALL
         if PRIMITIVE_AGE_FOR_ALL:
-            new_item_age = get_item_age(item)
+            new_item_age = ages[item] if ages and item in ages else get_item_age(item)
             ITEMDB.items[querystring].estimated_age = new_item_age
             if is_younger(agerestriction,new_item_age):
                 write_verbose_output(Fore.RED+f"    WARNING: {item} ({new_item_age}) is younger than {querystring} ({agerestriction}).  Using {agerestriction} instead."+Fore.RESET,loglevel=1)
             else:
                 agetouse = new_item_age
 
-        _how_to_make_item_recursively_helper(item,agerestriction=agetouse)
+        children.append((item, agetouse))
+
+    return children
+
+
+def _finish_item(querystring):
+    """ The item's steps are worked out.   (It isn't Complete until the items
+    it needs are, see run_job_queue.)"""
 
     # mark the tools as such
-    for step in stepdata:
+    for step in ITEMDB.items[querystring].steps:
         for tool in step['tools']:
             ITEMDB.items[tool].is_tool = True
 
-    # describe everything in a rich manner (if needed)
-    _describe_item_helper(querystring)
 
-    # I've finished this!
-    ITEMDB.items[querystring].status = "Complete"
-    write_verbose_output(Fore.GREEN+f"Finished processing {querystring}."+Fore.RESET,loglevel=1)
+import asyncio
+
+# How many LLM queries populate_wave may have going at once, and how many
+# tokens a minute they may use (None for no limit).   See -c and -t.
+CONCURRENCY = 1
+TOKENSPERMINUTE = None
+
+async def populate_wave(wave, limiter):
+    """ Works out how to make the items in wave ([(item, age restriction)],
+    which should be in order of item name) and creates the items they need.
+    Returns ({item: [(new item to make, age restriction)]}, {item: the
+    exception working on it raised}).
+
+    All the queries for a wave (steps, then tools and raw materials for every
+    step, descriptions, whether the new items are natural, their ages) are
+    made at once, within CONCURRENCY and TOKENSPERMINUTE.   Everything that
+    changes ITEMDB or the tool dictionary is done afterwards, in order of item
+    name, so itemdb.json comes out the same whichever answers come back 
+    first.   (Tool names are still standardized one at a time, since each
+    one depends on the tools known before it.)"""
+
+    write_verbose_output(Fore.YELLOW+f"Working on {len(wave)} items: {_get_pretty_item_list([item for item, _ in wave])}"+Fore.RESET,loglevel=0)
+
+    # If one item's steps can't be had, the rest of the wave can still go on
+    failed = {}
+    rawsteps = await asyncio.gather(*[_get_raw_steps_async(item, agerestriction, limiter) for item, agerestriction in wave],
+                                    return_exceptions=True)
+    for (item, _), steps in zip(wave, rawsteps):
+        if isinstance(steps, Exception):
+            failed[item] = steps
+    wave = [(item, agerestriction) for item, agerestriction in wave if item not in failed]
+    rawsteps = [steps for steps in rawsteps if not isinstance(steps, Exception)]
+
+    itemstoprocess = {}
+    for (item, _), steps in zip(wave, rawsteps):
+        itemstoprocess[item] = _set_steps(item, steps)
+
+    describing = []
+    if DESCRIBER:
+        for item, _ in wave:
+            describing += [DESCRIBER.describe_step_async(item, step, limiter) for step in ITEMDB.items[item].steps if _step_needs_description(step)]
+            if _needs_description(item):
+                describing.append(DESCRIBER.describe_item_async(item, limiter))
+
+    # Okay, let's create the basic database entries we need for the new
+    # tools and materials (all of them at once)
+    newitems = _add_new_items(sorted(set().union(*itemstoprocess.values())))
+    (larger, natural), _ = await asyncio.gather(classify_items_async(newitems, limiter), asyncio.gather(*describing))
+    tomake = set(_classify_new_items(newitems, larger, natural, describe=False))
+
+    # Base items are done now, so they may need describing.   The rest
+    # may need their age.
+    describing = []
+    if DESCRIBER:
+        describing = [DESCRIBER.describe_item_async(item, limiter) for item in newitems
+                      if item not in tomake and _needs_description(item)]
+    children = sorted(tomake) if PRIMITIVE_AGE_FOR_ALL else []
+    ages, _ = await asyncio.gather(asyncio.gather(*[get_item_age_async(item, limiter) for item in children]),
+                                   asyncio.gather(*describing))
+    ages = dict(zip(children, ages))
+
+    tomakefor = {}
+    for item, agerestriction in wave:
+        items_to_make = [child for child in sorted(itemstoprocess[item]) if child in tomake]
+        tomakefor[item] = _start_children(item, items_to_make, agerestriction, ages)
+        _finish_item(item)
+
+    return tomakefor, failed
+
+
+import jobqueuelib
+
+# The work left to do, one job per item (see jobqueuelib.py), so a populator
+# that's stopped part way through (CTRL-C, a crash, kill -9) carries on where
+# it was next time, without rebuilding anything.
+JOBQUEUEFILE = "populator.queue.db"
+JOBQUEUE = None
+UNFINISHEDJOBSTATES = ('pending', 'running', 'waiting')
+
+# How many jobs to take from the queue at once.   Everything is saved after
+# each batch, so this is also about the most work a crash can throw away.
+WAVESIZE = 64
+
+# How many times in a row a whole wave may fail before the populator stops,
+# and how long to wait before trying again (times the number of failures).
+MAXWAVEFAILURES = 3
+WAVERETRYSECONDS = 30
+
+def get_job_queue():
+    global JOBQUEUE
+    if JOBQUEUE is None:
+        JOBQUEUE = jobqueuelib.JobQueue(JOBQUEUEFILE)
+    return JOBQUEUE
+
+
+def resume_job_queue():
+    """ Gets the queue and ITEMDB to agree after a populator stopped part way 
+    through.   Returns how many jobs are left to do."""
+
+    queue = get_job_queue()
+
+    # It didn't finish these, so they start over
+    requeued = queue.requeue_running()
+    if requeued:
+        write_verbose_output(Fore.YELLOW+f"Restarting {requeued} items that were being worked on."+Fore.RESET,loglevel=0)
+
+    # The queue is saved before ITEMDB is marked Complete, so it may have got
+    # no further
+    for item in queue.items('done'):
+        if item in ITEMDB.items and ITEMDB.items[item].status != "Complete":
+            ITEMDB.items[item].status = "Complete"
+
+    counts = queue.counts()
+    if counts['failed']:
+        write_verbose_output(Fore.RED+f"{counts['failed']} items failed too many times (use -r to try them again)."+Fore.RESET,loglevel=0)
+    return sum(counts[state] for state in UNFINISHEDJOBSTATES)
+
+
+def run_job_queue():
+    """ Works on the queued items until there's nothing left to do.   A batch
+    of jobs (a level of the tree, see jobqueuelib.JobQueue.claim) at a time is
+    worked on by populate_wave.   The items they need are queued, and an item
+    is Complete once they all are."""
+
+    queue = get_job_queue()
+    limiter = openaiquerylib.QueryLimiter(CONCURRENCY, TOKENSPERMINUTE)
+
+    async def run():
+        wavefailures = 0
+        while jobs := queue.claim(limit=WAVESIZE):
+            wave = []
+            for job in jobs:
+                if job.item not in ITEMDB.items:
+                    queue.fail(job.item, "not in the item database", retry=False)
+                    continue
+                # it may be In Progress if a populator stopped part way through
+                ITEMDB.items[job.item].status = "Need to process"
+                _start_item(job.item, job.agerestriction)
+                wave.append((job.item, job.agerestriction))
+            if not wave:
+                continue
+
+            try:
+                tomakefor, failed = await populate_wave(wave, limiter)
+            except Exception as e:
+                # Something the whole wave needed went wrong (like the LLM not
+                # answering), not any one item, so it doesn't count against
+                # them.   If it keeps happening, stop (they're still queued).
+                queue.requeue([item for item, _ in wave], repr(e))
+                wavefailures += 1
+                write_verbose_output(Fore.RED+f"  Working on {len(wave)} items failed ({e!r}).  "+("Giving up for now." if wavefailures >= MAXWAVEFAILURES else "Will try again.")+Fore.RESET,loglevel=0)
+                if wavefailures >= MAXWAVEFAILURES:
+                    raise
+                await asyncio.sleep(WAVERETRYSECONDS * wavefailures)
+                continue
+            wavefailures = 0
+
+            for item, error in failed.items():
+                state = queue.fail(item, repr(error))
+                write_verbose_output(Fore.RED+f"  Working on {item} failed ({error!r}).  "+("Will try again." if state == "pending" else "Giving up.")+Fore.RESET,loglevel=0)
+
+            # The new items have to be in itemdb.json before the queue says to
+            # make them
+            ITEMDB.save()
+            for item, children in tomakefor.items():
+                for done in queue.finish(item, children):
+                    ITEMDB.items[done].status = "Complete"
+                    write_verbose_output(Fore.GREEN+f"Finished processing {done}."+Fore.RESET,loglevel=1)
+
+            write_verbose_output(Fore.YELLOW+f"{limiter.queries} queries, {limiter.tokensused} tokens so far."+Fore.RESET,loglevel=1)
+            persiststores()
 
-    persiststores()
+    asyncio.run(run())
 
 
 
@@ -728,15 +1032,60 @@ def persiststores():
     # save the tool files
     tooldata = {
         'TOOLDICT': TOOLDICT,
-        'KNOWNTOOLS': list(KNOWNTOOLS)
+        'KNOWNTOOLS': sorted(KNOWNTOOLS)
     }
-    json.dump(tooldata, open(TOOLFILENAME, "w"), indent=4)
+    with open(TOOLFILENAME, "w") as f:
+        json.dump(tooldata, f, indent=4)
     
     if CTRL_C_PRESSED:
         write_verbose_output(Fore.RED+f"CTRL-C pressed.  Exiting."+Fore.RESET,loglevel=0)
         sys.exit(1)
 
 
+def regenerate_problem_items(problemsdb, mincount=1):
+    """ Redo the items people reported as wrong on the web site (the problem
+    counts database from problemreportlib.py).   Their description and item
+    reports are cleared once they're redone, so they aren't done again until
+    someone complains again."""
+
+    items = [item for item in problemreportlib.items_to_regenerate(problemsdb, mincount=mincount)
+             if item in ITEMDB.items]
+    print(f"Regenerating {len(items)} items with problem reports.")
+
+    # The cached answers are the ones people complained about, so ask again
+    # (but still save the new answers in the cache).
+    checkcache = OAIQ.checkcache
+    OAIQ.checkcache = False
+    try:
+        for item in items:
+            job = get_job_queue().get(item)
+            if job is not None and job.state in UNFINISHEDJOBSTATES:
+                # It's being worked on already (from the old answers), so
+                # leave it, and its reports, for next time
+                write_verbose_output(Fore.CYAN+f"{item} is already queued.  Skipping its problem reports."+Fore.RESET,loglevel=0)
+                continue
+
+            write_verbose_output(Fore.MAGENTA+f"PROBLEM REPORTS: {item}:"+Fore.RESET,loglevel=0)
+            # These aren't about how it's made, so keep them
+            old = ITEMDB.items[item]
+            userrequested = getattr(old, 'user_requested', False)
+            image = getattr(old, 'image', None)
+
+            old.status = "Need to process"
+            if DESCRIBER:
+                old.description = ""
+            query_how_to_make_item(item, userrequested=userrequested)
+            if image is not None:
+                ITEMDB.items[item].image = image
+
+            # Only the problems regenerating it can fix are fixed (the image
+            # ones are for fetchimages.py), and only if it worked
+            if ITEMDB.items[item].status == "Complete":
+                problemreportlib.ProblemCounts(problemsdb).clear([item], problemreportlib.REGENERATECATEGORIES)
+    finally:
+        OAIQ.checkcache = checkcache
+
+
 # this parses command line arguments including either a command line option
 # of the item one is trying to build, or a file containing a list of items to 
 # build.
@@ -749,7 +1098,12 @@ defaultconfig = {
     "ignorecorruption": False,
     "verbose": 0,
     "describe": False,
-    "primitiveageforall": False
+    "primitiveageforall": False,
+    "problems": None,
+    "problemthreshold": 3,
+    "concurrency": 8,
+    "tokensperminute": 0,
+    "queuefile": "populator.queue.db"
 }
 
 def main():
@@ -826,6 +1180,39 @@ def main():
             help="Describe items and steps."
         )
 
+    # Redo the items people said were wrong on the web site
+    parser.add_argument(
+            "-P", "--problems",
+            type=str,
+            help="Regenerate the items with problem reports in this problem counts database (from the web app)"
+        )
+
+    parser.add_argument(
+            "--problemthreshold",
+            type=int,
+            help="How many description / item problem reports an item needs before it's regenerated"
+        )
+
+    # Work on many items (and steps) at once.   See populate_wave
+    parser.add_argument(
+            "-c", "--concurrency",
+            type=int,
+            help="How many LLM queries to have going at once"
+        )
+
+    parser.add_argument(
+            "-t", "--tokensperminute",
+            type=int,
+            help="Most tokens a minute the LLM queries may use (0 for no limit)"
+        )
+
+    # Where the work left to do is kept, see get_job_queue
+    parser.add_argument(
+            "--queuefile",
+            type=str,
+            help="The job queue file (a stopped populator carries on from it)"
+        )
+
     # Add a version argument
     parser.add_argument(
             "--version",
@@ -848,6 +1235,14 @@ def main():
     global LOGLEVEL
     LOGLEVEL = args.verbose
 
+    global CONCURRENCY
+    global TOKENSPERMINUTE
+    CONCURRENCY = args.concurrency
+    TOKENSPERMINUTE = args.tokensperminute or None
+
+    global JOBQUEUEFILE
+    JOBQUEUEFILE = args.queuefile
+
     if args.querystring:
         # If a query string is provided, use only it
         querylist = [args.querystring]
@@ -858,7 +1253,7 @@ def main():
             querylist = [line.strip() for line in f.readlines()]
 
     # If no query string or file is provided, print an error message
-    if not querylist and not args.rebuild:
+    if not querylist and not args.rebuild and not args.problems:
         print("No action provided. Use -h for help.")
         return
 
@@ -895,10 +1290,33 @@ def main():
     KNOWNTOOLS = set(tooldata['KNOWNTOOLS'])
 
 
+    # If the last run stopped part way through, carry on with that first.
+    # (Everything it was doing is in the job queue.)
+    unfinished = resume_job_queue()
+    if unfinished:
+        write_verbose_output(Fore.YELLOW+f"Carrying on with {unfinished} queued items..."+Fore.RESET,loglevel=0)
+        try:
+            run_job_queue()
+        finally:
+            persiststores()
+
+    # -r gives the items that failed too many times another go
+    if args.rebuild:
+        retried = get_job_queue().retry_failed()
+        if retried:
+            write_verbose_output(Fore.YELLOW+f"Trying {retried} failed items again..."+Fore.RESET,loglevel=0)
+            try:
+                run_job_queue()
+            finally:
+                persiststores()
+
     # First, check if the database needs to be rebuilt.
-    # all items in the database should be complete (or else it crashed in the
-    # middle of processing)
-    corrupteditems = ITEMDB.filter_items(lambda x: x.status != "Complete")
+    # all items in the database should be complete (or else something went
+    # wrong that the job queue can't fix, like items that failed too often or
+    # a database from before there was a job queue).   Items waiting on ones
+    # like that are fine, they'll be Complete once those are.
+    waiting = set(get_job_queue().items('waiting'))
+    corrupteditems = [item for item in ITEMDB.filter_items(lambda x: x.status != "Complete") if item not in waiting]
     if corrupteditems != []:
         print(f"The database contains {len(corrupteditems)} incomplete items and is likely corrupted.")
         if not args.rebuild and not args.ignorecorruption:
@@ -909,8 +1327,8 @@ def main():
         if args.rebuild > 1:
             print(f"Rebuilding ALL {len(ITEMDB.items)} items in the database.")
             # make this all database items
-            corrupteditems = ITEMDB.filter_items(lambda x: True)
-            for item in ITEMDB.items:
+            corrupteditems = [item for item in ITEMDB.items if item not in waiting]
+            for item in corrupteditems:
                 ITEMDB.items[item].status = "Need to process"
         else: # only rebuild legitimately corrupted items
             print(f"Rebuilding {len(corrupteditems)} items in the database.")
@@ -923,19 +1341,22 @@ def main():
 
         for item in corrupteditems:
             write_verbose_output(Fore.MAGENTA+f"REPAIRING: {item}:"+Fore.RESET,loglevel=0)
-            # Do the query
-            query_how_to_make_item(item,userrequested=None)
+        # Do the query
+        query_how_to_make_items(corrupteditems,userrequested=None)
+
+    if args.problems:
+        regenerate_problem_items(args.problems, mincount=args.problemthreshold)
 
     try:
         for query in querylist:
             # Explain what you are querying for
             write_verbose_output(Fore.MAGENTA+f"MAIN QUERY: {query}"+Fore.RESET,loglevel=0)
 
-            # Do the query
-            query_how_to_make_item(query, userrequested=True)
+        # Do the queries
+        query_how_to_make_items(querylist, userrequested=True)
 
-            # Newline for better readability
-            write_verbose_output("",loglevel=1)
+        # Newline for better readability
+        write_verbose_output("",loglevel=1)
     finally:
 
         # Clean up before exiting
@@ -0,0 +1,229 @@
+""" This library counts the problems people report on /problem, per item and
+per kind of problem, so it's easy to find the worst items.
+
+Each report is an event, like
+
+    {"time": 1700000000.0, "item": "wood", "category": "DESC_INACCURATE", "owner": "guest:abc"}
+
+which the web app writes to problems.log as a line of JSON.   The counts are
+kept in memory and added to a small SQLite file every few seconds (by a
+thread in each worker), so a report costs a dictionary update rather than a
+database write, and all the workers (and the tools below) see the totals.
+
+    python problemreportlib.py --db instance/problem_counts.db --top 20
+
+lists the items with the most reports, and the populator can regenerate them
+(see items_to_regenerate() and populator.py --problems).
+"""
+
+import argparse
+import atexit
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# What the /problem form can report
+CATEGORIES = ('IMAGE_INACCURATE', 'DESC_INACCURATE', 'ITEM_INACCURATE', 'ALL_IMAGES_INACCURATE')
+
+# The problems regenerating an item (steps and description) can fix.   The
+# image ones are for fetchimages.py.
+REGENERATECATEGORIES = ('DESC_INACCURATE', 'ITEM_INACCURATE')
+
+
+class ProblemCounts:
+    """The totals, in a SQLite file every worker shares."""
+
+    def __init__(self, filename, timeout=5.0):
+        self.filename = filename
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        # One connection per thread (sqlite3 connections aren't shared), made
+        # on first use so nothing is opened before workers fork.
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.filename) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.filename, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS problem_count "
+                               "(item TEXT NOT NULL, category TEXT NOT NULL, count INTEGER NOT NULL, "
+                               "updated REAL NOT NULL, PRIMARY KEY (item, category))")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def add(self, counts, now=None):
+        """Add {(item, category): count} to the totals, in one transaction."""
+        if not counts:
+            return
+        now = time.time() if now is None else now
+        connection = self._connect()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.executemany(
+                "INSERT INTO problem_count (item, category, count, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (item, category) DO UPDATE SET count = count + excluded.count, updated = excluded.updated",
+                [(item, category, count, now) for (item, category), count in counts.items()])
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def counts(self, categories=None):
+        """{(item, category): count}, for just these categories if given."""
+        query = "SELECT item, category, count FROM problem_count"
+        params = ()
+        if categories:
+            query += f" WHERE category IN ({','.join('?' * len(categories))})"
+            params = tuple(categories)
+        return {(item, category): count for item, category, count in self._connect().execute(query, params)}
+
+    def clear(self, items, categories=None):
+        """Forget the reports for these items (e.g. once they're regenerated),
+        or just the ones in these categories."""
+        connection = self._connect()
+        if categories is None:
+            connection.executemany("DELETE FROM problem_count WHERE item = ?", [(item,) for item in items])
+        else:
+            connection.executemany("DELETE FROM problem_count WHERE item = ? AND category = ?",
+                                   [(item, category) for item in items for category in categories])
+
+
+def rank(counts, n=None, mincount=1):
+    """The items in counts ({(item, category): count}) with the most reports
+    first, as [{'item', 'total', 'categories': {category: count}}]."""
+    byitem = collections.defaultdict(dict)
+    for (item, category), count in counts.items():
+        byitem[item][category] = byitem[item].get(category, 0) + count
+    ranked = [{'item': item, 'total': sum(categories.values()), 'categories': categories}
+              for item, categories in byitem.items()]
+    ranked = [entry for entry in ranked if entry['total'] >= mincount]
+    # Ties go alphabetically, so the list doesn't jump around
+    ranked.sort(key=lambda entry: (-entry['total'], entry['item']))
+    return ranked if n is None else ranked[:n]
+
+
+class ProblemReports:
+
+    def __init__(self, counts, flushinterval=5.0):
+        self.counts = counts
+        self.flushinterval = flushinterval
+        self._lock = threading.Lock()
+        self._pending = collections.Counter()   # (item, category) -> count
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+        self.recorded = 0
+        self.flushes = 0
+        self.failedflushes = 0
+        atexit.register(self.flush)
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child (threads don't
+        # survive a fork, and what the parent hadn't flushed is its own).
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                if self._pid is not None and self._pid != os.getpid():
+                    self._pending = collections.Counter()
+                self._pid = os.getpid()
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._run, args=(self._stop,),
+                                                name="fctc-problem-counts", daemon=True)
+                self._thread.start()
+
+    def _run(self, stop):
+        while not stop.wait(self.flushinterval):
+            try:
+                self.flush()
+            except Exception:
+                # It's still pending, so the next flush will try again
+                pass
+
+    def record(self, item, categories, owner=None, now=None):
+        """Count a report of these problems with item.   Returns the events
+        (one per category) for the caller to log."""
+        for category in categories:
+            if category not in CATEGORIES:
+                raise ValueError(f"Unknown problem category: {category}")
+        now = time.time() if now is None else now
+        self._ensure_thread()
+        with self._lock:
+            for category in categories:
+                self._pending[(item, category)] += 1
+            self.recorded += len(categories)
+        return [{'time': now, 'item': item, 'category': category, 'owner': owner} for category in categories]
+
+    def flush(self):
+        """Add what's been counted since last time to the shared totals."""
+        with self._lock:
+            pending, self._pending = self._pending, collections.Counter()
+        if not pending:
+            return
+        try:
+            self.counts.add(pending)
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+                self.failedflushes += 1
+            raise
+        with self._lock:
+            self.flushes += 1
+
+    def top(self, n=10, category=None):
+        """The n items with the most reports (of category, if given), counting
+        this worker's that aren't flushed yet."""
+        categories = (category,) if category else None
+        counts = collections.Counter(self.counts.counts(categories))
+        with self._lock:
+            counts.update({key: count for key, count in self._pending.items()
+                           if category is None or key[1] == category})
+        return rank(counts, n)
+
+    def stats(self):
+        with self._lock:
+            return {'recorded': self.recorded, 'pending': sum(self._pending.values()),
+                    'flushes': self.flushes, 'failedflushes': self.failedflushes}
+
+    def close(self):
+        """Stop the flushing thread and flush what's left."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            mine = self._pid == os.getpid()
+        if thread is not None and mine:
+            self._stop.set()
+            thread.join()
+        self.flush()
+
+
+def items_to_regenerate(filename, mincount=1, categories=REGENERATECATEGORIES):
+    """The items with at least mincount reports that regenerating could fix,
+    worst first."""
+    return [entry['item'] for entry in rank(ProblemCounts(filename).counts(categories), mincount=mincount)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the items with the most problem reports")
+    parser.add_argument("--db", default=os.path.join("instance", "problem_counts.db"), help="Problem counts database")
+    parser.add_argument("-n", "--top", type=int, default=20, help="How many items to list")
+    parser.add_argument("-c", "--category", choices=CATEGORIES, help="Only count this kind of problem")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a table")
+    args = parser.parse_args()
+
+    categories = (args.category,) if args.category else None
+    ranked = rank(ProblemCounts(args.db).counts(categories), args.top)
+    if args.json:
+        print(json.dumps(ranked, indent=4))
+        return
+    for entry in ranked:
+        details = ", ".join(f"{category}: {count}" for category, count in sorted(entry['categories'].items()))
+        print(f"{entry['total']:6d}  {entry['item']}  ({details})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,176 @@
+""" This library funnels the writes to the user progress database through one
+thread per process.
+
+With several workers (and several threads in each) committing to the same
+SQLite file, each commit waits for the file lock and an fsync, and under load
+they pile up into "database is locked" errors.   Instead:
+
+  - enable_wal() puts SQLite in WAL mode, so readers don't wait for the
+    writer (or the writer for readers), with a busy timeout instead of an
+    immediate error when another process holds the write lock.
+  - WriteQueue runs every write on a single thread.   A write is a function
+    that takes a SQLAlchemy connection.   Writes that arrive within a couple
+    of milliseconds of each other are committed together in one transaction,
+    so a burst of requests costs one fsync rather than one each.
+
+Requests still wait for their own write to be committed (so the next page
+they load sees it), just not on each other's locks.
+
+    WRITER = WriteQueue(engine)
+    bits = WRITER.write(lambda conn: ...)
+"""
+
+import concurrent.futures
+import os
+import queue
+import threading
+import time
+
+from sqlalchemy import create_engine, event
+
+
+def enable_wal(engine, busytimeout=5000):
+    """Make every new connection of this (SQLite) engine use WAL mode.   Does
+    nothing for other databases or in-memory SQLite."""
+    if engine.dialect.name != 'sqlite' or engine.url.database in (None, '', ':memory:'):
+        return False
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragmas(dbapiconnection, connectionrecord):
+        cursor = dbapiconnection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        # In WAL mode this is still safe against corruption, and only a power
+        # failure can lose the last few commits.
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(busytimeout)}")
+        cursor.close()
+
+    return True
+
+
+def create_writer_engine(url):
+    """An engine for the writer thread.   For SQLite its transactions start
+    with BEGIN IMMEDIATE, which takes the write lock straight away, so a
+    write that reads first (e.g. to merge a bitset) can't be beaten to it by
+    another process."""
+    engine = create_engine(url)
+    if engine.dialect.name != 'sqlite':
+        return engine
+    enable_wal(engine)
+
+    @event.listens_for(engine, 'connect')
+    def _no_implicit_begin(dbapiconnection, connectionrecord):
+        # Stop the sqlite3 module starting transactions itself...
+        dbapiconnection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def _begin_immediate(connection):
+        # ...so we can start them the way we want.
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+    return engine
+
+
+class WriteQueue:
+
+    def __init__(self, engine, coalesce=0.002, maxbatch=64):
+        self.engine = engine
+        self.coalesce = coalesce        # how long to wait for more writes
+        self.maxbatch = maxbatch
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        self.writes = 0
+        self.batches = 0
+        self.failed = 0
+        self.latencyseconds = 0.0       # queued to committed, summed
+        self.maxlatencyseconds = 0.0
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child (threads don't
+        # survive a fork, and the queue might have been copied mid-write).
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name="fctc-writer", daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+            return self._queue
+
+    def submit(self, func):
+        """Queue func(connection) to run in a write transaction.   Returns a
+        Future for what it returns."""
+        future = concurrent.futures.Future()
+        self._ensure_thread().put((time.perf_counter(), func, future))
+        return future
+
+    def write(self, func, timeout=30):
+        """submit() and wait for it to be committed."""
+        return self.submit(func).result(timeout=timeout)
+
+    def _next_batch(self, writequeue):
+        batch = [writequeue.get()]
+        deadline = time.perf_counter() + self.coalesce
+        while len(batch) < self.maxbatch:
+            remaining = deadline - time.perf_counter()
+            try:
+                if remaining > 0:
+                    batch.append(writequeue.get(timeout=remaining))
+                else:
+                    batch.append(writequeue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch):
+        """Run a batch in one transaction.   Returns the results, or raises
+        if anything in it failed (and nothing is committed)."""
+        with self.engine.begin() as connection:
+            return [func(connection) for _, func, _ in batch]
+
+    def _run(self):
+        writequeue = self._queue
+        while True:
+            batch = self._next_batch(writequeue)
+            try:
+                results = [(result, None) for result in self._commit(batch)]
+            except Exception:
+                # One bad write mustn't lose the others, so run them one at
+                # a time to find out which it was.
+                results = []
+                for item in batch:
+                    try:
+                        results.append((self._commit([item])[0], None))
+                    except Exception as e:
+                        results.append((None, e))
+
+            committed = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                for (queuedat, _, _), (_, error) in zip(batch, results):
+                    self.writes += 1
+                    self.failed += error is not None
+                    latency = committed - queuedat
+                    self.latencyseconds += latency
+                    self.maxlatencyseconds = max(self.maxlatencyseconds, latency)
+
+            for (_, _, future), (result, error) in zip(batch, results):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'queuedepth': self._queue.qsize(),
+                'writes': self.writes,
+                'batches': self.batches,
+                'failed': self.failed,
+                'avgbatch': self.writes / self.batches if self.batches else 0.0,
+                'avglatencyseconds': self.latencyseconds / self.writes if self.writes else 0.0,
+                'maxlatencyseconds': self.maxlatencyseconds,
+            }
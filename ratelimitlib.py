@@ -0,0 +1,156 @@
+""" This library rate limits clients with token buckets.
+
+Each client (on each limited route) has a bucket that holds up to `burst`
+tokens and refills at `rate` tokens a second.   A request takes a token, and
+if there isn't one it's refused, with how long until there will be.   So a
+client can do a short burst of things quickly, but not keep it up.
+
+The buckets live in a store.   MemoryStore keeps them in this process, which
+is all a single worker needs.   With several workers each would let a client
+have its own full rate, so SQLiteStore keeps them in a small SQLite file
+that every worker on the machine shares.
+
+    limiter = RateLimiter(MemoryStore(), {'suggestion': (0.2, 5)})
+    allowed, retryafter = limiter.check('suggestion', 'guest:abc@10.0.0.1', shared='ip:10.0.0.1')
+"""
+
+import collections
+import sqlite3
+import threading
+import time
+
+
+class RateLimited(Exception):
+    """Raised (by the web app) when a client is over its limit."""
+
+    def __init__(self, retryafter):
+        super().__init__(f"Rate limited, retry after {retryafter:.1f}s")
+        self.retryafter = retryafter
+
+
+def refill(tokens, updated, now, rate, burst):
+    """How many tokens a bucket has now."""
+    return min(burst, tokens + (now - updated) * rate)
+
+
+def take(tokens, rate):
+    """Take a token from a bucket with this many.   Returns (allowed, tokens
+    left, seconds until one would be there)."""
+    if tokens >= 1:
+        return True, tokens - 1, 0.0
+    return False, tokens, (1 - tokens) / rate
+
+
+class MemoryStore:
+    """Buckets in this process.   The oldest are forgotten past maxbuckets
+    (they'd have refilled long ago anyway)."""
+
+    def __init__(self, maxbuckets=100000):
+        self.maxbuckets = maxbuckets
+        self._buckets = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, now):
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (burst, now))
+            allowed, tokens, retryafter = take(refill(tokens, updated, now, rate, burst), rate)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.maxbuckets:
+                self._buckets.popitem(last=False)
+        return allowed, retryafter
+
+    def prune(self, olderthan):
+        """Forget buckets not used since olderthan (they're full by now)."""
+        with self._lock:
+            # the least recently used are first
+            while self._buckets and next(iter(self._buckets.values()))[1] < olderthan:
+                self._buckets.popitem(last=False)
+
+
+class SQLiteStore:
+    """Buckets in a SQLite file, so every worker shares them."""
+
+    def __init__(self, filename, timeout=1.0):
+        self.filename = filename
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS bucket "
+                               "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+
+    def _connect(self):
+        # One connection per thread (sqlite3 connections aren't shared)
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.filename, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def take(self, key, rate, burst, now):
+        connection = self._connect()
+        # IMMEDIATE takes the write lock first, so two workers can't both
+        # take the last token.
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute("SELECT tokens, updated FROM bucket WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row is not None else (burst, now)
+            allowed, tokens, retryafter = take(refill(tokens, updated, now, rate, burst), rate)
+            connection.execute("INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)",
+                               (key, tokens, now))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return allowed, retryafter
+
+    def prune(self, olderthan):
+        """Forget buckets not used since olderthan (they're full by now)."""
+        self._connect().execute("DELETE FROM bucket WHERE updated < ?", (olderthan,))
+
+
+class RateLimiter:
+
+    def __init__(self, store, limits, clock=time.time, pruneinterval=300.0, sharedfactor=4):
+        self.store = store
+        # A bucket several clients share (see check) is this many times
+        # bigger, and refills this many times faster, than a client's own
+        self.sharedfactor = sharedfactor
+        # route -> (tokens per second, burst)
+        self.limits = dict(limits)
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._stats = {route: {'allowed': 0, 'limited': 0} for route in self.limits}
+        # Every so often the buckets that have refilled are forgotten, so the
+        # store doesn't keep one for every client there's ever been.   A
+        # bucket is full again at most this long after it was last used.
+        self.pruneinterval = pruneinterval
+        self.refillseconds = max((burst / rate for rate, burst in self.limits.values()), default=0.0)
+        self._nextprune = None
+
+    def check(self, route, client, shared=None):
+        """Take a token for client on route, and then (if it had one) from
+        the bucket it shares with others, if shared names one (e.g. everyone
+        at its address).   Returns (allowed, seconds to wait before
+        retrying).   Routes without a limit are always allowed."""
+        if route not in self.limits:
+            return True, 0.0
+        rate, burst = self.limits[route]
+        now = self.clock()
+        allowed, retryafter = self.store.take(f"{route}|{client}", rate, burst, now)
+        if allowed and shared is not None:
+            allowed, retryafter = self.store.take(f"{route}|{shared}", rate * self.sharedfactor,
+                                                  burst * self.sharedfactor, now)
+        with self._lock:
+            self._stats[route]['allowed' if allowed else 'limited'] += 1
+            prune = self._nextprune is None or now >= self._nextprune
+            if prune:
+                self._nextprune = now + self.pruneinterval
+        if prune:
+            self.store.prune(now - self.refillseconds)
+        return allowed, retryafter
+
+    def stats(self):
+        with self._lock:
+            return {route: dict(counts, rate=self.limits[route][0], burst=self.limits[route][1])
+                    for route, counts in self._stats.items()}
@@ -0,0 +1,120 @@
+""" This library answers "what am I closest to being able to make?"
+
+For every item that has steps, its inputs are the tools and raw materials
+used directly in those steps.   An item is ready when the user knows all of
+its inputs, and nearly ready when they know most of them.
+
+ReadinessIndex is built once from the item database.   It has the inputs of
+each item and the reverse: for each item, which items use it.   For each
+user it keeps a counter per item of how many of its inputs they know.   When
+they learn an item, only the counters of the items that use it change, so
+keeping up with a user costs time in proportion to what they learned, not to
+the size of the catalog.
+
+The counters live in memory (in each process).   They remember which bitset
+(see knownitemslib.py) they were computed from, so if another process added
+items, the next call just applies the difference.
+"""
+
+import collections
+import heapq
+import threading
+
+
+class ReadinessIndex:
+
+    def __init__(self, itemdb, maxowners=1024):
+        # item -> set of its direct inputs, for items that have steps
+        self.inputs = {}
+        # item -> items that use it directly
+        self.usedby = collections.defaultdict(list)
+
+        for name, item in itemdb.items.items():
+            inputs = set()
+            for step in getattr(item, 'steps', None) or []:
+                for subitem in step['tools'] + step['raw_materials']:
+                    if subitem in itemdb.items and subitem != name:
+                        inputs.add(subitem)
+            if inputs:
+                self.inputs[name] = inputs
+                for subitem in inputs:
+                    self.usedby[subitem].append(name)
+        self.usedby = dict(self.usedby)
+
+        self.paths = self._find_paths(itemdb)
+
+        # owner -> (bits, {item: known input count}), least recently used first
+        self.maxowners = maxowners
+        self._owners = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _find_paths(self, itemdb):
+        """A way to reach each item from a user requested item, as the
+        exploration path the game uses ("car/engine/piston")."""
+        paths = {}
+        queue = collections.deque()
+        for name in sorted(itemdb.items):
+            if getattr(itemdb.items[name], 'user_requested', False):
+                paths[name] = name
+                queue.append(name)
+        while queue:
+            name = queue.popleft()
+            for subitem in sorted(self.inputs.get(name, ())):
+                if subitem not in paths:
+                    paths[subitem] = paths[name] + '/' + subitem
+                    queue.append(subitem)
+        return paths
+
+    def _learn(self, counts, names):
+        for name in names:
+            for parent in self.usedby.get(name, ()):
+                counts[parent] = counts.get(parent, 0) + 1
+
+    def _counts(self, owner, bits, itemids):
+        """The counters for this owner, brought up to date with bits.   The
+        caller holds the lock."""
+        oldbits, counts = self._owners.pop(owner, (0, {}))
+        if oldbits & ~bits:
+            # They forgot something (a cleared account?).   Start over.
+            counts = {}
+            self._learn(counts, itemids.to_names(bits))
+        elif bits & ~oldbits:
+            self._learn(counts, itemids.to_names(bits & ~oldbits))
+
+        self._owners[owner] = (bits, counts)
+        while len(self._owners) > self.maxowners:
+            self._owners.popitem(last=False)
+        return counts
+
+    def learned(self, owner, bits, itemids):
+        """Tell the index the owner's bitset changed (e.g. /game just added
+        items).   Only the items that use the new ones are touched."""
+        with self._lock:
+            self._counts(owner, bits, itemids)
+
+    def ranked(self, owner, bits, itemids, limit=10, minfraction=0.5):
+        """The items the owner doesn't know yet but knows at least minfraction
+        of the inputs for, best first.   Returns a list of dicts with the
+        item name, the path to it, how many inputs are known / needed and
+        which ones are missing."""
+        candidates = []
+        with self._lock:
+            for name, known in self._counts(owner, bits, itemids).items():
+                needed = len(self.inputs[name])
+                if name not in self.paths or itemids.knows(bits, name):
+                    # can't get there in the game, or they already know it
+                    continue
+                if known >= needed * minfraction:
+                    # most complete first, then fewest missing, then by name
+                    candidates.append((-known / needed, needed - known, name, known, needed))
+
+        result = []
+        for _, _, name, known, needed in heapq.nsmallest(limit, candidates):
+            result.append({
+                'name': name,
+                'path': self.paths.get(name, name),
+                'known': known,
+                'needed': needed,
+                'missing': sorted(i for i in self.inputs[name] if not itemids.knows(bits, i)),
+            })
+        return result
@@ -0,0 +1,155 @@
+""" This library has the thread safe holders for the state that request
+threads share.
+
+UserStateStore keeps which boxes each user / guest has filled in on each
+item.   It's split into shards, each with its own lock, so requests from
+different users rarely wait for each other, and every change (like "fill
+this box unless it's already filled") happens under the lock in one go.
+Callers get copies, never the store's own dicts.
+
+QueuedWriter appends lines to a log file from a background thread.   Request
+threads only put the line on a queue, so they never share a file object or
+wait on the disk.
+"""
+
+import os
+import queue
+import threading
+
+
+class UserStateStore:
+
+    def __init__(self, shards=16):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def _shard(self, uid):
+        return self._shards[hash(uid) % len(self._shards)]
+
+    def __contains__(self, uid):
+        states, lock = self._shard(uid)
+        with lock:
+            return uid in states
+
+    def ensure(self, uid):
+        """Make sure there's a (maybe empty) state for uid."""
+        states, lock = self._shard(uid)
+        with lock:
+            states.setdefault(uid, {})
+
+    def start_item(self, uid, item):
+        """Make sure uid has a (maybe empty) set of fills for item."""
+        states, lock = self._shard(uid)
+        with lock:
+            states.setdefault(uid, {}).setdefault(item, {})
+
+    def has_item(self, uid, item):
+        states, lock = self._shard(uid)
+        with lock:
+            return item in states.get(uid, {})
+
+    def fills(self, uid, item):
+        """A copy of the box fills ({box id: image url}) uid has on item."""
+        states, lock = self._shard(uid)
+        with lock:
+            return dict(states.get(uid, {}).get(item, {}))
+
+    def add_fills(self, uid, item, fills):
+        """Fill the boxes in fills ({box id: image url}) that aren't filled
+        yet.   Returns the box ids that were filled."""
+        states, lock = self._shard(uid)
+        with lock:
+            mystate = states.setdefault(uid, {}).setdefault(item, {})
+            added = [boxid for boxid in fills if boxid not in mystate]
+            for boxid in added:
+                mystate[boxid] = fills[boxid]
+            return added
+
+    def set_item(self, uid, item, fills):
+        states, lock = self._shard(uid)
+        with lock:
+            states.setdefault(uid, {})[item] = dict(fills)
+
+    def discard(self, uid):
+        states, lock = self._shard(uid)
+        with lock:
+            states.pop(uid, None)
+
+    def move(self, fromuid, touid):
+        """Merge fromuid's state into touid's (fromuid's fills win, since
+        they're the most recent) and forget fromuid."""
+        states, lock = self._shard(fromuid)
+        with lock:
+            moving = states.pop(fromuid, None)
+        if moving is None:
+            return
+        states, lock = self._shard(touid)
+        with lock:
+            target = states.setdefault(touid, {})
+            for item, fills in moving.items():
+                target[item] = {**target.get(item, {}), **fills}
+
+
+class QueuedWriter:
+
+    _STOP = object()
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+
+    def _ensure_thread(self):
+        # Started on first use, and again in a forked child (threads don't
+        # survive a fork).
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, args=(self._queue,),
+                                                name="fctc-log-writer", daemon=True)
+                self._thread.start()
+            return self._queue
+
+    def _run(self, linequeue):
+        with open(self.filename, "a") as f:
+            while True:
+                line = linequeue.get()
+                if line is self._STOP:
+                    linequeue.task_done()
+                    return
+                f.write(line)
+                # Write whatever else is waiting before flushing
+                while True:
+                    linequeue.task_done()
+                    try:
+                        line = linequeue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if line is self._STOP:
+                        f.flush()
+                        linequeue.task_done()
+                        return
+                    f.write(line)
+                f.flush()
+
+    def write(self, line):
+        self._ensure_thread().put(line)
+
+    def flush(self):
+        """Wait until everything written so far is in the file."""
+        with self._lock:
+            linequeue = self._queue if self._pid == os.getpid() else None
+        if linequeue is not None:
+            linequeue.join()
+
+    def close(self):
+        """Write out what's queued and stop the thread.   (In a forked child
+        this does nothing: the thread and its queue belonged to the parent.)"""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                return
+            thread, self._thread = self._thread, None
+            self._queue.put(self._STOP)
+        thread.join()
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+""" This library traces how long each phase of startup takes, so that cold
+starts (which users feel on every Cloud Run scale up) can be measured and
+kept within a budget.
+
+Code marks a phase with:
+
+    with startuplib.phase("load_itemdb"):
+        ...
+
+and the timings are kept in PHASES.   report() formats them.
+
+Per module import times come from Python's own "-X importtime" output.
+Running this file starts the app in a child process with that flag, prints a
+report of the phases and the slowest imports, and exits non-zero if anything
+is over the budget in startup_budgets.json:
+
+    python startuplib.py [--budgets startup_budgets.json] [--top 15] [--json]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+DEFAULTBUDGETFILE = "startup_budgets.json"
+
+# The child process prints its phases on a line starting with this
+PHASEMARKER = "FCTC_STARTUP_PHASES "
+
+# When the process (well, this module) started
+START = time.perf_counter()
+
+# [{'name': ..., 'start': seconds since START, 'seconds': duration}, ...]
+PHASES = []
+
+
+@contextmanager
+def phase(name):
+    """Time the body of the with statement as a startup phase."""
+    begin = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        PHASES.append({'name': name, 'start': begin - START, 'seconds': end - begin})
+
+
+def phase_totals(phases=None):
+    """Sum the time for each phase name (a phase may run more than once)."""
+    totals = {}
+    for p in PHASES if phases is None else phases:
+        totals[p['name']] = totals.get(p['name'], 0.0) + p['seconds']
+    return totals
+
+
+def report(phases=None):
+    """A human readable table of the phases in the order they started."""
+    phases = PHASES if phases is None else phases
+    lines = ["Startup phases:"]
+    for p in phases:
+        lines.append(f"  {p['start']:8.3f}s  {p['seconds']:8.3f}s  {p['name']}")
+    if phases:
+        end = max(p['start'] + p['seconds'] for p in phases)
+        lines.append(f"  total {end:.3f}s")
+    return "\n".join(lines)
+
+
+def parse_importtime(stderrtext):
+    """Parse the output of "python -X importtime".   Returns a dict mapping
+    each module name to {'self': seconds, 'cumulative': seconds}."""
+    imports = {}
+    for line in stderrtext.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            selftime = int(fields[0]) / 1e6
+            cumulative = int(fields[1]) / 1e6
+        except ValueError:
+            # the header line: "self [us] | cumulative | imported package"
+            continue
+        imports[fields[2].strip()] = {'self': selftime, 'cumulative': cumulative}
+    return imports
+
+
+def check_budgets(budgets, phasetotals, imports, total=None):
+    """Compare timings against budgets.   budgets looks like:
+        {"total": 5.0, "phases": {"load_itemdb": 1.0}, "imports": {"flask": 0.5}}
+    where import budgets are for the cumulative time of that module.
+    Returns a list of strings describing anything over budget."""
+    failures = []
+
+    if total is not None and 'total' in budgets and total > budgets['total']:
+        failures.append(f"total startup {total:.3f}s > {budgets['total']:.3f}s")
+
+    for name, limit in budgets.get('phases', {}).items():
+        if phasetotals.get(name, 0.0) > limit:
+            failures.append(f"phase {name} {phasetotals[name]:.3f}s > {limit:.3f}s")
+
+    for name, limit in budgets.get('imports', {}).items():
+        if name in imports and imports[name]['cumulative'] > limit:
+            failures.append(f"import {name} {imports[name]['cumulative']:.3f}s > {limit:.3f}s")
+
+    return failures
+
+
+# What the child process runs: the same startup as gunicorn's import of main.
+CHILDSCRIPT = f"""
+import json, startuplib
+import main
+print({PHASEMARKER!r} + json.dumps(startuplib.PHASES))
+"""
+
+
+def trace_startup():
+    """Start the app in a child process.   Returns (phases, imports)."""
+    projectdir = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", CHILDSCRIPT],
+            cwd=projectdir, capture_output=True, text=True)
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"startup failed:\n{proc.stderr}")
+
+    for line in proc.stdout.splitlines():
+        if line.startswith(PHASEMARKER):
+            phases = json.loads(line[len(PHASEMARKER):])
+            break
+    else:
+        raise RuntimeError(f"startup didn't report its phases:\n{proc.stdout}")
+
+    return phases, parse_importtime(proc.stderr)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Trace the startup of the From Caves To Cars server and check it against a budget.",
+        usage="%(prog)s [options]"
+    )
+    parser.add_argument("-b", "--budgets", type=str, default=DEFAULTBUDGETFILE, help=f"Budget file (default: {DEFAULTBUDGETFILE})")
+    parser.add_argument("-t", "--top", type=int, default=15, help="How many of the slowest imports to list")
+    parser.add_argument("--json", action="store_true", help="Print the raw timings as JSON")
+    args = parser.parse_args()
+
+    phases, imports = trace_startup()
+    totals = phase_totals(phases)
+    total = max((p['start'] + p['seconds'] for p in phases), default=0.0)
+
+    if args.json:
+        print(json.dumps({'phases': phases, 'imports': imports, 'total': total}, indent=2))
+    else:
+        print(report(phases))
+        print(f"Slowest imports (cumulative):")
+        # only top level modules, otherwise every package is listed 3 times
+        toplevel = [(v['cumulative'], k) for k, v in imports.items() if '.' not in k]
+        for cumulative, name in sorted(toplevel, reverse=True)[:args.top]:
+            print(f"  {cumulative:8.3f}s  {name}")
+
+    budgets = {}
+    if os.path.exists(args.budgets):
+        with open(args.budgets) as f:
+            budgets = json.load(f)
+
+    failures = check_budgets(budgets, totals, imports, total=total)
+    for failure in failures:
+        print(f"OVER BUDGET: {failure}")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+"""
+Tests for the ASGI entry point, driving the ASGI callable directly.
+"""
+
+import os
+import sys
+import json
+import asyncio
+import threading
+import unittest
+import unittest.mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from testhelpers import small_itemdb
+import fromcavestocars
+from fromcavestocars import app, USERDB
+import asgiapp
+
+
+def call_asgi(method, path, query=b'', body=b'', headers=()):
+    """Send one request through asgiapp.app.   Returns (status, headers, body)."""
+    messages = []
+    incoming = [{'type': 'http.request', 'body': body, 'more_body': False}]
+
+    async def receive():
+        return incoming.pop(0) if incoming else {'type': 'http.disconnect'}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method,
+             'scheme': 'http', 'path': path, 'root_path': '',
+             'query_string': query, 'headers': list(headers),
+             'server': ('testserver', 80), 'client': ('127.0.0.1', 1234)}
+    asyncio.run(asgiapp.app(scope, receive, send))
+
+    start, bodymessage = messages
+    return start['status'], dict(start['headers']), bodymessage['body']
+
+
+class AsgiAppTests(unittest.TestCase):
+
+    def setUp(self):
+        app.config['TESTING'] = True
+        with app.app_context():
+            USERDB.create_all()
+
+        self.patcher = unittest.mock.patch('fromcavestocars.init_stats_if_needed')
+        self.patcher.start()
+        self.stats_patcher = unittest.mock.patch('fromcavestocars.POSSIBLEITEMSTATS', {
+            'wood': {'label': 'wood', 'url': '/game?item_name=wood', 'uniqueitems': 5, 'totalitems': 10},
+        })
+        self.stats_patcher.start()
+
+    def tearDown(self):
+        with app.app_context():
+            USERDB.drop_all()
+        self.patcher.stop()
+        self.stats_patcher.stop()
+
+    def test_async_view(self):
+        fromcavestocars.PAGECACHE.clear()
+        with unittest.mock.patch.dict('fromcavestocars.PAGECACHESTATS', {'hits': 0, 'misses': 0}):
+            status, headers, body = call_asgi('GET', '/choose')
+            self.assertEqual(status, 200)
+            self.assertIn(b'wood', body)
+
+            # it's cached like the Flask view's page
+            status, headers, body = call_asgi('GET', '/choose', headers=[(b'if-none-match', headers[b'etag'])])
+            self.assertEqual(status, 304)
+            self.assertEqual(fromcavestocars.PAGECACHESTATS, {'hits': 1, 'misses': 1})
+
+    def test_game_and_drop(self):
+        itemdb = small_itemdb('asgi')
+        threads = []
+        learn = fromcavestocars._learn_game_items
+
+        def learn_game_items(*args):
+            threads.append(threading.current_thread().name)
+            return learn(*args)
+
+        # which async views were used (not the Flask ones)
+        views = []
+
+        def spy(name):
+            view = asgiapp.ASYNC_VIEWS[name]
+
+            async def spied():
+                views.append(name)
+                return await view()
+            return spied
+
+        # (the item ids go with this test's database, so they're its own)
+        with unittest.mock.patch('fromcavestocars.ITEMDB', itemdb), \
+             unittest.mock.patch('fromcavestocars.ITEMIDS', fromcavestocars.knownitemslib.ItemIds()), \
+             unittest.mock.patch('fromcavestocars._learn_game_items', learn_game_items), \
+             unittest.mock.patch.dict(asgiapp.ASYNC_VIEWS, {name: spy(name) for name in ('game', 'handle_drop')}):
+            with app.app_context():
+                fromcavestocars._ensure_item_ids(itemdb.items)
+
+            status, headers, body = call_asgi('GET', '/game', query=b'item_name=wood')
+            self.assertEqual(status, 200)
+            self.assertIn(b'Chop a tree', body)
+            # the database work ran on the blocking pool, with the request's
+            # context copied over
+            self.assertEqual(len(threads), 1)
+            self.assertTrue(threads[0].startswith('fctc-blocking'))
+
+            # The same guest drops a tree on its box
+            cookie = headers[b'set-cookie'].split(b';')[0]
+            page_data = fromcavestocars._get_page_data('wood', exploration_path='wood')
+            [box] = [box for box in page_data['boxes'] if box['accepts'] == 'tree']
+            drop = json.dumps({'item_name': 'wood', 'exploration_path': 'wood', 'box_id': str(box['id']),
+                               'name': 'tree', 'image_url': '/static/images/wood.jpg'}).encode('utf-8')
+            requestheaders = [(b'content-type', b'application/json'), (b'cookie', cookie)]
+            status, headers, body = call_asgi('POST', '/drop', body=drop, headers=requestheaders)
+            self.assertEqual((status, json.loads(body)), (200, {'status': 'locked'}))
+            status, headers, body = call_asgi('POST', '/drop', body=drop, headers=requestheaders)
+            self.assertEqual(json.loads(body), {'status': 'already-filled'})
+            self.assertEqual(views, ['game', 'handle_drop', 'handle_drop'])
+
+    def test_fallback_to_flask(self):
+        status, headers, body = call_asgi('GET', '/')
+        self.assertEqual(status, 200)
+        self.assertIn(b'Make a random item', body)
+
+        # the session cookie is passed back like any other header
+        self.assertIn(b'set-cookie', headers)
+
+    def test_not_found(self):
+        status, headers, body = call_asgi('GET', '/no/such/page')
+        self.assertEqual(status, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
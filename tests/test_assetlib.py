@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+Tests for building the fingerprinted style / script bundles.
+"""
+
+import os
+import sys
+import gzip
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import assetlib
+
+
+class AssetBuildTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'assets')
+        self.dist = os.path.join(self.tmpdir, 'dist')
+        os.makedirs(self.src)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, text):
+        with open(os.path.join(self.src, name), 'w') as f:
+            f.write(text)
+
+    def test_minify_css_keeps_strings(self):
+        css = '/* "a comment" */\n.box::after {\n  content: "  x ; y  ";\n  margin : 0 ;\n}\n'
+        self.assertEqual(assetlib.minify_css(css), '.box::after{content: "  x ; y  ";margin : 0}')
+
+    def test_minify_js(self):
+        js = "// a comment\nfunction f() {\n    return 'http://x';\n}\n\n"
+        self.assertEqual(assetlib.minify_js(js), "function f() {\nreturn 'http://x';\n}\n")
+
+    def test_build_and_fingerprint(self):
+        self.write('game.css', 'body {\n  margin: 0;\n}\n')
+        manifest = assetlib.build_assets(self.src, self.dist)
+        builtname = manifest['game.css']
+        self.assertRegex(builtname, r'^game\.[0-9a-f]{10}\.css$')
+
+        with gzip.open(os.path.join(self.dist, builtname + '.gz'), 'rt') as f:
+            self.assertEqual(f.read(), 'body{margin: 0}')
+        with open(os.path.join(self.dist, assetlib.MANIFESTFILE)) as f:
+            self.assertEqual(json.load(f), manifest)
+
+        # same contents, same name.   New contents, new name.
+        self.assertEqual(assetlib.build_assets(self.src, self.dist)['game.css'], builtname)
+        self.write('game.css', 'body { margin: 1px; }')
+        self.assertNotEqual(assetlib.build_assets(self.src, self.dist)['game.css'], builtname)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+#!/usr/bin/python3
+"""
+Tests for the response compression middleware.
+"""
+
+import os
+import sys
+import gzip
+import unittest
+import unittest.mock
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import compresslib
+
+
+def make_app(chunks, content_type='text/html; charset=utf-8', extraheaders=()):
+    """A WSGI app that streams chunks (no Content-Length)."""
+    def app(environ, start_response):
+        start_response('200 OK', [('Content-Type', content_type), ('ETag', '"abc"')] + list(extraheaders))
+        return iter(chunks)
+    return app
+
+
+def run(app, acceptencoding='gzip'):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = status
+        started['headers'] = dict(headers)
+
+    body = b''.join(app({'REQUEST_METHOD': 'GET', 'HTTP_ACCEPT_ENCODING': acceptencoding}, start_response))
+    return started['headers'], body
+
+
+class CompressionTests(unittest.TestCase):
+
+    def test_choose_encoding(self):
+        with unittest.mock.patch('compresslib.brotli', None):
+            self.assertEqual(compresslib.choose_encoding('gzip, deflate, br'), 'gzip')
+        with unittest.mock.patch('compresslib.brotli', object()):
+            self.assertEqual(compresslib.choose_encoding('gzip, br'), 'br')
+            self.assertEqual(compresslib.choose_encoding('gzip, br;q=0'), 'gzip')
+        self.assertIsNone(compresslib.choose_encoding('identity'))
+        self.assertIsNone(compresslib.choose_encoding(None))
+
+    def test_streamed_page_is_gzipped(self):
+        chunks = [b'<p>a long description</p>' * 50 for _ in range(5)]
+        middleware = compresslib.CompressionMiddleware(make_app(chunks), minsize=100)
+        headers, body = run(middleware)
+
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(headers['ETag'], 'W/"abc"')
+        self.assertEqual(gzip.decompress(body), b''.join(chunks))
+        self.assertEqual(middleware.stats()['compressed'], 1)
+
+    def test_skipped(self):
+        # too small, not text, already compressed, or not asked for
+        for app, acceptencoding in [
+                (make_app([b'<p>hi</p>']), 'gzip'),
+                (make_app([b'\x89PNG' * 100], content_type='image/png'), 'gzip'),
+                (make_app([b'x' * 500], extraheaders=[('Content-Encoding', 'br')]), 'gzip'),
+                (make_app([b'x' * 500]), 'identity')]:
+            headers, body = run(compresslib.CompressionMiddleware(app, minsize=100), acceptencoding)
+            self.assertNotEqual(headers.get('Content-Encoding'), 'gzip')
+            self.assertEqual(headers['ETag'], '"abc"')
+
+    def test_compress_response(self):
+        body = b'{"items": []}' * 200
+        headers, compressed = compresslib.compress_response(
+            'gzip', 200, [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))], body)
+        self.assertEqual(dict(headers)['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', dict(headers))
+        self.assertEqual(gzip.decompress(compressed), body)
+
+
+if __name__ == '__main__':
+    unittest.main()
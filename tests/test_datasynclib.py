@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+"""
+Tests for the manifest based example data sync in datasynclib.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import datasynclib
+
+
+class DataSyncTests(unittest.TestCase):
+    """Checks that only missing / changed files are installed."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'src')
+        self.dst = os.path.join(self.tmpdir, 'dst')
+        os.makedirs(os.path.join(self.src, 'static', 'images'))
+        os.makedirs(os.path.join(self.src, 'instance'))
+        os.makedirs(self.dst)
+        self.write('itemdb.json', 'v1')
+        self.write('problems.log', 'log\n')
+        self.write('static/images/a.jpg', 'jpeg')
+        self.write('instance/fctc.db', 'db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, relpath, data, root=None):
+        with open(os.path.join(root or self.src, relpath), 'w') as f:
+            f.write(data)
+
+    def read(self, relpath):
+        with open(os.path.join(self.dst, relpath)) as f:
+            return f.read()
+
+    def sync(self, **kwargs):
+        return datasynclib.sync_tree(self.src, self.dst,
+                link_prefixes=('static/',),
+                copy_once_prefixes=('instance/',), **kwargs)
+
+    def test_first_sync_installs_everything(self):
+        stats = self.sync()
+        self.assertEqual(stats['copied'] + stats['linked'], 4)
+        self.assertEqual(self.read('itemdb.json'), 'v1')
+        self.assertEqual(self.read('static/images/a.jpg'), 'jpeg')
+
+    def test_second_sync_does_nothing(self):
+        self.sync()
+        stats = self.sync()
+        self.assertEqual(stats['unchanged'], 4)
+        self.assertEqual(stats['copied'] + stats['linked'], 0)
+        self.assertEqual(stats['hashed'], 0)
+
+    def test_changed_source_is_picked_up(self):
+        self.sync()
+        self.write('itemdb.json', 'version 2')
+        stats = self.sync()
+        self.assertEqual(stats['copied'], 1)
+        self.assertEqual(self.read('itemdb.json'), 'version 2')
+
+    def test_local_changes_are_kept(self):
+        self.sync()
+        self.write('problems.log', 'log\nlocal problem\n', root=self.dst)
+        self.write('instance/fctc.db', 'users', root=self.dst)
+        self.sync()
+        self.assertEqual(self.read('problems.log'), 'log\nlocal problem\n')
+
+        # the database is never overwritten, even if upstream changes
+        self.write('instance/fctc.db', 'new upstream db')
+        self.sync()
+        self.assertEqual(self.read('instance/fctc.db'), 'users')
+
+    def test_install_from_before_manifests(self):
+        # What the old .data_copied install left: an itemdb.json copied from
+        # an older source, and a problems.log appended to since
+        self.write('itemdb.json', 'v0', root=self.dst)
+        self.write('problems.log', 'log\nlocal problem\n', root=self.dst)
+        os.utime(os.path.join(self.dst, 'itemdb.json'), ns=(0, 0))
+        os.utime(os.path.join(self.src, 'problems.log'), ns=(0, 0))
+
+        stats = self.sync()
+        self.assertEqual(stats['kept'], 1)
+        self.assertEqual(self.read('itemdb.json'), 'v1')
+        self.assertEqual(self.read('problems.log'), 'log\nlocal problem\n')
+
+        # both are tracked now
+        self.assertEqual(self.sync()['unchanged'], 4)
+        self.write('itemdb.json', 'version 2')
+        self.sync()
+        self.assertEqual(self.read('itemdb.json'), 'version 2')
+
+    def test_skip_prefixes(self):
+        stats = self.sync(skip_prefixes=('static/',))
+        self.assertEqual(stats['skipped'], 1)
+        self.assertFalse(os.path.exists(os.path.join(self.dst, 'static')))
+
+
+if __name__ == '__main__':
+    unittest.main()
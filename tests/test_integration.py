@@ -10,14 +10,25 @@ import unittest
 import tempfile
 import warnings
 import unittest.mock
+import re
+import shutil
+import threading
+import contextlib
+import collections
+
+from sqlalchemy import event
 
 # Add parent directory to path so we can import application modules
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Import application modules
+# Import application modules (testhelpers first, for the database)
+from testhelpers import small_itemdb
+import fctcdb
+import sharedstatelib
 import fromcavestocars
 from fromcavestocars import app, USERDB
 
+
 class FromCavesToCarsIntegrationTests(unittest.TestCase):
     """Integration tests for the From Caves To Cars application."""
 
@@ -26,9 +37,11 @@ class FromCavesToCarsIntegrationTests(unittest.TestCase):
         # Configure app for testing
         app.config['TESTING'] = True
         app.config['WTF_CSRF_ENABLED'] = False  # Disable CSRF protection for testing
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'  # Use in-memory database
         
         self.app = app.test_client()
+
+        # Pages cached by other tests were rendered with other mocks
+        fromcavestocars.PAGECACHE.clear()
         
         # Create application context and database tables
         with app.app_context():
@@ -62,6 +75,22 @@ class FromCavesToCarsIntegrationTests(unittest.TestCase):
             follow_redirects=True
         )
     
+    @contextlib.contextmanager
+    def count_queries(self):
+        """Collects the SQL statements run inside the with block."""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with app.app_context():
+            engine = USERDB.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
     def login_test_user(self, username='testuser', password='password'):
         """Helper method to log in a test user."""
         return self.app.post(
@@ -157,5 +186,321 @@ class FromCavesToCarsIntegrationTests(unittest.TestCase):
             # Additional assertions about page content
             self.assertIn(b'Description of wood', response.data)
 
+            # Moving between items only fetches the part that changes
+            response = self.app.get('/game?fragment=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'Description of wood', response.data)
+            self.assertNotIn(b'<script>', response.data)
+
+    def test_item_bundle(self):
+        """Test the subtree bundle and its ETag."""
+        itemdb = fctcdb.ItemDB()
+        itemdb.version = 'test'
+        itemdb.items['wood'] = fctcdb.GenericItem('wood', user_requested=True,
+            image=[{'link': '/static/images/wood.jpg', 'thumbnailLink': '/static/images/wood_t.jpg'}],
+            steps=[{'step': 'chop', 'description': 'Chop a tree', 'tools': ['axe'], 'raw_materials': ['tree']}])
+        itemdb.items['axe'] = fctcdb.GenericItem('axe', image=[])
+        itemdb.items['tree'] = fctcdb.GenericItem('tree', image=[])
+
+        with unittest.mock.patch('fromcavestocars.ITEMDB', itemdb), \
+             unittest.mock.patch('fromcavestocars.BUNDLECACHE', collections.OrderedDict()):
+            response = self.app.get('/api/bundle/wood')
+            self.assertEqual(response.status_code, 200)
+            bundle = response.get_json()
+            self.assertEqual(sorted(bundle['items']), ['axe', 'tree', 'wood'])
+            self.assertEqual(bundle['items']['wood']['steps'][0]['boxes'], [['tree', 'oval'], ['axe', 'square']])
+            self.assertNotIn('steps', bundle['items']['axe'])
+
+            # the browser's cached copy is still good
+            response = self.app.get('/api/bundle/wood', headers={'If-None-Match': response.headers['ETag']})
+            self.assertEqual(response.status_code, 304)
+
+            # only user requested items have bundles
+            self.assertEqual(self.app.get('/api/bundle/axe').status_code, 404)
+
+    def test_image_picks_only_invalidate_their_items(self):
+        """Test that picking an image on /problem only rebuilds what shows it."""
+        itemdb = small_itemdb('test')
+        itemdb.items['wood'].image = [{'link': f'/{name}.jpg', 'thumbnailLink': f'/{name}_t.jpg'} for name in ('a', 'b')]
+        itemdb.items['stone'] = fctcdb.GenericItem('stone', image=[])
+        tmpdir = tempfile.mkdtemp()
+        try:
+            overlay = fromcavestocars.overlaylib.ImageOverlay(os.path.join(tmpdir, 'overlay.jsonl'), refreshinterval=0)
+            with unittest.mock.patch('fromcavestocars.ITEMDB', itemdb), \
+                 unittest.mock.patch('fromcavestocars.OVERLAY', overlay), \
+                 unittest.mock.patch('fromcavestocars.BUNDLECACHE', collections.OrderedDict()), \
+                 unittest.mock.patch('fromcavestocars.PAGEDATACACHE', fromcavestocars.collections.OrderedDict()), \
+                 app.test_request_context('/'):
+                etag, _ = fromcavestocars._get_bundle('wood')
+                page_data = fromcavestocars._get_page_data('wood', exploration_path='wood')
+
+                overlay.prefer('stone', '/stone.jpg')
+                self.assertEqual(fromcavestocars._get_bundle('wood')[0], etag)
+                self.assertIs(fromcavestocars._get_page_data('wood', exploration_path='wood'), page_data)
+
+                overlay.prefer('wood', '/b.jpg')
+                self.assertNotEqual(fromcavestocars._get_bundle('wood')[0], etag)
+                self.assertIsNot(fromcavestocars._get_page_data('wood', exploration_path='wood'), page_data)
+                self.assertEqual(fromcavestocars.BUNDLECACHE['wood'][3], ('axe', 'tree', 'wood'))
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_drop_batch(self):
+        """Test that batched drops are checked against the signed box map."""
+        self.app.get('/')
+        boxes = [{'id': 0, 'accepts': 'tree'}, {'id': 1, 'accepts': 'axe'}]
+        box_map = fromcavestocars.sign_box_map('wood', boxes)
+
+        response = self.app.post('/drop_batch', json={'box_map': box_map, 'drops': [
+            {'box_id': '0', 'name': 'tree', 'image_url': '/tree.jpg'},
+            {'box_id': '1', 'name': 'tree', 'image_url': '/tree.jpg'},
+        ]})
+        self.assertEqual(response.get_json()['results'], {'0': 'locked', '1': 'rejected'})
+
+        response = self.app.post('/drop_batch', json={'box_map': box_map, 'drops': [
+            {'box_id': '0', 'name': 'tree', 'image_url': '/tree.jpg'},
+        ]})
+        self.assertEqual(response.get_json()['results'], {'0': 'already-filled'})
+
+        # a drop must name the item, and be on one of the page's boxes
+        response = self.app.post('/drop_batch', json={'box_map': box_map, 'drops': [
+            {'box_id': '1', 'image_url': '/axe.jpg'},
+            {'box_id': None},
+            {'box_id': '7', 'name': 'axe', 'image_url': '/axe.jpg'},
+        ]})
+        self.assertEqual(response.get_json()['results'], {'1': 'rejected', 'None': 'rejected', '7': 'rejected'})
+        # and nothing was filled by them
+        response = self.app.post('/drop_batch', json={'box_map': box_map, 'drops': [
+            {'box_id': '1', 'name': 'axe', 'image_url': '/axe.jpg'},
+        ]})
+        self.assertEqual(response.get_json()['results'], {'1': 'locked'})
+
+        # a map that wasn't signed by the server is refused
+        response = self.app.post('/drop_batch', json={'box_map': box_map + 'x', 'drops': []})
+        self.assertEqual(response.status_code, 400)
+
+        # and so is anything that isn't a dict with a map and a list of dicts of drops
+        for body in ([1], "drops", {'box_map': 5}, {'box_map': box_map, 'drops': [1]},
+                     {'box_map': box_map, 'drops': {'0': 'tree'}}):
+            response = self.app.post('/drop_batch', json=body)
+            self.assertEqual((response.status_code, response.get_json()), (400, {'status': 'bad-request'}), body)
+
+    def test_guest_progress_moves_on_login(self):
+        """Test that old item rows migrate, and that logging in moves the
+        guest's items over, dropping duplicates."""
+        with app.test_request_context('/'):
+            user = fromcavestocars.User(username='mover')
+            USERDB.session.add(user)
+            USERDB.session.commit()
+            # An old database, with known items by name
+            USERDB.session.add_all([
+                fromcavestocars.Item(name='wood', user_id=user.id),
+                fromcavestocars.Item(name='wood', user_id=user.id),
+                fromcavestocars.Item(name='wood', guest_id='g1'),
+                fromcavestocars.Item(name='stone', guest_id='g1'),
+            ])
+            USERDB.session.commit()
+            self.assertEqual(fromcavestocars.migrate_item_rows(), 4)
+            self.assertEqual(fromcavestocars.migrate_item_rows(), 0)
+            self.assertEqual(fromcavestocars.KnownItem.query.count(), 3)
+
+            fromcavestocars.session['guest_id'] = 'g1'
+            with unittest.mock.patch('fromcavestocars.USERSTATE', sharedstatelib.UserStateStore()) as userstate:
+                userstate.set_item('g1', 'wood', {'1': 'x'})
+                userstate.set_item(user.id, 'wood', {'2': 'y'})
+                moved = fromcavestocars.finalize_login(user)
+                self.assertEqual(userstate.fills(user.id, 'wood'), {'1': 'x', '2': 'y'})
+                self.assertNotIn('g1', userstate)
+
+            self.assertEqual(moved, {'rows_moved': 1, 'duplicates_deleted': 1})
+            names = sorted(fromcavestocars.ITEMIDS.names[row.item_id] for row in user.known_items)
+            self.assertEqual(names, ['stone', 'wood'])
+            self.assertEqual(fromcavestocars.KnownItem.query.filter_by(owner='guest:g1').count(), 0)
+
+    def test_query_counts(self):
+        """Test that a request looks the user and their known items up once."""
+        itemdb = small_itemdb('querycount')
+
+        self.register_test_user()
+        with unittest.mock.patch('fromcavestocars.ITEMDB', itemdb):
+            with app.app_context():
+                fromcavestocars._ensure_item_ids(itemdb.items)
+
+            # (url, most statements it may run): the user, their bitset and,
+            # the first time on /game, saving what they learned.
+            for url, most in [('/home', 2), ('/choose', 2), ('/credits', 1),
+                              ('/game?item_name=wood', 4), ('/game?item_name=wood', 2)]:
+                with self.count_queries() as statements:
+                    response = self.app.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertLessEqual(len(statements), most, f"{url}: {statements}")
+
+    def test_threaded_stress(self):
+        """Test many threads playing at once, while /problem picks images."""
+        tmpdir = tempfile.mkdtemp()
+        itemdb = small_itemdb('stress')
+        itemdb.items['wood'].image = [{'link': f'/wood{n}.jpg', 'thumbnailLink': f'/wood{n}_t.jpg'} for n in range(2)]
+        overlay = fromcavestocars.overlaylib.ImageOverlay(os.path.join(tmpdir, 'overlay.jsonl'))
+        suggestions = sharedstatelib.QueuedWriter(os.path.join(tmpdir, 'suggestions.log'))
+        threads, rounds = 8, 5
+        errors = []
+
+        def play(n):
+            client = app.test_client()
+            try:
+                for _ in range(rounds):
+                    for url in ('/home', '/choose', '/game?item_name=wood'):
+                        response = client.get(url)
+                        self.assertEqual(response.status_code, 200, url)
+                    box_map = re.search(r'data-box-map="([^"]+)"', response.get_data(as_text=True)).group(1)
+                    boxes = fromcavestocars.BOXMAPSERIALIZER.loads(box_map)['boxes']
+                    drops = [{'box_id': box_id, 'name': name, 'image_url': '/x.jpg'} for box_id, name in boxes.items()]
+                    response = client.post('/drop_batch', json={'box_map': box_map, 'drops': drops})
+                    self.assertEqual(set(response.get_json()['results'].values()) - {'locked', 'already-filled'}, set())
+                    response = client.post('/suggestion', data={'suggestion_text': f'thread {n}'})
+                    self.assertEqual(response.status_code, 200)
+            except Exception as e:
+                errors.append(e)
+
+        def swap_images():
+            try:
+                for _ in range(rounds * 2):
+                    fromcavestocars.prefer_item_image('wood', 1)
+            except Exception as e:
+                errors.append(e)
+
+        try:
+            with unittest.mock.patch('fromcavestocars.ITEMDB', itemdb), \
+                 unittest.mock.patch('fromcavestocars.OVERLAY', overlay), \
+                 unittest.mock.patch('fromcavestocars.SUGGESTIONLOG', suggestions), \
+                 unittest.mock.patch('fromcavestocars.RATELIMITER', fromcavestocars.ratelimitlib.RateLimiter(
+                     fromcavestocars.ratelimitlib.MemoryStore(), {})), \
+                 unittest.mock.patch('fromcavestocars.USERSTATE', sharedstatelib.UserStateStore()):
+                workers = [threading.Thread(target=play, args=(n,)) for n in range(threads)]
+                workers.append(threading.Thread(target=swap_images))
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+
+            self.assertEqual(errors, [])
+            # ITEMDB itself is never changed, only the overlay
+            self.assertEqual(itemdb.items['wood'].image[0]['link'], '/wood0.jpg')
+            self.assertEqual(len(overlay.preferences()), 1)
+            suggestions.close()
+            with open(suggestions.filename) as f:
+                self.assertEqual(len(f.readlines()), threads * rounds)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_problem_reports(self):
+        """Test that problem reports are counted and listed for admins."""
+        tmpdir = tempfile.mkdtemp()
+        reports = fromcavestocars.problemreportlib.ProblemReports(
+            fromcavestocars.problemreportlib.ProblemCounts(os.path.join(tmpdir, 'counts.db')), flushinterval=60)
+        form = {'selected_image_id': '', 'item_name': 'wood', 'description_accurate': 'no',
+                'correct_item': 'no', 'good_image': 'yes', 'referrer': '/home'}
+        try:
+            with unittest.mock.patch('fromcavestocars.PROBLEMREPORTS', reports), \
+                 unittest.mock.patch('fromcavestocars.ADMINTOKEN', 'secret'), \
+                 unittest.mock.patch('fromcavestocars.LOGFILE') as logfile:
+                self.assertEqual(self.app.post('/problem', data=form).status_code, 302)
+                reports.flush()
+                self.app.post('/problem', data=dict(form, correct_item='yes', item_name='axe'))
+                self.assertIn('"category": "DESC_INACCURATE"', logfile.write.call_args_list[0].args[0])
+
+                self.assertEqual(self.app.get('/admin/problems').status_code, 403)
+                response = self.app.get('/admin/problems', headers={'Authorization': 'Bearer secret'})
+                self.assertEqual([(entry['item'], entry['total']) for entry in response.get_json()['items']],
+                                 [('wood', 2), ('axe', 1)])
+                response = self.app.get('/admin/problems?category=ITEM_INACCURATE', headers={'Authorization': 'Bearer secret'})
+                self.assertEqual([entry['item'] for entry in response.get_json()['items']], ['wood'])
+            reports.close()
+            self.assertEqual(fromcavestocars.problemreportlib.items_to_regenerate(reports.counts.filename, mincount=2), ['wood'])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_rate_limit(self):
+        """Test that too many suggestions in a row get a 429."""
+        limiter = fromcavestocars.ratelimitlib.RateLimiter(
+            fromcavestocars.ratelimitlib.MemoryStore(), {'suggestion': (0.01, 2)})
+        with unittest.mock.patch('fromcavestocars.RATELIMITER', limiter), \
+             unittest.mock.patch('fromcavestocars.SUGGESTIONLOG'):
+            codes = [self.app.post('/suggestion', data={'suggestion_text': 'x'}).status_code for _ in range(3)]
+            self.assertEqual(codes, [200, 200, 429])
+            response = self.app.post('/suggestion', data={'suggestion_text': 'x'})
+            self.assertEqual(response.headers['Retry-After'], '100')
+
+            # Two guests behind the same proxy address, but from different
+            # clients, don't drain each other's buckets
+            limiter = fromcavestocars.ratelimitlib.RateLimiter(
+                fromcavestocars.ratelimitlib.MemoryStore(), {'suggestion': (0.01, 2)})
+            with unittest.mock.patch('fromcavestocars.RATELIMITER', limiter):
+                for address in ['10.0.0.1', '10.0.0.2']:
+                    client = fromcavestocars.app.test_client()
+                    codes = [client.post('/suggestion', data={'suggestion_text': 'x'},
+                                         headers={'X-Forwarded-For': address}).status_code for _ in range(3)]
+                    self.assertEqual(codes, [200, 200, 429])
+
+            # Not sending the session cookie back gets a new guest bucket every
+            # time, but there's still the one for the address
+            limiter = fromcavestocars.ratelimitlib.RateLimiter(
+                fromcavestocars.ratelimitlib.MemoryStore(), {'suggestion': (0.01, 2)}, sharedfactor=2)
+            with unittest.mock.patch('fromcavestocars.RATELIMITER', limiter):
+                client = fromcavestocars.app.test_client(use_cookies=False)
+                codes = [client.post('/suggestion', data={'suggestion_text': 'x'}).status_code for _ in range(5)]
+                self.assertEqual(codes, [200, 200, 200, 200, 429])
+
+    def test_page_cache(self):
+        """Test that catalog pages come from the cache, with their personal parts filled in."""
+        with unittest.mock.patch.dict('fromcavestocars.PAGECACHESTATS', {'hits': 0, 'misses': 0}):
+            response = self.app.get('/credits')
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+
+            response = self.app.get('/credits', headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(fromcavestocars.PAGECACHESTATS, {'hits': 1, 'misses': 1})
+
+            with unittest.mock.patch('fromcavestocars._choose_progress', return_value={'wood': 3}):
+                response = self.app.get('/choose')
+                self.assertIn(b'you know: 3', response.data)
+                self.assertNotIn(b'<!--personal:', response.data)
+            with unittest.mock.patch('fromcavestocars._choose_progress', return_value={'wood': 4}):
+                second = self.app.get('/choose', headers={'If-None-Match': response.headers['ETag']})
+                self.assertEqual(second.status_code, 200)
+                self.assertIn(b'you know: 4', second.data)
+            self.assertEqual(fromcavestocars.PAGECACHESTATS, {'hits': 2, 'misses': 2})
+
+    def test_readiness(self):
+        """Test that /readyz waits for every component and /healthz doesn't."""
+        with unittest.mock.patch.dict('fromcavestocars.READINESS_STATE', {}, clear=True):
+            self.assertEqual(self.app.get('/healthz').status_code, 200)
+            self.assertEqual(self.app.get('/readyz').status_code, 503)
+
+            with fromcavestocars.readiness_component('item_graph'), fromcavestocars.readiness_component('stats'):
+                pass
+            with unittest.mock.patch('fromcavestocars.READINESS', None):
+                fromcavestocars.warmup_page_data()
+            fromcavestocars.warmup_database()
+            self.assertEqual(self.app.get('/readyz').status_code, 503)
+
+            # Compiled templates go in a temporary directory, not instance/
+            tmpdir = tempfile.mkdtemp()
+            try:
+                with unittest.mock.patch('fromcavestocars.POSSIBLEITEMSTATS', {}), \
+                     unittest.mock.patch('fromcavestocars.TEMPLATECACHEDIR', tmpdir), \
+                     unittest.mock.patch.object(app.jinja_env, 'bytecode_cache', None):
+                    fromcavestocars.warmup_templates()
+                    self.assertNotEqual(os.listdir(tmpdir), [])
+            finally:
+                shutil.rmtree(tmpdir)
+
+            response = self.app.get('/readyz')
+            self.assertEqual(response.status_code, 200)
+            components = response.get_json()['components']
+            self.assertIn('choose.html', components['templates']['rendered'])
+            self.assertIn('seconds', components['database'])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+Tests for the populator's job queue.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import jobqueuelib
+
+
+class JobQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'queue.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_items_are_done_when_what_they_need_is(self):
+        queue = jobqueuelib.JobQueue(self.filename)
+        queue.add('cart', agerestriction='3500 BCE', userrequested=True)
+        queue.add('cart')     # already queued
+
+        [cart] = queue.claim()
+        self.assertEqual((cart.item, cart.agerestriction, cart.depth), ('cart', '3500 BCE', 0))
+        self.assertEqual(queue.claim(), [])
+        self.assertEqual(queue.finish('cart', [('wheel', '3500 BCE'), ('axe', '8000 BCE')]), [])
+
+        # the next level, in order
+        self.assertEqual([(job.item, job.depth) for job in queue.claim()], [('axe', 1), ('wheel', 1)])
+        self.assertEqual(queue.finish('wheel', [('axe', None)]), [])
+        self.assertEqual(queue.finish('axe', []), ['axe', 'wheel', 'cart'])
+        self.assertEqual(queue.counts()['done'], 3)
+
+        # starting it over
+        queue.add('cart', again=True)
+        self.assertEqual([job.item for job in queue.claim()], ['cart'])
+        self.assertEqual(queue.finish('cart', []), ['cart'])
+
+    def test_failures_and_restarts(self):
+        queue = jobqueuelib.JobQueue(self.filename, maxattempts=2)
+        queue.add('cart')
+        queue.add('axe')
+        queue.claim()
+        self.assertEqual(queue.fail('cart', 'timed out'), 'pending')
+        self.assertEqual(queue.get('cart').lasterror, 'timed out')
+        queue.claim(limit=1)
+        self.assertEqual(queue.fail('cart', 'timed out again'), 'failed')
+
+        # The populator was killed while it was working on axe
+        queue.close()
+        queue = jobqueuelib.JobQueue(self.filename, maxattempts=2)
+        self.assertEqual(queue.counts(), {'pending': 0, 'running': 1, 'waiting': 0, 'done': 0, 'failed': 1})
+        self.assertEqual(queue.requeue_running(), 1)
+        self.assertEqual(queue.get('axe').attempts, 0)
+        self.assertEqual([job.item for job in queue.claim()], ['axe'])
+
+        self.assertEqual(queue.retry_failed(), 1)
+        self.assertEqual(queue.items('pending'), ['cart'])
+
+
+if __name__ == '__main__':
+    unittest.main()
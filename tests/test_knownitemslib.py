@@ -0,0 +1,60 @@
+#!/usr/bin/python3
+"""
+Tests for the known item bitsets.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fctcdb
+import knownitemslib
+
+
+def make_itemdb():
+    itemdb = fctcdb.ItemDB()
+    itemdb.items['axe'] = fctcdb.GenericItem('axe', steps=[
+        {'step': 'make', 'description': '', 'tools': ['rock'], 'raw_materials': ['stick', 'handle']}])
+    itemdb.items['handle'] = fctcdb.GenericItem('handle', steps=[
+        {'step': 'carve', 'description': '', 'tools': ['rock'], 'raw_materials': ['wood']}])
+    for name in ('rock', 'stick', 'wood'):
+        itemdb.items[name] = fctcdb.GenericItem(name)
+    return itemdb
+
+
+class KnownItemsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.itemdb = make_itemdb()
+        self.ids = knownitemslib.ItemIds()
+        for itemid, name in enumerate(sorted(self.itemdb.items)):
+            self.ids.add(name, itemid + 1)
+
+    def test_membership_and_names(self):
+        bits = self.ids.mask(['rock', 'wood', 'not an item'])
+        self.assertTrue(self.ids.knows(bits, 'rock'))
+        self.assertFalse(self.ids.knows(bits, 'axe'))
+        self.assertFalse(self.ids.knows(bits, 'not an item'))
+        self.assertEqual(self.ids.to_names(bits), {'rock', 'wood'})
+
+    def test_blob_round_trip(self):
+        bits = self.ids.mask(['axe', 'wood'])
+        self.assertEqual(knownitemslib.from_blob(knownitemslib.to_blob(bits)), bits)
+        self.assertEqual(knownitemslib.from_blob(b''), 0)
+
+    def test_union_and_subtree_progress(self):
+        userbits = self.ids.mask(['rock'])
+        guestbits = self.ids.mask(['stick', 'wood'])
+        merged = userbits | guestbits
+        self.assertEqual(self.ids.to_names(merged), {'rock', 'stick', 'wood'})
+
+        self.assertEqual(knownitemslib.subtree_names(self.itemdb, 'axe'),
+                         {'rock', 'stick', 'handle', 'wood'})
+        self.assertEqual(self.ids.subtree_progress(self.itemdb, merged, 'axe'), (3, 4))
+        self.assertEqual(self.ids.subtree_progress(self.itemdb, merged, 'handle'), (2, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+"""
+Tests for the overlay of /problem image corrections.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fctcdb
+import overlaylib
+
+
+def images(*names):
+    return [{'link': f'/{name}.jpg', 'thumbnailLink': f'/{name}_t.jpg'} for name in names]
+
+
+class ImageOverlayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'overlay.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_workers_share_corrections(self):
+        mine = overlaylib.ImageOverlay(self.filename)
+        theirs = overlaylib.ImageOverlay(self.filename, refreshinterval=0)
+        woodimages = images('a', 'b', 'c')
+        before = theirs.version
+
+        mine.prefer('wood', '/c.jpg')
+        mine.prefer('wood', '/b.jpg')    # the last one wins
+        # A line another worker is half way through writing is skipped
+        with open(self.filename, 'a') as f:
+            f.write('{"item": "stone"')
+
+        self.assertEqual([image['link'] for image in theirs.apply('wood', woodimages)], ['/a.jpg', '/b.jpg', '/c.jpg'])
+        self.assertNotEqual(theirs.version, before)
+        self.assertEqual([image['link'] for image in theirs.apply('wood', woodimages)], ['/b.jpg', '/a.jpg', '/c.jpg'])
+        self.assertEqual(theirs.preferences(), {'wood': '/b.jpg'})
+        # the item's own list isn't changed
+        self.assertEqual(woodimages[0]['link'], '/a.jpg')
+        # nor are items (or images) it doesn't know about
+        self.assertIs(theirs.apply('stone', woodimages), woodimages)
+
+    def test_fold(self):
+        dbfile = os.path.join(self.tmpdir, 'itemdb.json')
+        itemdb = fctcdb.ItemDB(dbfile, create_if_needed=True)
+        itemdb.items['wood'] = fctcdb.GenericItem('wood', image=images('a', 'b'))
+        itemdb.save()
+
+        reader = overlaylib.ImageOverlay(self.filename, refreshinterval=0)
+        reader.prefer('wood', '/b.jpg')
+        reader.prefer('gone', '/x.jpg')
+        version = reader.version
+
+        self.assertEqual(overlaylib.fold_overlay(dbfile, self.filename), 1)
+        self.assertFalse(os.path.exists(self.filename))
+        self.assertEqual(fctcdb.ItemDB(dbfile).items['wood'].image[0]['link'], '/b.jpg')
+
+        # Workers start over when the overlay does
+        self.assertNotEqual(reader.version, version)
+        self.assertEqual(reader.preferences(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
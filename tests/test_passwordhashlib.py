@@ -0,0 +1,59 @@
+#!/usr/bin/python3
+"""
+Tests for the bounded password hashing pool.
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from werkzeug.security import generate_password_hash
+
+import passwordhashlib
+
+
+class HashPoolTests(unittest.TestCase):
+
+    def test_hashes_are_compatible(self):
+        pool = passwordhashlib.HashPool(workers=1, maxqueue=1)
+        pwhash = pool.hash('secret')
+        self.assertTrue(pwhash.startswith('pbkdf2:sha256'))
+        self.assertTrue(pool.check(pwhash, 'secret'))
+        self.assertFalse(pool.check(pwhash, 'wrong'))
+
+        # hashes made the old way (inline) still check
+        oldhash = generate_password_hash('secret', method='pbkdf2:sha256', salt_length=16)
+        self.assertTrue(pool.check(oldhash, 'secret'))
+        self.assertEqual(pool.stats()['completed'], 4)
+
+    def test_full_pool_is_rejected(self):
+        pool = passwordhashlib.HashPool(workers=1, maxqueue=0)
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow():
+            started.set()
+            release.wait()
+
+        t = threading.Thread(target=pool.run, args=(slow,))
+        t.start()
+        started.wait()
+        try:
+            with self.assertRaises(passwordhashlib.HashPoolBusy):
+                pool.run(lambda: None)
+            self.assertEqual(pool.stats()['pending'], 1)
+        finally:
+            release.set()
+            t.join()
+
+        stats = pool.stats()
+        self.assertEqual(stats['rejected'], 1)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(pool.run(lambda: 'ok'), 'ok')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,261 @@
+#!/usr/bin/python3
+"""
+Tests for the populator (a wave at a time, from its job queue), with a fake
+LLM.
+"""
+
+import os
+import re
+import json
+import sys
+import random
+import shutil
+import asyncio
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fctcdb
+import describelib
+import openaiquerylib
+import problemreportlib
+import populator
+
+# item -> [(step, tools, raw materials)]
+RECIPES = {
+    'cart': [('cut planks', ['axe', 'saw'], ['log']), ('join planks', ['hammer'], ['peg', 'plank'])],
+    'axe': [('knap blade', ['hammerstone'], ['flint']), ('haft blade', [], ['stick', 'sinew'])],
+    'saw': [('knap teeth', ['hammerstone'], ['flint'])],
+    'hammer': [('lash head', [], ['stone', 'stick', 'sinew'])],
+    'plank': [('split log', ['axe'], ['log'])],
+}
+NATURAL = {'log', 'flint', 'stick', 'sinew', 'stone', 'hammerstone', 'peg'}
+
+
+class FakeLLM(openaiquerylib.OpenAIQuery):
+    """Answers from RECIPES, after a random delay."""
+
+    def __init__(self, cachefile, seed):
+        super().__init__(cachefile)
+        self.random = random.Random(seed)
+        self.running = 0
+        self.mostrunning = 0
+        self.queries = 0
+        # Stop dead (like kill -9) at this query
+        self.crashat = None
+        # Fail this many of the "are they natural" queries
+        self.outages = 0
+
+    def answer(self, query):
+        if match := re.search(r'make or acquire a primitive "(.+?)"', query):
+            return "\n".join(f"{n}. {step}" for n, (step, _, _) in enumerate(RECIPES[match.group(1)], 1))
+        if match := re.search(r'For the step "(.+?)" needed to make "(.+?)"', query):
+            return "\n".join(dict((step, tools) for step, tools, _ in RECIPES[match.group(2)])[match.group(1)])
+        if match := re.search(r'with step "(.+?)" needed to make "(.+?)"', query):
+            return "\n".join(dict((step, raw) for step, _, raw in RECIPES[match.group(2)])[match.group(1)])
+        for question, answer in ((populator.NATURALQUERY[0], NATURAL.__contains__),
+                                 (populator.PARTOFLARGERQUERY[0], lambda item: False)):
+            if question in query:
+                items = re.findall(r'"(.+?)"', query.split(question, 1)[1])
+                return "\n".join(f'"{item}" {answer(item)}' for item in items)
+        if query.startswith('Roughly what year'):
+            return "4000 BCE"
+        if query.startswith('Please provide a description'):
+            return "It is what it is."
+        # Which known tool is this the same as?   None of them.
+        return ""
+
+    def do_query(self, querystring, optionalprefix=''):
+        return self.answer(optionalprefix + querystring)
+
+    async def do_query_async(self, querystring, optionalprefix='', limiter=None):
+        self.queries += 1
+        if self.queries == self.crashat:
+            raise SystemExit("killed")
+        if self.outages and populator.NATURALQUERY[0] in optionalprefix + querystring:
+            self.outages -= 1
+            raise RuntimeError("the LLM is down")
+        await limiter.acquire(10)
+        self.running += 1
+        self.mostrunning = max(self.mostrunning, self.running)
+        try:
+            await asyncio.sleep(self.random.random() / 200)
+        finally:
+            self.running -= 1
+            limiter.release(10, 12)
+        return self.answer(optionalprefix + querystring)
+
+
+class PopulateTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.saved = {name: getattr(populator, name) for name in
+                      ('ITEMDB', 'OAIQ', 'DESCRIBER', 'TOOLDICT', 'KNOWNTOOLS', 'TOOLFILENAME',
+                       'CONCURRENCY', 'PRIMITIVE_AGE_FOR_ALL', 'LOGLEVEL', 'JOBQUEUEFILE', 'JOBQUEUE', 'WAVERETRYSECONDS')}
+
+    def tearDown(self):
+        if populator.JOBQUEUE is not None:
+            populator.JOBQUEUE.close()
+        for name, value in self.saved.items():
+            setattr(populator, name, value)
+        shutil.rmtree(self.tmpdir)
+
+    def start(self, seed):
+        """Point the populator at an empty directory."""
+        rundir = os.path.join(self.tmpdir, str(seed))
+        os.mkdir(rundir)
+        populator.ITEMDB = fctcdb.ItemDB(os.path.join(rundir, 'itemdb.json'), create_if_needed=True)
+        populator.OAIQ = FakeLLM(os.path.join(rundir, 'cache.json'), seed)
+        populator.DESCRIBER = describelib.Describer(populator.ITEMDB, populator.OAIQ)
+        populator.TOOLDICT = {}
+        populator.KNOWNTOOLS = set()
+        populator.TOOLFILENAME = os.path.join(rundir, 'tooldict.json')
+        populator.CONCURRENCY = 3
+        populator.PRIMITIVE_AGE_FOR_ALL = True
+        populator.LOGLEVEL = -1
+        populator.JOBQUEUEFILE = os.path.join(rundir, 'queue.db')
+        populator.JOBQUEUE = None
+        populator.WAVERETRYSECONDS = 0
+        return rundir
+
+    def restart(self, rundir, seed):
+        """Load everything from rundir again, like a new populator.py would."""
+        populator.JOBQUEUE.close()
+        populator.JOBQUEUE = None
+        populator.ITEMDB = fctcdb.ItemDB(os.path.join(rundir, 'itemdb.json'))
+        populator.OAIQ = FakeLLM(os.path.join(rundir, 'cache.json'), seed)
+        populator.DESCRIBER = describelib.Describer(populator.ITEMDB, populator.OAIQ)
+        with open(populator.TOOLFILENAME) as f:
+            tooldata = json.load(f)
+        populator.TOOLDICT = tooldata['TOOLDICT']
+        populator.KNOWNTOOLS = set(tooldata['KNOWNTOOLS'])
+
+    def output(self):
+        """itemdb.json and tooldict.json"""
+        with open(populator.ITEMDB.dbfile, 'rb') as f, open(populator.TOOLFILENAME, 'rb') as g:
+            return f.read(), g.read()
+
+    def populate(self, seed):
+        """Populate a cart from scratch."""
+        self.start(seed)
+        populator.query_how_to_make_items(['cart'], userrequested=True)
+        self.assertLessEqual(populator.OAIQ.mostrunning, 3)
+        return self.output()
+
+    def test_populate_is_deterministic(self):
+        first = self.populate(1)
+        self.assertEqual(self.populate(2), first)
+
+        itemdb = populator.ITEMDB
+        self.assertEqual(itemdb.filter_items(lambda item: item.status != "Complete"), [])
+        self.assertEqual([step['tools'] for step in itemdb.items['cart'].steps], [['axe', 'saw'], ['hammer']])
+        self.assertEqual(itemdb.items['plank'].steps[0]['raw_materials'], ['log'])
+        self.assertTrue(itemdb.items['cart'].user_requested)
+        self.assertFalse(itemdb.items['plank'].user_requested)
+        self.assertTrue(itemdb.items['hammerstone'].is_tool)
+        self.assertEqual(itemdb.items['flint'].description, "It is what it is.")
+        self.assertEqual(itemdb.items['saw'].steps[0]['description'], "It is what it is.")
+        self.assertEqual(populator.JOBQUEUE.counts()['done'], len(RECIPES))
+
+    def test_outages_dont_count_against_items(self):
+        expected = self.populate(1)
+
+        # Every item's first wave fails, which would have used up all their
+        # attempts if it counted
+        self.start(2)
+        populator.OAIQ.outages = 2
+        populator.query_how_to_make_items(['cart'], userrequested=True)
+        self.assertEqual(populator.OAIQ.outages, 0)
+        self.assertEqual(self.output(), expected)
+        self.assertEqual(populator.JOBQUEUE.get('cart').attempts, 0)
+
+        # But it gives up if it keeps happening
+        self.start(3)
+        populator.OAIQ.outages = populator.MAXWAVEFAILURES
+        with self.assertRaises(RuntimeError):
+            populator.query_how_to_make_items(['cart'], userrequested=True)
+        job = populator.JOBQUEUE.get('cart')
+        self.assertEqual((job.state, job.attempts), ('pending', 0))
+
+    def test_regenerate_problem_items(self):
+        self.populate(1)
+        problemsdb = os.path.join(self.tmpdir, 'problems.db')
+        counts = problemreportlib.ProblemCounts(problemsdb)
+        counts.add({('saw', 'DESC_INACCURATE'): 3, ('saw', 'IMAGE_INACCURATE'): 3, ('axe', 'ITEM_INACCURATE'): 3})
+        # axe is already being worked on
+        populator.JOBQUEUE.add('axe', again=True)
+
+        populator.regenerate_problem_items(problemsdb, mincount=3)
+        self.assertEqual(populator.ITEMDB.items['saw'].status, "Complete")
+        # that doesn't fix the image, and axe wasn't regenerated
+        self.assertEqual(counts.counts(), {('saw', 'IMAGE_INACCURATE'): 3, ('axe', 'ITEM_INACCURATE'): 3})
+
+    def test_killed_populator_carries_on(self):
+        expected = self.populate(1)
+        queries = populator.OAIQ.queries
+
+        rundir = self.start(2)
+        populator.OAIQ.crashat = queries // 2
+        with self.assertRaises(SystemExit):
+            populator.query_how_to_make_items(['cart'], userrequested=True)
+        self.assertNotEqual(populator.JOBQUEUE.counts()['running'], 0)
+
+        self.restart(rundir, 2)
+        self.assertGreater(populator.resume_job_queue(), 0)
+        populator.run_job_queue()
+        self.assertEqual(self.output(), expected)
+        self.assertEqual(populator.JOBQUEUE.items('pending', 'running', 'waiting', 'failed'), [])
+        # it didn't start over
+        self.assertLess(populator.OAIQ.queries, queries)
+
+
+class QueryLimiterTests(unittest.TestCase):
+
+    def test_tokens_per_minute(self):
+        now = [0.0]
+        limiter = openaiquerylib.QueryLimiter(concurrency=2, tokensperminute=600, clock=lambda: now[0])
+        slept = []
+
+        async def fake_sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        async def run():
+            await limiter.acquire(500)
+            # it used more than it guessed, so the bucket is in debt
+            limiter.release(500, 700)
+            await limiter.acquire(200)
+            limiter.release(200, 200)
+
+        original = asyncio.sleep
+        asyncio.sleep = fake_sleep
+        try:
+            asyncio.run(run())
+        finally:
+            asyncio.sleep = original
+        # 600 a minute is 10 a second: -100 tokens has to get back to 200
+        self.assertAlmostEqual(sum(slept), 30.0)
+        self.assertEqual((limiter.queries, limiter.tokensused), (2, 900))
+
+    def test_cancelled_while_waiting_for_tokens(self):
+        limiter = openaiquerylib.QueryLimiter(concurrency=1, tokensperminute=60, clock=lambda: 0.0)
+
+        async def run():
+            await limiter.acquire(60)
+            limiter.release(60, 60)
+            # the bucket is empty, so this waits (for a minute)
+            waiting = asyncio.ensure_future(limiter.acquire(60))
+            await asyncio.sleep(0)
+            waiting.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await waiting
+            # and it gave its slot back
+            self.assertFalse(limiter._semaphore.locked())
+
+        asyncio.run(run())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+"""
+Tests for the problem report counters.
+"""
+
+import os
+import sys
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import problemreportlib
+
+
+class ProblemReportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'counts.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_workers_add_up(self):
+        workers = [problemreportlib.ProblemReports(problemreportlib.ProblemCounts(self.filename), flushinterval=60)
+                   for _ in range(2)]
+        workers[0].record('wood', ['DESC_INACCURATE', 'IMAGE_INACCURATE'])
+        workers[1].record('wood', ['DESC_INACCURATE'])
+        events = workers[1].record('axe', ['ITEM_INACCURATE'], owner='user:1', now=5.0)
+        self.assertEqual(events, [{'time': 5.0, 'item': 'axe', 'category': 'ITEM_INACCURATE', 'owner': 'user:1'}])
+        with self.assertRaises(ValueError):
+            workers[0].record('wood', ['TOO_SHINY'])
+
+        # Only what's flushed is shared
+        workers[0].flush()
+        self.assertEqual([entry['item'] for entry in workers[0].top()], ['wood'])
+        self.assertEqual(workers[1].top()[0], {'item': 'wood', 'total': 3,
+            'categories': {'DESC_INACCURATE': 2, 'IMAGE_INACCURATE': 1}})
+
+        for worker in workers:
+            worker.close()
+        self.assertEqual([(entry['item'], entry['total']) for entry in workers[0].top(category='ITEM_INACCURATE')], [('axe', 1)])
+        self.assertEqual(problemreportlib.items_to_regenerate(self.filename), ['wood', 'axe'])
+
+        counts = problemreportlib.ProblemCounts(self.filename)
+        counts.clear(['wood'], problemreportlib.REGENERATECATEGORIES)
+        self.assertEqual(problemreportlib.items_to_regenerate(self.filename), ['axe'])
+        self.assertEqual(counts.counts(), {('wood', 'IMAGE_INACCURATE'): 1, ('axe', 'ITEM_INACCURATE'): 1})
+        counts.clear(['axe'])
+        self.assertEqual(problemreportlib.items_to_regenerate(self.filename), [])
+
+    def test_failed_flush_is_kept(self):
+        class Locked:
+            def add(self, counts):
+                raise sqlite3.OperationalError("database is locked")
+
+        reports = problemreportlib.ProblemReports(Locked(), flushinterval=60)
+        reports.record('wood', ['DESC_INACCURATE'])
+        with self.assertRaises(sqlite3.OperationalError):
+            reports.flush()
+        self.assertEqual(reports.stats()['pending'], 1)
+        reports.counts = problemreportlib.ProblemCounts(self.filename)
+        reports.close()
+        self.assertEqual(reports.stats(), {'recorded': 1, 'pending': 0, 'flushes': 1, 'failedflushes': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+"""
+Tests for the single writer queue for user progress.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+from sqlalchemy import text
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import progresswriterlib
+
+
+class WriteQueueTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.engine = progresswriterlib.create_writer_engine(f"sqlite:///{self.tmpdir}/test.db")
+        with self.engine.begin() as connection:
+            connection.execute(text("CREATE TABLE known (owner TEXT, item INTEGER, PRIMARY KEY (owner, item))"))
+        self.writer = progresswriterlib.WriteQueue(self.engine, coalesce=0.05)
+
+    def tearDown(self):
+        self.engine.dispose()
+        shutil.rmtree(self.tmpdir)
+
+    def insert(self, item):
+        def write(connection):
+            connection.execute(text("INSERT INTO known VALUES ('user:1', :item)"), {'item': item})
+            return item
+        return write
+
+    def count(self):
+        with self.engine.connect() as connection:
+            return connection.execute(text("SELECT COUNT(*) FROM known")).scalar()
+
+    def test_wal(self):
+        with self.engine.connect() as connection:
+            self.assertEqual(connection.exec_driver_sql("PRAGMA journal_mode").scalar(), 'wal')
+
+    def test_writes_are_coalesced(self):
+        futures = [self.writer.submit(self.insert(i)) for i in range(20)]
+        self.assertEqual([future.result(timeout=5) for future in futures], list(range(20)))
+        self.assertEqual(self.count(), 20)
+
+        stats = self.writer.stats()
+        self.assertEqual(stats['writes'], 20)
+        self.assertLess(stats['batches'], 20)
+        self.assertEqual(stats['queuedepth'], 0)
+
+    def test_bad_write_does_not_lose_the_others(self):
+        futures = [self.writer.submit(self.insert(1)),
+                   self.writer.submit(self.insert(1)),    # the same row again
+                   self.writer.submit(self.insert(2))]
+        self.assertEqual(futures[0].result(timeout=5), 1)
+        with self.assertRaises(Exception):
+            futures[1].result(timeout=5)
+        self.assertEqual(futures[2].result(timeout=5), 2)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(self.writer.stats()['failed'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+"""
+Tests for the token bucket rate limiter.
+"""
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import ratelimitlib
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class RateLimiterTests(unittest.TestCase):
+
+    def check_buckets(self, makestore):
+        clock = FakeClock()
+        limiter = ratelimitlib.RateLimiter(makestore(), {'drop': (2, 3)}, clock=clock)
+
+        # a burst of 3, then nothing until it refills
+        self.assertEqual([limiter.check('drop', 'a')[0] for _ in range(4)], [True, True, True, False])
+        self.assertAlmostEqual(limiter.check('drop', 'a')[1], 0.5)
+        # other clients and other routes aren't affected
+        self.assertTrue(limiter.check('drop', 'b')[0])
+        self.assertTrue(limiter.check('home', 'a')[0])
+
+        clock.now += 0.5
+        self.assertEqual([limiter.check('drop', 'a')[0] for _ in range(2)], [True, False])
+
+        self.assertEqual(limiter.stats()['drop'], {'allowed': 5, 'limited': 3, 'rate': 2, 'burst': 3})
+        return limiter
+
+    def test_memory_store(self):
+        self.check_buckets(ratelimitlib.MemoryStore)
+
+    def test_sqlite_store_is_shared(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, 'buckets.db')
+            limiter = self.check_buckets(lambda: ratelimitlib.SQLiteStore(filename))
+
+            # another worker sees the same (empty) bucket
+            other = ratelimitlib.RateLimiter(ratelimitlib.SQLiteStore(filename), {'drop': (2, 3)}, clock=limiter.clock)
+            self.assertFalse(other.check('drop', 'a')[0])
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_full_buckets_are_forgotten(self):
+        clock = FakeClock()
+        store = ratelimitlib.MemoryStore()
+        limiter = ratelimitlib.RateLimiter(store, {'drop': (2, 3)}, clock=clock, pruneinterval=10)
+        for client in ('a', 'b'):
+            limiter.check('drop', client)
+        clock.now += 5
+        limiter.check('drop', 'c')
+        self.assertEqual(len(store._buckets), 3)
+
+        # a and b were full again 1.5 seconds after they were used
+        clock.now += 5
+        limiter.check('drop', 'c')
+        self.assertEqual(list(store._buckets), ['drop|c'])
+
+
+if __name__ == '__main__':
+    unittest.main()
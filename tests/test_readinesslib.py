@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+"""
+Tests for the "what can I make next" readiness index.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import fctcdb
+import knownitemslib
+import readinesslib
+
+
+def make_itemdb():
+    itemdb = fctcdb.ItemDB()
+    itemdb.items['axe'] = fctcdb.GenericItem('axe', user_requested=True, steps=[
+        {'step': 'make', 'description': '', 'tools': ['rock'], 'raw_materials': ['stick', 'handle']}])
+    itemdb.items['handle'] = fctcdb.GenericItem('handle', steps=[
+        {'step': 'carve', 'description': '', 'tools': ['rock'], 'raw_materials': ['wood']}])
+    for name in ('rock', 'stick', 'wood'):
+        itemdb.items[name] = fctcdb.GenericItem(name)
+    return itemdb
+
+
+class ReadinessTests(unittest.TestCase):
+
+    def setUp(self):
+        self.itemdb = make_itemdb()
+        self.ids = knownitemslib.ItemIds()
+        for itemid, name in enumerate(sorted(self.itemdb.items)):
+            self.ids.add(name, itemid)
+        self.index = readinesslib.ReadinessIndex(self.itemdb)
+
+    def test_index(self):
+        self.assertEqual(self.index.inputs['axe'], {'rock', 'stick', 'handle'})
+        self.assertEqual(sorted(self.index.usedby['rock']), ['axe', 'handle'])
+        self.assertEqual(self.index.paths['handle'], 'axe/handle')
+
+    def test_ranking_is_incremental(self):
+        bits = self.ids.mask(['rock'])
+        ranked = self.index.ranked('guest:1', bits, self.ids)
+        self.assertEqual([r['name'] for r in ranked], ['handle'])
+        self.assertEqual(ranked[0]['missing'], ['wood'])
+
+        bits |= self.ids.mask(['wood', 'stick'])
+        self.index.learned('guest:1', bits, self.ids)
+        ranked = self.index.ranked('guest:1', bits, self.ids)
+        self.assertEqual([(r['name'], r['known'], r['needed']) for r in ranked],
+                         [('handle', 2, 2), ('axe', 2, 3)])
+
+        # once handle is known it drops out and axe is ready
+        bits |= self.ids.mask(['handle'])
+        ranked = self.index.ranked('guest:1', bits, self.ids)
+        self.assertEqual([(r['name'], r['missing']) for r in ranked], [('axe', [])])
+
+    def test_forgetting_starts_over(self):
+        self.index.ranked('guest:1', self.ids.mask(['rock', 'wood']), self.ids)
+        ranked = self.index.ranked('guest:1', self.ids.mask(['stick']), self.ids, minfraction=0.0)
+        self.assertEqual([(r['name'], r['known']) for r in ranked], [('axe', 1)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""
+Tests for the startup tracer and its budget check.
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import startuplib
+
+IMPORTTIME_OUTPUT = """import time: self [us] | cumulative | imported package
+import time:       465 |     176545 |   flask
+import time:       207 |     127075 |   flask_dance.contrib.google
+import time:     30129 |     688521 | fromcavestocars
+"""
+
+
+class StartupTracerTests(unittest.TestCase):
+
+    def test_phase_records_timing(self):
+        before = len(startuplib.PHASES)
+        with startuplib.phase("test phase"):
+            pass
+        self.assertEqual(len(startuplib.PHASES), before + 1)
+        self.assertEqual(startuplib.PHASES[-1]['name'], "test phase")
+        self.assertGreaterEqual(startuplib.PHASES[-1]['seconds'], 0.0)
+        self.assertIn("test phase", startuplib.report())
+
+    def test_parse_importtime(self):
+        imports = startuplib.parse_importtime(IMPORTTIME_OUTPUT)
+        self.assertEqual(len(imports), 3)
+        self.assertAlmostEqual(imports['flask']['cumulative'], 0.176545)
+        self.assertAlmostEqual(imports['fromcavestocars']['self'], 0.030129)
+
+    def test_check_budgets(self):
+        phases = [{'name': 'load_itemdb', 'start': 0.0, 'seconds': 0.4},
+                  {'name': 'create_all', 'start': 0.4, 'seconds': 0.1}]
+        totals = startuplib.phase_totals(phases)
+        imports = startuplib.parse_importtime(IMPORTTIME_OUTPUT)
+
+        budgets = {'total': 1.0, 'phases': {'load_itemdb': 0.5}, 'imports': {'flask': 0.5}}
+        self.assertEqual(startuplib.check_budgets(budgets, totals, imports, total=0.5), [])
+
+        budgets = {'total': 0.2, 'phases': {'load_itemdb': 0.1}, 'imports': {'fromcavestocars': 0.5}}
+        failures = startuplib.check_budgets(budgets, totals, imports, total=0.5)
+        self.assertEqual(len(failures), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+"""
+Things the tests of the Flask / ASGI app share.   Import this before
+fromcavestocars: it points the app's user database at a temporary file, so
+create_all() / drop_all() in the tests never touch instance/fctc.db.
+"""
+
+import os
+import sys
+import atexit
+import shutil
+import tempfile
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+DBDIR = tempfile.mkdtemp(prefix='fctc-tests-')
+atexit.register(shutil.rmtree, DBDIR, ignore_errors=True)
+os.environ['FCTC_DATABASE_URI'] = 'sqlite:///' + os.path.join(DBDIR, 'fctc.db')
+
+import fctcdb
+
+
+def small_itemdb(version):
+    """wood, made by chopping a tree with an axe."""
+    itemdb = fctcdb.ItemDB()
+    itemdb.version = version
+    image = [{'link': '/static/images/wood.jpg', 'thumbnailLink': '/static/images/wood_t.jpg'}]
+    itemdb.items['wood'] = fctcdb.GenericItem('wood', user_requested=True, image=image * 2,
+        steps=[{'step': 'chop', 'description': 'Chop a tree', 'tools': ['axe'], 'raw_materials': ['tree']}])
+    itemdb.items['axe'] = fctcdb.GenericItem('axe', image=image)
+    itemdb.items['tree'] = fctcdb.GenericItem('tree', image=image)
+    return itemdb